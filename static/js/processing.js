@@ -1,6 +1,13 @@
 const videoPlayer = document.getElementById('videoPlayer');
 const detectionOverlay = document.getElementById('detectionOverlay');
 const ctx = detectionOverlay.getContext('2d');
+// Preview frames are painted on their own canvas under the detection
+// overlay, so clearing the boxes doesn't blank the frame
+const previewCanvas = document.createElement('canvas');
+previewCanvas.id = 'previewCanvas';
+previewCanvas.className = 'absolute top-0 left-0 w-full h-full pointer-events-none';
+detectionOverlay.parentNode.insertBefore(previewCanvas, detectionOverlay);
+const previewCtx = previewCanvas.getContext('2d');
 const progressBar = document.getElementById('progressBar');
 const progressPercentage = document.getElementById('progressPercentage');
 const processingLog = document.getElementById('processingLog');
@@ -18,6 +25,8 @@ let frameCount = 0;
 let lastFrameTime = 0;
 let totalDetections = 0;
 let processedFrames = 0;
+// Detections on the overlay by track id; the server only sends changes
+const trackedDetections = new Map();
 
 const vehicleStyles = {
     car: {
@@ -53,8 +62,8 @@ window.addEventListener('resize', resizeCanvas);
 
 function resizeCanvas() {
     if (videoPlayer && detectionOverlay) {
-        detectionOverlay.width = videoPlayer.clientWidth;
-        detectionOverlay.height = videoPlayer.clientHeight;
+        detectionOverlay.width = previewCanvas.width = videoPlayer.clientWidth;
+        detectionOverlay.height = previewCanvas.height = videoPlayer.clientHeight;
     }
 }
 
@@ -97,15 +106,25 @@ function setupWebSocket() {
 
     function connect() {
         socket = new WebSocket(wsUrl);
+        // Preview frames arrive as binary messages
+        socket.binaryType = 'arraybuffer';
 
         socket.onopen = () => {
             console.log('WebSocket connected');
             reconnectAttempts = 0;
             addLogMessage('Connected to processing server');
+            // Boxes for the overlay are only sent on request, as changes
+            // to the tracks, so start over from the next full set
+            trackedDetections.clear();
+            socket.send(JSON.stringify({ action: 'subscribe_detections' }));
             loadingOverlay.classList.remove('hidden');
         };
 
         socket.onmessage = (event) => {
+            if (event.data instanceof ArrayBuffer) {
+                handleFrame(event.data);
+                return;
+            }
             const data = JSON.parse(event.data);
             handleWebSocketMessage(data);
         };
@@ -141,10 +160,25 @@ function handleWebSocketMessage(data) {
         case 'processing_update':
             updateProgress(data.progress);
             updateStats(data.counts);
-            if (data.detections) {
-                drawDetections(data.detections);
-                updateDetectionRate(data.detections.length);
+            break;
+
+        case 'status_update':
+            // Last published state, sent when connecting
+            if (data.status.type === 'processing_status') {
+                updateProgress(data.status.progress);
+            } else {
+                handleWebSocketMessage(data.status);
+            }
+            break;
+
+        case 'processing_detections':
+            if (data.reset) {
+                trackedDetections.clear();
             }
+            data.removed.forEach(trackId => trackedDetections.delete(trackId));
+            data.detections.forEach(detection => trackedDetections.set(detection.track_id, detection));
+            drawDetections(Array.from(trackedDetections.values()));
+            updateDetectionRate(trackedDetections.size);
             break;
             
         case 'processing_complete':
@@ -163,6 +197,24 @@ function handleWebSocketMessage(data) {
     }
 }
 
+// Binary frame: 4 byte big-endian header length, JSON header, JPEG bytes
+function handleFrame(buffer) {
+    const headerLength = new DataView(buffer).getUint32(0);
+    const header = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 4, headerLength)));
+    const jpeg = new Blob([new Uint8Array(buffer, 4 + headerLength)], { type: 'image/jpeg' });
+
+    createImageBitmap(jpeg).then(bitmap => {
+        previewCtx.drawImage(bitmap, 0, 0, previewCanvas.width, previewCanvas.height);
+        bitmap.close();
+    }).finally(() => {
+        // The server only sends more frames once earlier ones are acked
+        if (socket && socket.readyState === WebSocket.OPEN) {
+            socket.send(JSON.stringify({ action: 'frame_ack', seq: header.seq }));
+        }
+    });
+    updateStats(header.vehicle_counts);
+}
+
 function updateProgress(progress) {
     const percentage = Math.round(progress * 100);
     progressBar.style.width = `${percentage}%`;
@@ -218,13 +270,14 @@ function drawDetections(detections) {
     const scaleY = detectionOverlay.height / videoPlayer.videoHeight;
     
     detections.forEach(detection => {
-        const style = vehicleStyles[detection.vehicle_type];
+        const style = vehicleStyles[detection.type];
         if (!style) return;
         
-        const x = detection.bbox_x1 * scaleX;
-        const y = detection.bbox_y1 * scaleY;
-        const width = (detection.bbox_x2 - detection.bbox_x1) * scaleX;
-        const height = (detection.bbox_y2 - detection.bbox_y1) * scaleY;
+        const [x1, y1, x2, y2] = detection.bbox;
+        const x = x1 * scaleX;
+        const y = y1 * scaleY;
+        const width = (x2 - x1) * scaleX;
+        const height = (y2 - y1) * scaleY;
         
         ctx.strokeStyle = style.color;
         ctx.lineWidth = 2;
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import VideoAnalysis, VehicleCount, DetectionZone
+from .models import VideoAnalysis, VehicleCount, DetectionZone, ProcessingJob, LiveTrafficRollup
 
 @admin.register(VideoAnalysis)
 class VideoAnalysisAdmin(admin.ModelAdmin):
@@ -8,9 +8,22 @@ class VideoAnalysisAdmin(admin.ModelAdmin):
 
 @admin.register(VehicleCount)
 class VehicleCountAdmin(admin.ModelAdmin):
-    list_display = ('id', 'vehicle_type', 'frame_number', 'confidence', 'speed')
+    list_display = ('id', 'vehicle_type', 'track_id', 'frame_number', 'last_frame', 'hits', 'confidence', 'speed')
     list_filter = ('vehicle_type',)
 
 @admin.register(DetectionZone)
 class DetectionZoneAdmin(admin.ModelAdmin):
     list_display = ['id']
+
+
+@admin.register(ProcessingJob)
+class ProcessingJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'analysis', 'status', 'priority', 'attempts', 'worker_id', 'created_at', 'claimed_at')
+    list_filter = ('status',)
+
+
+@admin.register(LiveTrafficRollup)
+class LiveTrafficRollupAdmin(admin.ModelAdmin):
+    list_display = ('camera', 'bucket_start', 'frames', 'bicycle_count', 'car_count', 'truck_count',
+                    'bus_count', 'motorcycle_count', 'avg_occupancy', 'congestion_ratio')
+    list_filter = ('camera',)
@@ -1,6 +1,11 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class TrafficAnalyzerConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'traffic_analyzer'
+
+    def ready(self):
+        from .db import configure_sqlite
+        connection_created.connect(configure_sqlite, dispatch_uid='traffic_analyzer_sqlite_pragmas')
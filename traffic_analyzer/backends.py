@@ -0,0 +1,192 @@
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+# Inference runtimes. Exported models are loaded through ultralytics as
+# well, so every backend returns the same Results objects and the rest of
+# the pipeline doesn't care which one ran.
+BACKENDS = ('pytorch', 'onnx', 'openvino')
+MODEL_SIZES = ('n', 's', 'm', 'l', 'x')
+
+
+def default_options():
+    return {
+        'backend': getattr(settings, 'INFERENCE_BACKEND', 'pytorch'),
+        'model_size': getattr(settings, 'INFERENCE_MODEL_SIZE', 'n'),
+        'imgsz': getattr(settings, 'INFERENCE_IMGSZ', 640),
+        'int8': getattr(settings, 'INFERENCE_INT8', False),
+    }
+
+
+def weights_path(model_size=None):
+    """PyTorch weights of a YOLOv8 size; ultralytics downloads them on first use."""
+    model_size = model_size or default_options()['model_size']
+    if model_size not in MODEL_SIZES:
+        raise ImproperlyConfigured(f"Unknown model size '{model_size}', expected one of {', '.join(MODEL_SIZES)}")
+    return f'yolov8{model_size}.pt'
+
+
+def _export_dir():
+    return Path(getattr(settings, 'INFERENCE_EXPORT_DIR', Path(settings.BASE_DIR) / 'exported_models'))
+
+
+def model_path(backend=None, model_size=None, imgsz=None, int8=None):
+    """Where the model for a backend lives; exported models are per image size and precision."""
+    options = default_options()
+    backend = backend or options['backend']
+    imgsz = imgsz or options['imgsz']
+    int8 = options['int8'] if int8 is None else int8
+    if backend not in BACKENDS:
+        raise ImproperlyConfigured(f"Unknown inference backend '{backend}', expected one of {', '.join(BACKENDS)}")
+    weights = weights_path(model_size)
+    if backend == 'pytorch':
+        return weights
+
+    name = f"{Path(weights).stem}_{imgsz}{'_int8' if int8 else ''}"
+    if backend == 'onnx':
+        return str(_export_dir() / f'{name}.onnx')
+    return str(_export_dir() / f'{name}_openvino_model')
+
+
+def check_exported(path):
+    if not os.path.exists(path):
+        raise ImproperlyConfigured(
+            f"Exported model {path} not found. Create it with 'python manage.py export_model'."
+        )
+
+
+def letterbox(frame, imgsz):
+    """Resize and pad a BGR frame to the square network input the way ultralytics does."""
+    import cv2
+
+    height, width = frame.shape[:2]
+    scale = min(imgsz / height, imgsz / width)
+    resized = cv2.resize(frame, (int(round(width * scale)), int(round(height * scale))), interpolation=cv2.INTER_LINEAR)
+    canvas = np.full((imgsz, imgsz, 3), 114, dtype=np.uint8)
+    top = (imgsz - resized.shape[0]) // 2
+    left = (imgsz - resized.shape[1]) // 2
+    canvas[top:top + resized.shape[0], left:left + resized.shape[1]] = resized
+    return canvas
+
+
+def _onnx_input(frame, imgsz):
+    image = letterbox(frame, imgsz)[:, :, ::-1].transpose(2, 0, 1)  # BGR HWC -> RGB CHW
+    return np.ascontiguousarray(image, dtype=np.float32)[None] / 255.0
+
+
+def _quantize_onnx(fp32_path, int8_path, frames, imgsz):
+    """Static INT8 quantization of an ONNX model, calibrated on our own frames."""
+    import onnxruntime
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+
+    input_name = onnxruntime.InferenceSession(fp32_path, providers=['CPUExecutionProvider']).get_inputs()[0].name
+
+    class FrameReader(CalibrationDataReader):
+        def __init__(self):
+            self.inputs = iter(frames)
+
+        def get_next(self):
+            frame = next(self.inputs, None)
+            return None if frame is None else {input_name: _onnx_input(frame, imgsz)}
+
+    quantize_static(
+        fp32_path, int8_path, FrameReader(),
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        per_channel=True
+    )
+
+
+def _calibration_dataset(frames, names, directory):
+    """Write frames as a one-split YOLO dataset, which the OpenVINO INT8 export calibrates on."""
+    import cv2
+
+    images = Path(directory) / 'images'
+    images.mkdir(parents=True)
+    for i, frame in enumerate(frames):
+        cv2.imwrite(str(images / f'{i:05d}.jpg'), frame)
+    lines = [f'path: {directory}', 'train: images', 'val: images', 'names:']
+    lines += [f'  {cls}: {name}' for cls, name in sorted(names.items())]
+    yaml_path = Path(directory) / 'calibration.yaml'
+    yaml_path.write_text('\n'.join(lines) + '\n')
+    return str(yaml_path)
+
+
+def export_model(backend, model_size=None, imgsz=None, int8=False, calibration_frames=None):
+    """
+    Export the PyTorch weights to backend and return the exported path.
+
+    INT8 models are calibrated on ``calibration_frames``, a list of BGR
+    frames from our own cameras, so the quantization ranges match what the
+    model sees in production.
+    """
+    from ultralytics import YOLO
+
+    imgsz = imgsz or default_options()['imgsz']
+    if backend == 'pytorch':
+        raise ImproperlyConfigured('The pytorch backend uses the weights directly, there is nothing to export')
+    if int8 and not calibration_frames:
+        raise ImproperlyConfigured('INT8 export needs calibration frames')
+
+    target = model_path(backend, model_size, imgsz, int8)
+    _export_dir().mkdir(parents=True, exist_ok=True)
+    model = YOLO(weights_path(model_size))
+
+    with tempfile.TemporaryDirectory() as workdir:
+        if backend == 'onnx':
+            exported = model.export(format='onnx', imgsz=imgsz, simplify=True)
+            if int8:
+                fp32_path = exported
+                exported = os.path.join(workdir, 'model_int8.onnx')
+                _quantize_onnx(fp32_path, exported, calibration_frames, imgsz)
+                os.remove(fp32_path)
+        else:
+            data = _calibration_dataset(calibration_frames, model.names, workdir) if int8 else None
+            exported = model.export(format='openvino', imgsz=imgsz, int8=int8, data=data)
+
+        if os.path.isdir(target):
+            shutil.rmtree(target)
+        elif os.path.exists(target):
+            os.remove(target)
+        shutil.move(str(exported), target)
+    return target
+
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.webm')
+
+
+def sample_calibration_frames(paths, count):
+    """
+    Up to count frames spread evenly over the videos at paths (files or
+    directories), enhanced the same way as VideoProcessor._enhance.
+    """
+    import cv2
+
+    videos = []
+    for path in paths:
+        path = Path(path)
+        if path.is_dir():
+            videos += sorted(p for p in path.rglob('*') if p.suffix.lower() in VIDEO_EXTENSIONS)
+        else:
+            videos.append(path)
+    if not videos:
+        return []
+
+    frames = []
+    per_video = max(1, count // len(videos))
+    for video in videos:
+        cap = cv2.VideoCapture(str(video))
+        total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        for index in np.linspace(0, max(0, total - 1), num=per_video, dtype=int):
+            cap.set(cv2.CAP_PROP_POS_FRAMES, int(index))
+            ret, frame = cap.read()
+            if ret:
+                frames.append(cv2.convertScaleAbs(frame, alpha=1.3, beta=10))
+        cap.release()
+    return frames[:count]
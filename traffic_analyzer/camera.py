@@ -0,0 +1,558 @@
+import asyncio
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from .detection import detect_vehicles_batch, to_detections
+from .model_registry import get_model
+from .motion import MotionGate
+from .qos import QualityController
+from .rollups import LiveRollupAggregator
+from .tracking import IoUTracker
+
+logger = logging.getLogger(__name__)
+
+LIVE_VEHICLE_TYPES = ('bicycle', 'car', 'truck', 'bus', 'motorcycle')
+LIVE_ERROR_BACKOFF_MAX = 30
+
+
+class FrameGrabber:
+    """
+    Reads a capture on its own thread and keeps only the newest frame.
+
+    Inference is slower than most cameras; reading frames only when the
+    model is free lets OpenCV's buffer fill up and the feed drift behind
+    real time. Grabbing continuously and dropping all but the latest frame
+    keeps it current. Video files are read at their own frame rate and,
+    with ``loop``, start over at the end, standing in for a live camera.
+
+    The grabber owns the capture and releases it when its thread exits;
+    releasing it from another thread while ``read()`` blocks can crash
+    the backend.
+    """
+
+    def __init__(self, video, realtime=False, loop=False, on_frame=None):
+        self.video = video
+        self.loop = loop
+        self.on_frame = on_frame
+        self.condition = threading.Condition()
+        self.frame = None
+        self.captured_at = None
+        self.index = 0
+        self.running = True
+        self.ended = False
+        fps = video.get(cv2.CAP_PROP_FPS) if realtime else 0
+        self.interval = 1 / fps if fps and fps > 0 else 0
+        self.thread = threading.Thread(target=self._run, name='camera-grabber', daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        try:
+            self._read_frames()
+        finally:
+            if self.video.isOpened():
+                self.video.release()
+
+    def _read_frames(self):
+        next_read = time.monotonic()
+        while self.running:
+            success, frame = self.video.read()
+            if not success:
+                if self.interval and self.loop:
+                    self.video.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                    continue
+                if self.interval:
+                    # End of a video file
+                    with self.condition:
+                        self.ended = True
+                        self.condition.notify_all()
+                    return
+                time.sleep(0.05)
+                continue
+            with self.condition:
+                self.frame = frame
+                self.captured_at = time.monotonic()
+                self.index += 1
+                self.condition.notify_all()
+            if self.on_frame is not None:
+                self.on_frame()
+            if self.interval:
+                next_read += self.interval
+                time.sleep(max(0, next_read - time.monotonic()))
+
+    def latest(self, after=0, timeout=None):
+        """
+        The newest frame as ``(index, frame, captured_at)`` once there is one
+        newer than index ``after``, or None on timeout or at the end of a file.
+        """
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.index > after or self.ended, timeout):
+                return None
+            if self.index <= after:
+                return None
+            return self.index, self.frame, self.captured_at
+
+    def stop(self, timeout=1.0):
+        """
+        Stop reading. Returns False if the thread is still blocked in a read
+        after ``timeout``; it releases the capture once the read returns.
+        """
+        self.running = False
+        if self.thread.is_alive() and self.thread is not threading.current_thread():
+            self.thread.join(timeout=timeout)
+            return not self.thread.is_alive()
+        return True
+
+
+class Subscription:
+    """
+    A viewer of a CameraStream. Sync viewers (MJPEG responses) call
+    ``wait()``, async ones (WebSocket consumers) await ``next()``. Both
+    return the latest frame as ``(jpeg, stats)``; frames published while the
+    viewer was busy are skipped. Once the stream is closed, e.g. because the
+    camera was unregistered, ``closed`` is set and both return None.
+    """
+
+    def __init__(self, stream, loop=None):
+        self.stream = stream
+        self.loop = loop
+        self.event = asyncio.Event() if loop is not None else None
+        self.sequence = 0
+        self.closed = False
+
+    def wait(self, timeout=None):
+        """The next frame, or None if none was published within timeout."""
+        with self.stream.condition:
+            if not self.stream.condition.wait_for(
+                    lambda: self.closed or self.stream.sequence != self.sequence, timeout):
+                return None
+            if self.closed:
+                return None
+            self.sequence = self.stream.sequence
+            return self.stream.frame, self.stream.stats
+
+    async def next(self):
+        while True:
+            await self.event.wait()
+            self.event.clear()
+            with self.stream.condition:
+                if self.closed:
+                    return None
+                if self.stream.sequence != self.sequence:
+                    self.sequence = self.stream.sequence
+                    return self.stream.frame, self.stream.stats
+
+    def notify(self):
+        if self.event is not None:
+            self.loop.call_soon_threadsafe(self.event.set)
+
+    def end(self):
+        """Called by the stream when it closes; wakes the viewer."""
+        self.closed = True
+        self.notify()
+
+    def close(self):
+        self.stream.unsubscribe(self)
+
+
+class CameraStream:
+    """
+    One camera source and the viewers of it.
+
+    The capture runs while the stream has subscribers and stops, releasing
+    the device, once the last one has left. Frames are picked up by the
+    CameraManager's inference loop at most ``target_fps`` times a second;
+    each annotated frame is encoded once and the same JPEG bytes go to
+    every subscriber.
+    """
+
+    def __init__(self, name, source, target_fps=None, loop=False, on_frame=None, rollups=None):
+        self.name = name
+        self.source = source
+        self.target_fps = target_fps or getattr(settings, 'LIVE_TARGET_FPS', 15)
+        self.loop = loop
+        self.on_frame = on_frame
+        self.rollups = rollups
+        self.condition = threading.Condition()
+        self.subscribers = set()
+        self.video = None
+        self.grabber = None
+        self.frame = None
+        self.stats = None
+        self.sequence = 0
+        self.reset()
+
+    def reset(self):
+        # Per-capture state, started over each time the capture opens
+        self.motion_gate = MotionGate.from_settings()
+        self.qos = QualityController.from_settings(self.target_fps)
+        self.since_inference = 0
+        self.taken_at = None
+        self.tracker = IoUTracker()
+        self.vehicle_counts = Counter()
+        self.last_detections = []
+        self.last_index = 0
+        self.processed = 0
+        self.skipped = 0
+        self.next_due = 0
+        self.captured_at = None
+        self.last_published = None
+        # Smoothed seconds from capture to encoded JPEG, in inference and
+        # between published frames
+        self.latency = None
+        self.inference_time = None
+        self.frame_interval = None
+
+    @property
+    def is_active(self):
+        return self.grabber is not None
+
+    def subscribe(self, loop=None):
+        subscription = Subscription(self, loop)
+        with self.condition:
+            self.subscribers.add(subscription)
+            if self.grabber is None or self.grabber.ended:
+                self._open()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.condition:
+            self.subscribers.discard(subscription)
+            if not self.subscribers:
+                self._close()
+
+    def _open(self):
+        self._close()
+        self.reset()
+        is_file = isinstance(self.source, str) and os.path.isfile(self.source)
+        self.video = cv2.VideoCapture(self.source)
+        # Devices and streams: don't let OpenCV queue stale frames
+        self.video.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        self.grabber = FrameGrabber(self.video, realtime=is_file, loop=self.loop, on_frame=self.on_frame)
+
+    def _close(self):
+        # The grabber thread releases the capture as it exits
+        if self.grabber is not None:
+            if not self.grabber.stop():
+                logger.warning("Camera '%s' is still blocked reading a frame; "
+                               "its capture will be released when the read returns", self.name)
+            self.grabber = None
+        self.video = None
+
+    def close(self):
+        """Stop the capture and end every subscription."""
+        with self.condition:
+            subscribers = list(self.subscribers)
+            self.subscribers.clear()
+            self._close()
+            for subscription in subscribers:
+                subscription.end()
+            self.condition.notify_all()
+
+    def is_due(self, now):
+        """Whether a new frame is waiting and the stream is due for one."""
+        grabber = self.grabber
+        return grabber is not None and grabber.index > self.last_index and now >= self.next_due
+
+    def take_frame(self, now):
+        grabber = self.grabber
+        latest = grabber.latest(self.last_index, timeout=0) if grabber is not None else None
+        if latest is None:
+            return None
+        index, frame, captured_at = latest
+        self.skipped += index - self.last_index - 1
+        self.last_index = index
+        self.taken_at = now
+        # Stay on the target rate's schedule, without catching up on frames
+        # missed while the inference loop was behind
+        self.next_due = max(self.next_due + 1 / self.target_fps, now)
+        return frame, captured_at
+
+    @property
+    def imgsz(self):
+        # Inference size of the current operating point; None is the model's own
+        return self.qos.point['imgsz'] if self.qos else None
+
+    def needs_inference(self, frame):
+        # Frames between the operating point's stride, and static frames,
+        # reuse the last detections instead of running the model
+        stride = self.qos.point['stride'] if self.qos else 1
+        if self.since_inference + 1 < stride:
+            self.since_inference += 1
+            return False
+        if self.motion_gate is None or self.motion_gate.has_motion(frame):
+            self.since_inference = 0
+            return True
+        return False
+
+    def publish(self, frame, captured_at, detections=None, inference_time=None):
+        """Track, draw and encode one frame and hand it to the subscribers."""
+        if detections is not None:
+            self.last_detections = detections
+            self.inference_time = _smooth(self.inference_time, inference_time)
+        tracked, confirmed, _ = self.tracker.update(self.processed, self.last_detections)
+        self.processed += 1
+        for track in confirmed:
+            self.vehicle_counts[track.vehicle_type] += 1
+        if self.rollups is not None:
+            self.rollups.add(self.name, tracked, confirmed, (frame.shape[1], frame.shape[0]))
+
+        # The grabber keeps its own reference; draw on a copy
+        encode_started = time.monotonic()
+        frame = frame.copy()
+        for detection in tracked:
+            x1, y1, x2, y2 = detection['bbox']
+            cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+            cv2.putText(frame, f"{detection['type']} {detection['confidence']:.2f}",
+                        (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+        quality = self.qos.point['jpeg_quality'] if self.qos else 80
+        ret, jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+
+        now = time.monotonic()
+        self.latency = _smooth(self.latency, now - captured_at)
+        if self.qos is not None:
+            # Late: the frame waited longer than a frame interval to be picked up
+            wait = self.taken_at - captured_at
+            self.qos.record(
+                now - captured_at, late=wait > 1 / self.target_fps,
+                wait=wait, inference=inference_time if detections is not None else None,
+                encode=now - encode_started
+            )
+        if self.last_published is not None:
+            self.frame_interval = _smooth(self.frame_interval, now - self.last_published)
+        self.last_published = now
+        self.captured_at = time.time() - (now - captured_at)
+
+        counts = Counter(detection['type'] for detection in tracked)
+        with self.condition:
+            self.frame = jpeg.tobytes()
+            self.stats = dict({
+                'camera': self.name,
+                'counts': {vehicle_type: counts.get(vehicle_type, 0) for vehicle_type in LIVE_VEHICLE_TYPES},
+                'total_vehicles': sum(counts.values()),
+                'vehicle_counts': {vehicle_type: self.vehicle_counts.get(vehicle_type, 0)
+                                   for vehicle_type in LIVE_VEHICLE_TYPES},
+                'fps': round(1 / self.frame_interval, 1) if self.frame_interval else 0.0,
+                'target_fps': self.target_fps,
+                'viewers': len(self.subscribers),
+            }, **self.latency_stats())
+            if self.qos is not None:
+                self.stats['qos'] = self.qos.describe()
+            self.sequence += 1
+            self.condition.notify_all()
+            subscribers = list(self.subscribers)
+        for subscription in subscribers:
+            subscription.notify()
+
+    def latency_stats(self):
+        """Capture-to-encoded latency and inference time in ms, and frames skipped to stay current."""
+        return {
+            'latency_ms': round(self.latency * 1000, 1) if self.latency is not None else None,
+            'inference_ms': round(self.inference_time * 1000, 1) if self.inference_time is not None else None,
+            'skipped_frames': self.skipped,
+            # Wall clock capture time of the latest frame, for the
+            # client to add its own share of the latency
+            'captured_at': round(self.captured_at * 1000) if self.captured_at else None,
+        }
+
+    def describe(self):
+        return {
+            'name': self.name,
+            'source': self.source,
+            'target_fps': self.target_fps,
+            'loop': self.loop,
+            'active': self.is_active,
+            'stats': self.stats if self.is_active else None,
+        }
+
+
+def _smooth(average, value, weight=0.1):
+    return value if average is None else (1 - weight) * average + weight * value
+
+
+class CameraManager:
+    """
+    The live camera streams of this process and the one inference loop
+    that serves all of them.
+
+    Each round the loop takes the latest frame of every stream that is due
+    under its target fps, most overdue first and at most LIVE_MAX_BATCH of
+    them, and runs a single batched inference call over the frames that
+    moved. When the model can't keep up, every stream falls below its
+    target fps instead of some stalling. Drawing and JPEG encoding run on
+    LIVE_ENCODER_THREADS threads. The loop also writes the per-minute
+    traffic rollups of every camera.
+    """
+
+    def __init__(self, max_batch=None, encoder_threads=None):
+        self.max_batch = max_batch or getattr(settings, 'LIVE_MAX_BATCH', 16)
+        self.encoders = ThreadPoolExecutor(
+            max_workers=encoder_threads or getattr(settings, 'LIVE_ENCODER_THREADS', 2),
+            thread_name_prefix='camera-encoder'
+        )
+        self.rollups = LiveRollupAggregator() if getattr(settings, 'LIVE_ROLLUPS', True) else None
+        self.streams = {}
+        self.condition = threading.Condition()
+        self.thread = None
+        self.running = True
+
+    def configure(self, cameras):
+        """Register cameras from a LIVE_CAMERAS style dict of name -> options."""
+        for name, options in cameras.items():
+            self.register(name, **options)
+
+    def register(self, name, source, target_fps=None, loop=False):
+        if not name:
+            raise ImproperlyConfigured('A camera needs a name')
+        with self.condition:
+            if name in self.streams:
+                raise ImproperlyConfigured(f"Camera '{name}' is already registered")
+            stream = CameraStream(name, source, target_fps, loop, on_frame=self.wake, rollups=self.rollups)
+            self.streams[name] = stream
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='camera-inference', daemon=True)
+                self.thread.start()
+        return stream
+
+    def unregister(self, name):
+        with self.condition:
+            stream = self.streams.pop(name)
+        stream.close()
+        # Write the camera's open minute now; nothing else adds to it
+        if self.rollups is not None:
+            self.rollups.flush(everything=True)
+
+    def shutdown(self):
+        """Stop the inference loop and every capture and write the open rollup minutes, e.g. at exit."""
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(timeout=1.0)
+        for stream in self.all():
+            stream.close()
+        if self.rollups is not None:
+            self.rollups.flush(everything=True)
+
+    def get(self, name):
+        with self.condition:
+            return self.streams[name]
+
+    def all(self):
+        with self.condition:
+            return list(self.streams.values())
+
+    def stats(self):
+        """Latest statistics of every camera with viewers."""
+        return {stream.name: stream.stats for stream in self.all() if stream.is_active and stream.stats}
+
+    def wake(self):
+        with self.condition:
+            self.condition.notify()
+
+    def _next_round(self):
+        # The streams due for a frame now, or how long until one will be
+        now = time.monotonic()
+        active = [stream for stream in self.streams.values() if stream.is_active]
+        due = sorted((stream for stream in active if stream.is_due(now)), key=lambda stream: stream.next_due)
+        if due:
+            return due[:self.max_batch], None
+        waits = [stream.next_due - now for stream in active if stream.next_due > now]
+        return [], min(waits) if waits else None
+
+    def _publish(self, item):
+        stream, frame, captured_at, detections, inference_time = item
+        stream.publish(frame, captured_at, detections, inference_time)
+
+    def _run(self):
+        model = None
+        failures = 0
+        while True:
+            with self.condition:
+                due, wait = self._next_round()
+                if not due:
+                    # The grabbers wake the loop when a frame arrives
+                    self.condition.wait(timeout=wait if wait is not None else 1.0)
+                if not self.running:
+                    return
+
+            try:
+                if self.rollups is not None:
+                    self.rollups.flush_if_due()
+                if not due:
+                    continue
+                if model is None:
+                    model = get_model()
+                now = time.monotonic()
+                taken = []
+                for stream in due:
+                    item = stream.take_frame(now)
+                    if item is not None:
+                        taken.append((stream,) + item)
+                to_infer = [(stream, frame) for stream, frame, _ in taken if stream.needs_inference(frame)]
+
+                # One batched call per inference size the streams' operating points use
+                by_imgsz = {}
+                for stream, frame in to_infer:
+                    by_imgsz.setdefault(stream.imgsz, []).append((stream, frame))
+                detections = {}
+                inference_times = {}
+                for imgsz, batch in by_imgsz.items():
+                    started = time.monotonic()
+                    arrays = detect_vehicles_batch(model, [frame for _, frame in batch], imgsz=imgsz)
+                    elapsed = time.monotonic() - started
+                    for (stream, _), array in zip(batch, arrays):
+                        detections[stream.name] = to_detections(array)
+                        inference_times[stream.name] = elapsed
+
+                list(self.encoders.map(self._publish, [
+                    (stream, frame, captured_at, detections.get(stream.name), inference_times.get(stream.name))
+                    for stream, frame, captured_at in taken
+                ]))
+                failures = 0
+            except Exception:
+                # A broken model or camera fails every round; log the 1st,
+                # 2nd, 4th, 8th... failure in a row and back off up to
+                # LIVE_ERROR_BACKOFF_MAX seconds between rounds
+                failures += 1
+                if failures & (failures - 1) == 0:
+                    logger.exception("Error in live camera inference (%d in a row)", failures)
+                time.sleep(min(2 ** (failures - 1), LIVE_ERROR_BACKOFF_MAX))
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_manager():
+    """The process's camera manager, with LIVE_CAMERAS registered on first use."""
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                manager = CameraManager()
+                manager.configure(getattr(settings, 'LIVE_CAMERAS', {}))
+                atexit.register(manager.shutdown)
+                _manager = manager
+    return _manager
+
+
+def gen(stream):
+    subscription = stream.subscribe()
+    try:
+        while not subscription.closed:
+            frame = subscription.wait(timeout=1.0)
+            if frame is not None:
+                jpeg, _ = frame
+                yield (b'--frame\r\n'
+                       b'Content-Type: image/jpeg\r\n\r\n' + jpeg + b'\r\n\r\n')
+    finally:
+        subscription.close()
@@ -0,0 +1,82 @@
+import math
+import shutil
+import subprocess
+
+import cv2
+from django.conf import settings
+
+
+def keyframe_indices(video_path, fps):
+    """
+    Frame indices of the video's keyframes, read with ffprobe.
+
+    Returns None when ffprobe isn't installed or fails; chunks are then split
+    at evenly spaced frames, which costs a little extra decoding after each
+    seek but is otherwise just as correct.
+    """
+    ffprobe = shutil.which('ffprobe')
+    if ffprobe is None or not fps:
+        return None
+    try:
+        output = subprocess.run(
+            [
+                ffprobe, '-v', 'error', '-select_streams', 'v:0', '-skip_frame', 'nokey',
+                '-show_entries', 'frame=best_effort_timestamp_time', '-of', 'csv=p=0', video_path
+            ],
+            capture_output=True, text=True, timeout=300, check=True
+        ).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+    indices = []
+    for line in output.splitlines():
+        try:
+            indices.append(int(round(float(line.strip().rstrip(',')) * fps)))
+        except ValueError:
+            continue
+    return sorted(set(indices)) or None
+
+
+def plan_chunks(video_path, total_frames, fps, chunk_count=None):
+    """
+    Split a video into consecutive frame ranges (start, end].
+
+    Frame numbers are 1-based like the rest of the processing code, so a
+    chunk (start, end] covers frames start + 1 .. end. Boundaries are moved
+    to the nearest keyframe when the keyframes are known. Returns a single
+    range for videos shorter than VIDEO_CHUNKING_MIN_FRAMES.
+    """
+    min_frames = getattr(settings, 'VIDEO_CHUNKING_MIN_FRAMES', 9000)
+    chunk_count = chunk_count or getattr(settings, 'VIDEO_CHUNK_COUNT', None) or getattr(settings, 'VIDEO_WORKER_PROCESSES', 1)
+    chunk_count = min(chunk_count, max(1, total_frames // max(1, min_frames // 2)))
+    if total_frames < min_frames or chunk_count <= 1:
+        return [(0, total_frames)]
+
+    chunk_size = math.ceil(total_frames / chunk_count)
+    boundaries = [i * chunk_size for i in range(1, chunk_count)]
+
+    keyframes = keyframe_indices(video_path, fps)
+    if keyframes:
+        boundaries = [min(keyframes, key=lambda k: abs(k - boundary)) for boundary in boundaries]
+    boundaries = sorted(b for b in set(boundaries) if 0 < b < total_frames)
+
+    edges = [0] + boundaries + [total_frames]
+    return list(zip(edges[:-1], edges[1:]))
+
+
+def seek_to_frame(cap, frames_done):
+    """
+    Position cap so the next read() returns frame frames_done + 1.
+
+    Some containers seek inexactly with CAP_PROP_POS_FRAMES; in that case
+    rewind and skip forward with grab(), which doesn't decode the frames.
+    """
+    if frames_done <= 0:
+        return
+    cap.set(cv2.CAP_PROP_POS_FRAMES, frames_done)
+    if int(cap.get(cv2.CAP_PROP_POS_FRAMES)) == frames_done:
+        return
+    cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+    for _ in range(frames_done):
+        if not cap.grab():
+            break
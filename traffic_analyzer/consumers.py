@@ -1,21 +1,26 @@
 import json
 import asyncio
 import cv2
-import base64
-import numpy as np
 from channels.generic.websocket import AsyncWebsocketConsumer
-from ultralytics import YOLO
 from asgiref.sync import sync_to_async
-from .models import VideoAnalysis, VehicleCount
-import torch
+from .models import VideoAnalysis
+from .detection import detect_vehicles, to_detections
+from .executor import get_executor
+from .model_registry import get_model
+from .motion import MotionGate
+from .progress import detections_group, last_status, progress_group
+from .qos import QualityController
+from .streaming import LatestFrameSender
+from .tracking import IoUTracker
 import time
 from collections import defaultdict
 from channels.db import database_sync_to_async
+from django.conf import settings
 
 class VideoProcessingConsumer(AsyncWebsocketConsumer):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.model = YOLO('yolov8n.pt')
+        self.model = None
         self.vehicle_classes = {2: 'car', 3: 'motorcycle', 5: 'bus', 7: 'truck'}
         self.is_processing = True
         self.is_paused = False
@@ -24,10 +29,23 @@ class VideoProcessingConsumer(AsyncWebsocketConsumer):
         self.cap = None
         self.processing_task = None
         self.room_group_name = None
+        self.motion_gate = MotionGate.from_settings()
+        self.last_results = []
+        self.video_path = None
+        self.fps = 30
+        self.tracker = IoUTracker()
+        self.vehicle_counts = defaultdict(int)
+        self.sender = None
+        self.qos = None
+        self.since_inference = 0
 
     async def connect(self):
         self.analysis_id = self.scope['url_route']['kwargs']['analysis_id']
-        self.room_group_name = f'processing_{self.analysis_id}'
+        # Shared by all connections; only the first one waits for the load
+        self.model = await sync_to_async(get_model, thread_sensitive=False)()
+        # The processing worker publishes status to this group; every viewer
+        # gets the same messages, whatever the number of viewers
+        self.room_group_name = progress_group(self.analysis_id)
 
         # Join room group
         await self.channel_layer.group_add(
@@ -35,9 +53,9 @@ class VideoProcessingConsumer(AsyncWebsocketConsumer):
             self.channel_name
         )
         await self.accept()
-        
-        # Start processing monitoring
-        asyncio.create_task(self.monitor_processing())
+
+        # Late joiners start from the last published state
+        await self.send_status_update(await self.get_processing_status())
 
         self.processing_task = asyncio.create_task(self.process_video())
 
@@ -47,10 +65,12 @@ class VideoProcessingConsumer(AsyncWebsocketConsumer):
             self.room_group_name,
             self.channel_name
         )
+        await self.channel_layer.group_discard(
+            detections_group(self.analysis_id),
+            self.channel_name
+        )
 
         self.is_processing = False
-        if self.cap and self.cap.isOpened():
-            self.cap.release()
         if self.processing_task:
             self.processing_task.cancel()
             try:
@@ -77,13 +97,28 @@ class VideoProcessingConsumer(AsyncWebsocketConsumer):
                 }))
             elif action == 'restart':
                 if self.cap:
-                    self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-                    self.current_frame = 0
+                    # Queued behind the frame being read, never concurrent with it
+                    await get_executor().run(self.channel_name, self._rewind)
                     self.is_paused = False
                     await self.send(json.dumps({
                         'type': 'status',
                         'message': 'Processing restarted'
                     }))
+            elif action == 'subscribe_detections':
+                # Per-frame detections are only sent to clients that ask
+                await self.channel_layer.group_add(
+                    detections_group(self.analysis_id),
+                    self.channel_name
+                )
+            elif action == 'unsubscribe_detections':
+                await self.channel_layer.group_discard(
+                    detections_group(self.analysis_id),
+                    self.channel_name
+                )
+            elif action == 'frame_ack':
+                # The viewer has shown a preview frame; see LatestFrameSender
+                if self.sender is not None:
+                    self.sender.ack(data.get('seq'))
             elif action == 'request_status':
                 # Send current processing status
                 status = await self.get_processing_status()
@@ -101,26 +136,41 @@ class VideoProcessingConsumer(AsyncWebsocketConsumer):
             }))
 
     async def processing_update(self, event):
-        # Send processing update to WebSocket
+        # Progress, fps and counts as sent by the processing worker
+        await self.send(text_data=json.dumps(event))
+
+    async def processing_complete(self, event):
+        await self.send(text_data=json.dumps(event))
+
+    async def processing_error(self, event):
+        await self.send(text_data=json.dumps(event))
+
+    async def processing_detections(self, event):
         await self.send(text_data=json.dumps({
-            'type': 'progress_update',
-            'overall_progress': event['overall_progress'],
-            'current_stage': event['current_stage'],
-            'stage_progress': event['stage_progress'],
-            'stats': event['stats']
+            'type': 'processing_detections',
+            'progress': event['progress'],
+            'detections': event['detections'],
+            'removed': event['removed'],
+            'reset': event['reset']
         }))
 
+    async def get_processing_status(self):
+        # Published state, kept in memory by this process
+        status = last_status(self.analysis_id)
+        if status is not None:
+            return status
+        return await self.get_saved_status()
+
     @database_sync_to_async
-    def get_processing_status(self):
+    def get_saved_status(self):
+        # Nothing was published since this process started, e.g. the
+        # analysis finished before a restart
         analysis = VideoAnalysis.objects.get(id=self.analysis_id)
         return {
+            'type': 'processing_status',
             'status': analysis.status,
-            'progress': analysis.progress,
-            'frames_processed': analysis.frames_processed,
-            'total_frames': analysis.total_frames,
-            'vehicles_detected': analysis.vehicles_detected,
-            'current_stage': analysis.current_stage,
-            'stage_progress': analysis.stage_progress
+            'progress': analysis.processing_progress,
+            'error_message': analysis.error_message,
         }
 
     async def send_status_update(self, status):
@@ -129,75 +179,11 @@ class VideoProcessingConsumer(AsyncWebsocketConsumer):
             'status': status
         }))
 
-    async def monitor_processing(self):
-        """Monitor processing progress and send updates."""
-        while True:
-            try:
-                status = await self.get_processing_status()
-                
-                # Calculate stage-specific progress
-                stage_info = {
-                    'loading': (1, 0),
-                    'extracting': (2, 25),
-                    'detecting': (3, 50),
-                    'analyzing': (4, 75)
-                }
-                
-                current_stage = status['current_stage']
-                stage_num, base_progress = stage_info.get(current_stage, (1, 0))
-                stage_progress = status['stage_progress']
-                
-                # Calculate overall progress
-                overall_progress = base_progress + (stage_progress * 0.25)
-                
-                # Prepare stats
-                stats = {
-                    'frames_processed': status['frames_processed'],
-                    'total_frames': status['total_frames'],
-                    'vehicles_detected': status['vehicles_detected']
-                }
-                
-                # Send update through channel layer
-                await self.channel_layer.group_send(
-                    self.room_group_name,
-                    {
-                        'type': 'processing_update',
-                        'overall_progress': overall_progress,
-                        'current_stage': stage_num,
-                        'stage_progress': stage_progress,
-                        'stats': stats
-                    }
-                )
-                
-                # Check if processing is complete
-                if status['status'] == 'completed':
-                    break
-                    
-                await asyncio.sleep(1)  # Update every second
-                
-            except Exception as e:
-                print(f"Error in monitor_processing: {e}")
-                await asyncio.sleep(5)  # Wait before retrying
-
     @sync_to_async
     def get_video_path(self):
         analysis = VideoAnalysis.objects.get(id=self.analysis_id)
         return analysis.video.path
 
-    @sync_to_async
-    def save_detection(self, frame_number, detection_data):
-        analysis = VideoAnalysis.objects.get(id=self.analysis_id)
-        VehicleCount.objects.create(
-            analysis=analysis,
-            frame_number=frame_number,
-            vehicle_type=detection_data['type'],
-            confidence=detection_data['confidence'],
-            bbox_x1=detection_data['bbox'][0],
-            bbox_y1=detection_data['bbox'][1],
-            bbox_x2=detection_data['bbox'][2],
-            bbox_y2=detection_data['bbox'][3]
-        )
-
     def calculate_traffic_insights(self, detections, frame_size):
         # Calculate congestion level
         frame_area = frame_size[0] * frame_size[1]
@@ -247,41 +233,201 @@ class VideoProcessingConsumer(AsyncWebsocketConsumer):
             "recommendations": recommendations
         }
 
+    def _open_video(self):
+        self.cap = cv2.VideoCapture(self.video_path)
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 30
+        # The preview plays in real time, so the budget is the video's frame rate
+        self.qos = QualityController.from_settings(self.fps)
+
+    def _rewind(self):
+        self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        self.current_frame = 0
+        self.tracker = IoUTracker()
+        self.vehicle_counts = defaultdict(int)
+        if self.motion_gate is not None:
+            self.motion_gate.reset()
+
+    def _release_video(self):
+        if self.cap is not None and self.cap.isOpened():
+            self.cap.release()
+
+    def _draw_detections(self, frame, detections):
+        for detection in detections:
+            x1, y1, x2, y2 = detection['bbox']
+            cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+            cv2.putText(frame, f"{detection['type']} {detection['confidence']:.2f}",
+                        (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+        return frame
+
+    def _next_frame(self, quality, scale, requested_at):
+        """
+        Read, detect, draw and encode the next frame. Runs on the shared
+        executor, never on the event loop; returns the frame's header and
+        JPEG bytes, or None at the end of the video.
+        """
+        started = time.monotonic()
+        ret, frame = self.cap.read()
+        if not ret:
+            return None
+        decoded = time.monotonic()
+
+        # Run the model on every stride-th frame of the operating point,
+        # unless nothing moved since the last inferred frame
+        point = self.qos.point if self.qos else {'imgsz': None, 'stride': 1, 'jpeg_quality': quality}
+        inference_time = None
+        self.since_inference += 1
+        if self.since_inference >= point['stride'] and (
+                self.motion_gate is None or self.motion_gate.has_motion(frame)):
+            self.since_inference = 0
+            self.last_results = to_detections(detect_vehicles(self.model, frame, imgsz=point['imgsz']))
+            inference_time = time.monotonic() - decoded
+        detections, confirmed, _ = self.tracker.update(self.current_frame, self.last_results)
+        for track in confirmed:
+            self.vehicle_counts[track.vehicle_type] += 1
+
+        frame_draw = self._draw_detections(frame, detections)
+        if scale < 1.0:
+            frame_draw = cv2.resize(frame_draw, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        # The lower of what the viewer's connection and the budget allow
+        quality = min(quality, point['jpeg_quality'])
+        encode_started = time.monotonic()
+        _, buffer = cv2.imencode('.jpg', frame_draw, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        if self.qos is not None:
+            now = time.monotonic()
+            self.qos.record(
+                now - requested_at, late=now - requested_at > 1 / self.fps,
+                wait=started - requested_at, decode=decoded - started,
+                inference=inference_time, encode=now - encode_started
+            )
+        header = {
+            'type': 'frame_update',
+            'detections': detections,
+            'vehicle_counts': dict(self.vehicle_counts),
+            'frame_number': self.current_frame,
+            'timestamp': self.current_frame / self.fps,
+            'motion_skip_ratio': self.motion_gate.skip_ratio if self.motion_gate else 0.0,
+            'stream': dict(self.sender.quality.stats(), dropped=self.sender.dropped, lost=self.sender.lost),
+            'qos': self.qos.describe() if self.qos else None,
+        }
+        self.current_frame += 1
+        return header, buffer.tobytes()
+
+    async def send_frame(self, message):
+        await self.send(bytes_data=message)
+
     async def process_video(self):
+        # Decoding, inference and encoding block, so they run on the shared
+        # executor. It serves connections round-robin and runs one task per
+        # connection at a time, so the event loop stays free for the others.
+        # Frames go out as binary messages through a sender that keeps only
+        # the latest one and waits for the viewer's acks, so a slow viewer
+        # drops frames instead of queueing them.
+        executor = get_executor()
+        loop = asyncio.get_running_loop()
+        self.sender = LatestFrameSender(self.send_frame)
+        self.sender.start()
         try:
-            video = cv2.VideoCapture(self.video_path)
-            while self.is_processing and video.isOpened():
+            self.video_path = await self.get_video_path()
+            await executor.run(self.channel_name, self._open_video)
+            interval = 1 / self.fps
+            while self.is_processing and self.cap.isOpened():
+                started = loop.time()
                 if not self.is_paused:
-                    ret, frame = video.read()
-                    if not ret:
+                    quality = self.sender.quality
+                    frame = await executor.run(
+                        self.channel_name, self._next_frame, quality.quality, quality.scale, time.monotonic()
+                    )
+                    if frame is None:
                         break
+                    self.sender.offer(*frame, interval)
 
-                    # Process frame with YOLO
-                    results = self.model(frame)
-                
-                    # Draw detections and get stats
-                    frame_draw, detections = self.process_detections(results, frame)
-                
-                    # Convert frame to base64
-                    _, buffer = cv2.imencode('.jpg', frame_draw)
-                    frame_base64 = base64.b64encode(buffer).decode('utf-8')
-                
-                    # Send frame and detections to client
-                    await self.send(json.dumps({
-                        'type': 'frame_update',
-                        'frame': frame_base64,
-                        'detections': detections,
-                        'vehicle_counts': self.vehicle_counts,
-                        'frame_number': self.current_frame,
-                        'timestamp': self.current_frame / self.fps
-                    }))
+                # Play back in real time, counting the time the frame took
+                await asyncio.sleep(max(0, interval - (loop.time() - started)))
 
-                    self.current_frame += 1
-                
-                await asyncio.sleep(1/30)  # Limit to 30 FPS
-            
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
             print(f"Error in process_video: {e}")
         finally:
-            if video.isOpened():
-                video.release()
+            await self.sender.stop()
+            # Pending frames are dropped; the release queues behind a frame
+            # still being read, so the capture isn't closed under it
+            executor.discard(self.channel_name)
+            if self.cap is not None:
+                await asyncio.shield(executor.run(self.channel_name, self._release_video))
+
+
+class LiveDetectionConsumer(AsyncWebsocketConsumer):
+    """
+    Live camera statistics, and the annotated frames themselves for clients
+    that send ``{"action": "subscribe_frames"}``. The camera hub is shared
+    with the MJPEG feed, so this adds no capture or inference of its own.
+    """
+
+    subscription = None
+
+    async def connect(self):
+        from .camera import get_manager
+
+        camera = self.scope['url_route']['kwargs'].get('camera', 'default')
+        # Opening a capture (cv2.VideoCapture) can block for seconds on a
+        # slow or dead RTSP source, and closing one joins the grabber thread,
+        # so neither runs on the event loop shared by every WebSocket
+        try:
+            stream = await sync_to_async(lambda: get_manager().get(camera), thread_sensitive=False)()
+        except KeyError:
+            await self.close()
+            return
+        await self.accept()
+        self.send_frames = False
+        self.interval = 1 / getattr(settings, 'LIVE_STATS_RATE', 2)
+        self.subscription = await sync_to_async(stream.subscribe, thread_sensitive=False)(
+            asyncio.get_running_loop()
+        )
+        self.sender = LatestFrameSender(self.send_frame)
+        self.sender.start()
+        self.stream_task = asyncio.create_task(self.stream())
+
+    async def disconnect(self, close_code):
+        if self.subscription is None:
+            return
+        self.stream_task.cancel()
+        try:
+            await self.stream_task
+        except asyncio.CancelledError:
+            pass
+        await self.sender.stop()
+        await sync_to_async(self.subscription.close, thread_sensitive=False)()
+
+    async def receive(self, text_data):
+        try:
+            data = json.loads(text_data)
+        except json.JSONDecodeError:
+            return
+        action = data.get('action')
+        if action == 'frame_ack':
+            self.sender.ack(data.get('seq'))
+        elif action == 'subscribe_frames':
+            self.send_frames = True
+        elif action == 'unsubscribe_frames':
+            self.send_frames = False
+
+    async def send_frame(self, message):
+        await self.send(bytes_data=message)
+
+    async def stream(self):
+        loop = asyncio.get_running_loop()
+        last_stats = 0
+        while True:
+            frame = await self.subscription.next()
+            if frame is None:
+                # The camera was unregistered
+                await self.close()
+                return
+            jpeg, stats = frame
+            if self.send_frames:
+                self.sender.offer(dict(stats, type='frame_update'), jpeg, 1 / max(stats['fps'], 1))
+            now = loop.time()
+            if now - last_stats >= self.interval:
+                last_stats = now
+                await self.send(text_data=json.dumps(stats))
@@ -0,0 +1,23 @@
+from django.conf import settings
+
+# WAL lets results pages read while a video is being written, and NORMAL
+# sync is safe under WAL while avoiding an fsync on every commit. The busy
+# timeout is left to DATABASES['default']['OPTIONS']['timeout'], which
+# sqlite3 applies when it opens the connection.
+DEFAULT_SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'temp_store': 'MEMORY',
+    'cache_size': -20000,
+}
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    """connection_created handler applying SQLITE_PRAGMAS to new SQLite connections."""
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = dict(DEFAULT_SQLITE_PRAGMAS)
+    pragmas.update(getattr(settings, 'SQLITE_PRAGMAS', {}))
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
@@ -0,0 +1,213 @@
+import numpy as np
+from django.conf import settings
+
+# COCO class ids of the vehicle types we count
+VEHICLE_CLASSES = {
+    1: 'bicycle',
+    2: 'car',
+    3: 'motorcycle',
+    5: 'bus',
+    7: 'truck'
+}
+
+# Per-class confidence and NMS IoU thresholds. Bicycles are small and often
+# partially occluded, so they get a much lower confidence threshold and a
+# stricter IoU than the motor vehicles.
+DEFAULT_CLASS_THRESHOLDS = {
+    'bicycle': {'conf': 0.2, 'iou': 0.3},
+    'car': {'conf': 0.5, 'iou': 0.45},
+    'motorcycle': {'conf': 0.5, 'iou': 0.45},
+    'bus': {'conf': 0.5, 'iou': 0.45},
+    'truck': {'conf': 0.5, 'iou': 0.45},
+}
+
+
+def get_class_thresholds(overrides=None):
+    """Merge DETECTION_CLASS_THRESHOLDS from settings (and overrides) over the defaults."""
+    thresholds = {vtype: dict(values) for vtype, values in DEFAULT_CLASS_THRESHOLDS.items()}
+    for source in (getattr(settings, 'DETECTION_CLASS_THRESHOLDS', None), overrides):
+        for vtype, values in (source or {}).items():
+            thresholds.setdefault(vtype, {}).update(values)
+    return thresholds
+
+
+def inference_params(thresholds):
+    """
+    Model arguments for a single pass that keeps every box any class could accept.
+
+    The pass runs at the lowest per-class confidence. When the classes disagree
+    on IoU the model's NMS is switched off (iou=1.0) and ``filter_detections``
+    runs NMS per class at each class's own IoU instead.
+    """
+    class_ids = [cls for cls, vtype in VEHICLE_CLASSES.items() if vtype in thresholds]
+    ious = {thresholds[VEHICLE_CLASSES[cls]]['iou'] for cls in class_ids}
+    return {
+        'classes': class_ids,
+        'conf': min(thresholds[VEHICLE_CLASSES[cls]]['conf'] for cls in class_ids),
+        'iou': ious.pop() if len(ious) == 1 else 1.0,
+        'max_det': getattr(settings, 'DETECTION_MAX_CANDIDATES', 1000),
+    }
+
+
+def box_iou(box, boxes):
+    """IoU of one xyxy box against an (N, 4) array of xyxy boxes."""
+    x1 = np.maximum(box[0], boxes[:, 0])
+    y1 = np.maximum(box[1], boxes[:, 1])
+    x2 = np.minimum(box[2], boxes[:, 2])
+    y2 = np.minimum(box[3], boxes[:, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return inter / np.maximum(area + areas - inter, 1e-9)
+
+
+def nms(boxes, scores, iou_threshold):
+    """Greedy NMS, returning the indices of the kept boxes in descending score order."""
+    order = np.argsort(-scores, kind='stable')
+    keep = []
+    while order.size:
+        best = order[0]
+        keep.append(best)
+        if order.size == 1:
+            break
+        rest = order[1:]
+        order = rest[box_iou(boxes[best], boxes[rest]) <= iou_threshold]
+    return keep
+
+
+# Post-processed detections of one frame, one record per box. The boxes
+# come off the model's tensors once per frame and all thresholding runs as
+# array operations, so crowded frames cost next to nothing in Python.
+DETECTION_DTYPE = np.dtype([
+    ('class_id', np.int16),
+    ('confidence', np.float32),
+    ('bbox', np.float32, (4,)),
+    ('area', np.float32),
+])
+
+# Vehicle type by COCO class id, '' for the classes we don't count
+_CLASS_TABLE_SIZE = 256
+_VEHICLE_NAMES = np.array(
+    [VEHICLE_CLASSES.get(cls, '') for cls in range(_CLASS_TABLE_SIZE)], dtype=object
+)
+
+
+def results_to_array(result):
+    """The boxes of one ultralytics result as a DETECTION_DTYPE array."""
+    boxes = result.boxes
+    detections = np.empty(len(boxes), dtype=DETECTION_DTYPE)
+    if len(detections):
+        xyxy = boxes.xyxy.cpu().numpy()
+        detections['class_id'] = boxes.cls.cpu().numpy()
+        detections['confidence'] = boxes.conf.cpu().numpy()
+        detections['bbox'] = xyxy
+        detections['area'] = (xyxy[:, 2] - xyxy[:, 0]) * (xyxy[:, 3] - xyxy[:, 1])
+    return detections
+
+
+def _class_table(thresholds, key, missing):
+    """Per-class threshold lookup table indexed by COCO class id."""
+    table = np.full(_CLASS_TABLE_SIZE, missing, dtype=np.float64)
+    for cls, vehicle_type in VEHICLE_CLASSES.items():
+        if vehicle_type in thresholds:
+            table[cls] = thresholds[vehicle_type][key]
+    return table
+
+
+def filter_detections(results, thresholds):
+    """
+    Apply per-class confidence and IoU thresholds to the output of a single
+    inference pass made with ``inference_params(thresholds)``.
+
+    Greedy NMS only lets a box be suppressed by a higher scoring box of the
+    same class, so running it per class over the candidates above that class's
+    confidence keeps exactly the boxes a dedicated pass for the class would.
+    Returns a DETECTION_DTYPE array.
+    """
+    pass_iou = inference_params(thresholds)['iou']
+    conf_table = _class_table(thresholds, 'conf', np.inf)
+    iou_table = _class_table(thresholds, 'iou', pass_iou)
+
+    detections = np.concatenate([results_to_array(r) for r in results] or [np.empty(0, dtype=DETECTION_DTYPE)])
+    detections = detections[detections['confidence'] > conf_table[detections['class_id']]]
+
+    # Only classes with a stricter IoU than the pass used need their own NMS
+    keep = np.ones(len(detections), dtype=bool)
+    for cls in np.unique(detections['class_id'][iou_table[detections['class_id']] < pass_iou]):
+        members = np.flatnonzero(detections['class_id'] == cls)
+        kept = nms(detections['bbox'][members], detections['confidence'][members], iou_table[cls])
+        keep[members] = False
+        keep[members[kept]] = True
+    return detections[keep]
+
+
+def to_detections(detections):
+    """
+    Detection dicts ({'type', 'confidence', 'bbox'}) for a DETECTION_DTYPE
+    array, as used by the tracker, the writers and WebSocket messages.
+    """
+    types = _VEHICLE_NAMES[detections['class_id']].tolist()
+    confidences = detections['confidence'].tolist()
+    bboxes = detections['bbox'].astype(np.int32).tolist()
+    return [
+        {'type': vehicle_type, 'confidence': confidence, 'bbox': bbox}
+        for vehicle_type, confidence, bbox in zip(types, confidences, bboxes)
+    ]
+
+
+def detect_vehicles(model, frame, thresholds=None, imgsz=None):
+    """Run one inference pass over all vehicle classes and post-filter per class."""
+    thresholds = thresholds or get_class_thresholds()
+    params = inference_params(thresholds)
+    if imgsz:
+        params['imgsz'] = imgsz
+    results = model(frame, **params)
+    return filter_detections(results, thresholds)
+
+
+def detect_vehicles_batch(model, frames, thresholds=None, imgsz=None):
+    """
+    Run a single inference call over a list of frames.
+
+    Returns one DETECTION_DTYPE array per frame, in the order the frames were
+    given. ``imgsz`` overrides the model's inference size, for PyTorch models.
+    """
+    if not frames:
+        return []
+    thresholds = thresholds or get_class_thresholds()
+    params = inference_params(thresholds)
+    if imgsz:
+        params['imgsz'] = imgsz
+    results = model(frames, **params)
+    return [filter_detections([r], thresholds) for r in results]
+
+
+def detect_vehicles_two_pass(model, frame, thresholds=None):
+    """
+    Reference implementation running one inference pass per threshold group.
+
+    Kept for ``manage.py compare_detection_passes`` to check that the single
+    pass reproduces it.
+    """
+    thresholds = thresholds or get_class_thresholds()
+    groups = {}
+    for cls, vehicle_type in VEHICLE_CLASSES.items():
+        if vehicle_type in thresholds:
+            values = thresholds[vehicle_type]
+            groups.setdefault((values['conf'], values['iou']), []).append(cls)
+
+    detections = []
+    for (conf_threshold, iou_threshold), class_ids in sorted(groups.items()):
+        results = model(frame, classes=class_ids, conf=conf_threshold, iou=iou_threshold)
+        for r in results:
+            for box in r.boxes:
+                x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
+                conf = float(box.conf[0].cpu().numpy())
+                cls = int(box.cls[0].cpu().numpy())
+                if conf > conf_threshold:
+                    detections.append({
+                        'type': VEHICLE_CLASSES[cls],
+                        'confidence': conf,
+                        'bbox': [int(x1), int(y1), int(x2), int(y2)]
+                    })
+    return detections
@@ -0,0 +1,113 @@
+import asyncio
+import threading
+from collections import OrderedDict, deque
+
+from django.conf import settings
+
+
+class ExecutorBusy(Exception):
+    pass
+
+
+def _resolve(future, result, error):
+    # Runs on the event loop; the awaiting task may have been cancelled meanwhile
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+class FairExecutor:
+    """
+    Thread pool that runs blocking frame work (decode, inference, encode) for
+    async consumers.
+
+    Work is queued per key, one key per connection. Workers take the next
+    task round-robin over the keys, so one busy connection can't starve the
+    others, and never run two tasks of the same key at once, so each
+    connection's tasks run one at a time and in order. A key with
+    ``max_pending`` queued tasks raises ExecutorBusy instead of queueing more.
+    """
+
+    def __init__(self, workers=None, max_pending=None):
+        self.workers = max(1, workers or getattr(settings, 'CONSUMER_EXECUTOR_THREADS', 2))
+        self.max_pending = max(1, max_pending or getattr(settings, 'CONSUMER_MAX_PENDING', 2))
+        self.queues = OrderedDict()
+        self.running = set()
+        self.condition = threading.Condition()
+        self.threads = [
+            threading.Thread(target=self._work, name=f'consumer-executor-{i}', daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    async def run(self, key, fn, *args):
+        """Run fn(*args) on a worker thread and wait for its result without blocking the event loop."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self.condition:
+            queue = self.queues.setdefault(key, deque())
+            if len(queue) >= self.max_pending:
+                raise ExecutorBusy(f'Too many pending tasks for {key}')
+            queue.append((fn, args, future, loop))
+            self.condition.notify()
+        return await future
+
+    def discard(self, key):
+        """Drop the queued tasks of a key, e.g. when its connection closes."""
+        with self.condition:
+            queue = self.queues.pop(key, None)
+        for _, _, future, loop in queue or ():
+            loop.call_soon_threadsafe(future.cancel)
+
+    def _next_task(self):
+        # The first key in round-robin order that has work and isn't running
+        for key, queue in self.queues.items():
+            if key not in self.running:
+                task = queue.popleft()
+                del self.queues[key]
+                if queue:
+                    # Back of the line
+                    self.queues[key] = queue
+                self.running.add(key)
+                return key, task
+        return None, None
+
+    def _work(self):
+        while True:
+            with self.condition:
+                key, task = self._next_task()
+                while task is None:
+                    self.condition.wait()
+                    key, task = self._next_task()
+
+            fn, args, future, loop = task
+            result = error = None
+            if not future.cancelled():
+                try:
+                    result = fn(*args)
+                except Exception as e:
+                    error = e
+                loop.call_soon_threadsafe(_resolve, future, result, error)
+
+            with self.condition:
+                self.running.discard(key)
+                # The key may have more work that no worker could take while it ran
+                self.condition.notify_all()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """The process-wide executor, started on first use."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = FairExecutor()
+    return _executor
@@ -0,0 +1,266 @@
+import json
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F, Min, Sum
+from django.utils import timezone
+
+from .models import ProcessingJob, VideoAnalysis
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ('queued', 'running', 'split')
+
+
+def _lease_duration():
+    return timedelta(seconds=getattr(settings, 'VIDEO_JOB_LEASE_SECONDS', 60))
+
+
+def enqueue_analysis(analysis, priority=None):
+    """Queue an analysis for processing, reusing its active job if it already has one."""
+    with transaction.atomic():
+        job = ProcessingJob.objects.filter(analysis=analysis, status__in=ACTIVE_STATUSES).first()
+        if job is None:
+            job = ProcessingJob.objects.create(
+                analysis=analysis,
+                priority=priority if priority is not None else getattr(settings, 'VIDEO_JOB_DEFAULT_PRIORITY', 0)
+            )
+        VideoAnalysis.objects.filter(id=analysis.id).update(status='processing', error_message=None)
+    return job
+
+
+def claim_next_job(worker_id):
+    """
+    Atomically claim the highest priority queued job for worker_id.
+
+    The conditional UPDATE only succeeds for one worker per job, so this is
+    safe without row locks (which SQLite doesn't have).
+    """
+    while True:
+        job = ProcessingJob.objects.filter(status='queued').order_by('-priority', 'created_at').first()
+        if job is None:
+            return None
+        now = timezone.now()
+        claimed = ProcessingJob.objects.filter(id=job.id, status='queued').update(
+            status='running',
+            worker_id=worker_id,
+            claimed_at=now,
+            heartbeat_at=now,
+            lease_expires_at=now + _lease_duration(),
+            attempts=F('attempts') + 1
+        )
+        if claimed:
+            job.refresh_from_db()
+            return job
+        # Another worker got there first, try the next one
+
+
+def heartbeat(job_id, worker_id):
+    """Extend the lease. Returns False if the job was cancelled or the lease was lost."""
+    now = timezone.now()
+    return bool(ProcessingJob.objects.filter(id=job_id, worker_id=worker_id, status='running').update(
+        heartbeat_at=now,
+        lease_expires_at=now + _lease_duration()
+    ))
+
+
+def finish_job(job_id, worker_id, status, error_message=None):
+    return bool(ProcessingJob.objects.filter(id=job_id, worker_id=worker_id, status='running').update(
+        status=status,
+        finished_at=timezone.now(),
+        lease_expires_at=None,
+        error_message=error_message
+    ))
+
+
+def recover_expired_leases():
+    """Requeue running jobs whose worker stopped heartbeating, or fail them after too many attempts."""
+    max_attempts = getattr(settings, 'VIDEO_JOB_MAX_ATTEMPTS', 3)
+    expired = ProcessingJob.objects.filter(status='running', lease_expires_at__lt=timezone.now())
+    recovered = 0
+    for job in expired:
+        if job.attempts >= max_attempts:
+            updated = ProcessingJob.objects.filter(id=job.id, status='running', worker_id=job.worker_id).update(
+                status='failed',
+                finished_at=timezone.now(),
+                error_message='Worker lease expired too many times'
+            )
+            if updated:
+                VideoAnalysis.objects.filter(id=job.analysis_id).update(
+                    status='failed',
+                    error_message='Processing failed: worker stopped responding'
+                )
+                if job.parent_id:
+                    fail_parent(job.parent_id)
+        else:
+            updated = ProcessingJob.objects.filter(id=job.id, status='running', worker_id=job.worker_id).update(
+                status='queued',
+                worker_id=None,
+                lease_expires_at=None
+            )
+        recovered += updated
+    return recovered
+
+
+def split_job(job, ranges):
+    """
+    Turn a claimed job into the parent of one chunk job per (start, end] frame range.
+
+    Ranges already completed by a chunk of an earlier attempt at the same
+    analysis are carried over instead of being processed again. Returns the
+    chunk jobs that were queued.
+    """
+    now = timezone.now()
+    previous = {
+        (chunk.start_frame, chunk.end_frame): chunk
+        for chunk in ProcessingJob.objects.filter(
+            analysis_id=job.analysis_id, parent__isnull=False, status='completed'
+        ).order_by('finished_at')
+    }
+    with transaction.atomic():
+        updated = ProcessingJob.objects.filter(id=job.id, worker_id=job.worker_id, status='running').update(
+            status='split',
+            lease_expires_at=None
+        )
+        if not updated:
+            return []
+        chunks = []
+        for start, end in ranges:
+            done = previous.get((start, end))
+            chunks.append(ProcessingJob(
+                analysis_id=job.analysis_id,
+                parent=job,
+                priority=job.priority,
+                start_frame=start,
+                end_frame=end,
+                status='completed' if done else 'queued',
+                frames_processed=end - start if done else 0,
+                result_data=done.result_data if done else None,
+                finished_at=now if done else None
+            ))
+        ProcessingJob.objects.bulk_create(chunks)
+    return [chunk for chunk in chunks if chunk.status == 'queued']
+
+
+def update_chunk_progress(job_id, frames_processed, result_data=None):
+    fields = {'frames_processed': frames_processed}
+    if result_data is not None:
+        fields['result_data'] = json.dumps(result_data)
+    ProcessingJob.objects.filter(id=job_id).update(**fields)
+
+
+def chunk_frames_processed(parent_id):
+    return ProcessingJob.objects.filter(parent_id=parent_id).aggregate(total=Sum('frames_processed'))['total'] or 0
+
+
+def complete_parent_if_done(parent_id):
+    """
+    Mark a split job completed once every chunk is.
+
+    Several chunks can finish at the same moment; the conditional UPDATE
+    makes exactly one caller get True and do the merge.
+    """
+    if ProcessingJob.objects.filter(parent_id=parent_id).exclude(status='completed').exists():
+        return False
+    return bool(ProcessingJob.objects.filter(id=parent_id, status='split').update(
+        status='completed',
+        finished_at=timezone.now()
+    ))
+
+
+def fail_parent(parent_id):
+    """Fail a split job and cancel its remaining chunks after one chunk failed."""
+    with transaction.atomic():
+        ProcessingJob.objects.filter(parent_id=parent_id, status__in=('queued', 'running')).update(
+            status='cancelled',
+            finished_at=timezone.now(),
+            lease_expires_at=None
+        )
+        ProcessingJob.objects.filter(id=parent_id, status='split').update(
+            status='failed',
+            finished_at=timezone.now()
+        )
+
+
+def cancel_analysis(analysis):
+    """Cancel queued and running jobs of an analysis. Running workers stop at their next heartbeat."""
+    with transaction.atomic():
+        cancelled = ProcessingJob.objects.filter(analysis=analysis, status__in=ACTIVE_STATUSES).update(
+            status='cancelled',
+            finished_at=timezone.now(),
+            lease_expires_at=None
+        )
+        if cancelled:
+            VideoAnalysis.objects.filter(id=analysis.id).update(status='cancelled')
+    return cancelled
+
+
+def queue_stats():
+    """Backlog depth and wait times, used by the upload view to shed load."""
+    now = timezone.now()
+    queued = ProcessingJob.objects.filter(status='queued')
+    oldest = queued.aggregate(oldest=Min('created_at'))['oldest']
+    recent_waits = [
+        (claimed_at - created_at).total_seconds()
+        for created_at, claimed_at in ProcessingJob.objects.filter(
+            claimed_at__gte=now - timedelta(hours=1)
+        ).values_list('created_at', 'claimed_at')
+    ]
+    return {
+        'queued': queued.count(),
+        'running': ProcessingJob.objects.filter(status='running').count(),
+        'oldest_wait': (now - oldest).total_seconds() if oldest else 0,
+        'average_wait': sum(recent_waits) / len(recent_waits) if recent_waits else 0,
+    }
+
+
+def should_shed_load(stats=None):
+    stats = stats or queue_stats()
+    max_depth = getattr(settings, 'VIDEO_QUEUE_MAX_DEPTH', None)
+    max_wait = getattr(settings, 'VIDEO_QUEUE_MAX_WAIT', None)
+    if max_depth is not None and stats['queued'] >= max_depth:
+        return True
+    if max_wait is not None and stats['oldest_wait'] >= max_wait:
+        return True
+    return False
+
+
+class JobHeartbeat:
+    """
+    Background thread that keeps a job's lease alive while it is processed.
+
+    ``cancelled`` is set once the job is cancelled or its lease is lost, and
+    the processor checks it between batches.
+    """
+
+    def __init__(self, job, worker_id, interval=None):
+        self.job = job
+        self.worker_id = worker_id
+        self.interval = interval or getattr(settings, 'VIDEO_JOB_LEASE_SECONDS', 60) / 3
+        self.cancelled = threading.Event()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name=f'job-heartbeat-{job.id}', daemon=True)
+
+    def _run(self):
+        try:
+            while not self.stopped.wait(self.interval):
+                if not heartbeat(self.job.id, self.worker_id):
+                    self.cancelled.set()
+                    break
+        except Exception:
+            # The lease will expire and the job be retried elsewhere
+            logger.exception("Error sending heartbeat for job %s", self.job.id)
+        finally:
+            connections.close_all()
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stopped.set()
+        self.thread.join()
+        return False
@@ -0,0 +1,101 @@
+import time
+
+import cv2
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from traffic_analyzer.backends import BACKENDS, MODEL_SIZES
+from traffic_analyzer.detection import box_iou, detect_vehicles, get_class_thresholds
+from traffic_analyzer.model_registry import get_model
+
+
+def _match(reference, detections, iou_threshold):
+    """Greedily pair same-class detections by IoU; returns the confidence differences of the pairs."""
+    pairs = []
+    for i, ref in enumerate(reference):
+        if not len(detections):
+            break
+        ious = box_iou(ref['bbox'], detections['bbox'])
+        for j in np.flatnonzero((ious >= iou_threshold) & (detections['class_id'] == ref['class_id'])):
+            pairs.append((ious[j], i, j))
+
+    used_reference, used_detections, differences = set(), set(), []
+    for _, i, j in sorted(pairs, reverse=True):
+        if i in used_reference or j in used_detections:
+            continue
+        used_reference.add(i)
+        used_detections.add(j)
+        differences.append(abs(float(reference[i]['confidence']) - float(detections[j]['confidence'])))
+    return differences
+
+
+class Command(BaseCommand):
+    help = 'Run several inference backends over a video and report how well their detections agree'
+
+    def add_arguments(self, parser):
+        parser.add_argument('video', help='Path to a sample video')
+        parser.add_argument('--backends', nargs='+', choices=BACKENDS, default=['pytorch', 'onnx'],
+                            help='Backends to compare; the first one is the reference')
+        parser.add_argument('--size', choices=MODEL_SIZES, default=None)
+        parser.add_argument('--imgsz', type=int, default=None)
+        parser.add_argument('--max-frames', type=int, default=100, help='Stop after this many frames (0 for all)')
+        parser.add_argument('--iou', type=float, default=0.5, help='IoU for two boxes to count as the same detection')
+        parser.add_argument('--min-agreement', type=float, default=0.95,
+                            help='Fail if a backend agrees with the reference on fewer detections than this')
+
+    def handle(self, *args, **options):
+        cap = cv2.VideoCapture(options['video'])
+        if not cap.isOpened():
+            raise CommandError(f"Could not open video file {options['video']}")
+
+        thresholds = get_class_thresholds()
+        models = {backend: get_model(backend, options['size'], options['imgsz']) for backend in options['backends']}
+        reference_backend = options['backends'][0]
+        stats = {backend: {'detections': 0, 'matched': 0, 'conf_diff': [], 'seconds': 0.0} for backend in models}
+        frame_count = 0
+
+        try:
+            while cap.isOpened():
+                if options['max_frames'] and frame_count >= options['max_frames']:
+                    break
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                frame_count += 1
+                # Same enhancement as VideoProcessor._enhance
+                frame = cv2.convertScaleAbs(frame, alpha=1.3, beta=10)
+
+                results = {}
+                for backend, model in models.items():
+                    started = time.perf_counter()
+                    results[backend] = detect_vehicles(model, frame, thresholds)
+                    stats[backend]['seconds'] += time.perf_counter() - started
+                    stats[backend]['detections'] += len(results[backend])
+
+                for backend in models:
+                    differences = _match(results[reference_backend], results[backend], options['iou'])
+                    stats[backend]['matched'] += len(differences)
+                    stats[backend]['conf_diff'] += differences
+        finally:
+            cap.release()
+
+        reference_total = stats[reference_backend]['detections']
+        failed = []
+        for backend, values in stats.items():
+            total = reference_total + values['detections']
+            # Share of detections found by both (F1 against the reference)
+            agreement = 2 * values['matched'] / total if total else 1.0
+            mean_diff = float(np.mean(values['conf_diff'])) if values['conf_diff'] else 0.0
+            ms_per_frame = values['seconds'] / frame_count * 1000 if frame_count else 0.0
+            line = (f'{backend:>10}: {values["detections"]} detections, agreement {agreement:.1%}, '
+                    f'mean confidence difference {mean_diff:.3f}, {ms_per_frame:.1f} ms/frame')
+            if agreement < options['min_agreement']:
+                failed.append(backend)
+                self.stdout.write(self.style.WARNING(line))
+            else:
+                self.stdout.write(line)
+
+        summary = f'{frame_count} frames compared against {reference_backend}'
+        if failed:
+            raise CommandError(f"{summary}; below {options['min_agreement']:.0%} agreement: {', '.join(failed)}")
+        self.stdout.write(self.style.SUCCESS(summary))
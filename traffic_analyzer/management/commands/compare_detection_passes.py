@@ -0,0 +1,63 @@
+import cv2
+from django.core.management.base import BaseCommand, CommandError
+from ultralytics import YOLO
+
+from traffic_analyzer.detection import (
+    detect_vehicles, detect_vehicles_two_pass, get_class_thresholds, to_detections
+)
+
+
+def _detection_key(detection):
+    return (detection['type'], tuple(detection['bbox']), round(detection['confidence'], 4))
+
+
+class Command(BaseCommand):
+    help = 'Run the single-pass and two-pass detectors over a video and report any difference'
+
+    def add_arguments(self, parser):
+        parser.add_argument('video', help='Path to a sample video')
+        parser.add_argument('--model', default='yolov8n.pt', help='YOLO weights to load')
+        parser.add_argument('--max-frames', type=int, default=300, help='Stop after this many frames (0 for all)')
+
+    def handle(self, *args, **options):
+        cap = cv2.VideoCapture(options['video'])
+        if not cap.isOpened():
+            raise CommandError(f"Could not open video file {options['video']}")
+
+        model = YOLO(options['model'])
+        thresholds = get_class_thresholds()
+        frame_count = 0
+        total_detections = 0
+        mismatched_frames = []
+
+        try:
+            while cap.isOpened():
+                if options['max_frames'] and frame_count >= options['max_frames']:
+                    break
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                frame_count += 1
+
+                # Same enhancement as VideoProcessor._process_video
+                frame = cv2.convertScaleAbs(frame, alpha=1.3, beta=10)
+
+                single = sorted(map(_detection_key, to_detections(detect_vehicles(model, frame, thresholds))))
+                two_pass = sorted(map(_detection_key, detect_vehicles_two_pass(model, frame, thresholds)))
+                total_detections += len(two_pass)
+
+                if single != two_pass:
+                    mismatched_frames.append(frame_count)
+                    self.stdout.write(self.style.WARNING(
+                        f'Frame {frame_count}: single pass {len(single)} detections, two pass {len(two_pass)}'
+                    ))
+                    for key in sorted(set(single) ^ set(two_pass)):
+                        source = 'single' if key in single else 'two-pass'
+                        self.stdout.write(f'    only in {source}: {key}')
+        finally:
+            cap.release()
+
+        summary = f'{frame_count} frames, {total_detections} detections, {len(mismatched_frames)} mismatched frames'
+        if mismatched_frames:
+            raise CommandError(summary)
+        self.stdout.write(self.style.SUCCESS(summary))
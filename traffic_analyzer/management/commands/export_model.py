@@ -0,0 +1,38 @@
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+
+from traffic_analyzer.backends import BACKENDS, MODEL_SIZES, export_model, sample_calibration_frames
+
+
+class Command(BaseCommand):
+    help = 'Export the YOLO weights to ONNX or OpenVINO, optionally quantized to INT8'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backend', required=True, choices=[b for b in BACKENDS if b != 'pytorch'])
+        parser.add_argument('--size', choices=MODEL_SIZES, default=None, help='Model size, defaults to INFERENCE_MODEL_SIZE')
+        parser.add_argument('--imgsz', type=int, default=None, help='Input size, defaults to INFERENCE_IMGSZ')
+        parser.add_argument('--int8', action='store_true', help='Quantize to INT8')
+        parser.add_argument(
+            '--calibration', nargs='+', default=None,
+            help='Videos or directories of videos to calibrate INT8 on (default: uploaded videos)'
+        )
+        parser.add_argument('--calibration-frames', type=int, default=300, help='Number of calibration frames')
+
+    def handle(self, *args, **options):
+        frames = None
+        if options['int8']:
+            paths = options['calibration'] or [settings.MEDIA_ROOT]
+            frames = sample_calibration_frames(paths, options['calibration_frames'])
+            if not frames:
+                raise CommandError(f"No calibration frames found in {', '.join(map(str, paths))}")
+            self.stdout.write(f'Calibrating on {len(frames)} frames')
+
+        try:
+            path = export_model(
+                options['backend'], options['size'], options['imgsz'],
+                int8=options['int8'], calibration_frames=frames
+            )
+        except ImproperlyConfigured as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f'Exported {path}'))
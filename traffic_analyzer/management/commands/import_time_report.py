@@ -0,0 +1,59 @@
+import re
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# A line of `python -X importtime` output: self | cumulative | nested name
+_IMPORT_TIME = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|( *)(\S+)')
+
+# Modules that should only be imported once inference or charting is needed
+HEAVY_MODULES = ('torch', 'ultralytics', 'cv2', 'plotly', 'pandas', 'tqdm')
+
+
+class Command(BaseCommand):
+    help = 'Report the slowest imports when Django starts up and loads a module (the URLconf by default)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--module', default=None, help='Module to import after django.setup()')
+        parser.add_argument('--limit', type=int, default=20, help='Number of modules to list')
+
+    def handle(self, *args, **options):
+        module = options['module'] or settings.ROOT_URLCONF
+        code = f'import django; django.setup(); import importlib; importlib.import_module({module!r})'
+
+        # A fresh interpreter, so modules this process already imported count too
+        started = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', code],
+            capture_output=True, text=True
+        )
+        elapsed = time.perf_counter() - started
+        if result.returncode != 0:
+            raise CommandError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else 'Import failed')
+
+        imports = []
+        for line in result.stderr.splitlines():
+            match = _IMPORT_TIME.match(line)
+            if match:
+                self_us, cumulative_us, indent, name = match.groups()
+                imports.append((int(cumulative_us), int(self_us), len(indent) // 2, name))
+
+        top_level = [entry for entry in imports if entry[2] == 0]
+        self.stdout.write(f'Importing {module}: {elapsed:.2f}s wall time, '
+                          f'{sum(entry[0] for entry in top_level) / 1e6:.2f}s in {len(imports)} imports')
+        self.stdout.write('')
+        self.stdout.write(f'{"cumulative":>12} {"self":>10}  module')
+        for cumulative_us, self_us, _, name in sorted(top_level, reverse=True)[:options['limit']]:
+            self.stdout.write(f'{cumulative_us / 1000:>10.1f}ms {self_us / 1000:>8.1f}ms  {name}')
+
+        loaded = sorted({
+            name.split('.')[0] for _, _, _, name in imports if name.split('.')[0] in HEAVY_MODULES
+        })
+        self.stdout.write('')
+        if loaded:
+            self.stdout.write(self.style.WARNING(f'Heavy modules imported at startup: {", ".join(loaded)}'))
+        else:
+            self.stdout.write(self.style.SUCCESS('No heavy modules imported at startup'))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from traffic_analyzer.workers import VideoProcessingPool
+
+
+class Command(BaseCommand):
+    help = 'Run a pool of video processing workers that claim jobs from the database queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=None, help='Number of worker processes')
+        parser.add_argument('--threads', type=int, default=None, help='Torch/OpenCV threads per worker')
+
+    def handle(self, *args, **options):
+        pool = VideoProcessingPool(options['processes'], options['threads'])
+        pool.start()
+        self.stdout.write(self.style.SUCCESS(
+            f'Started {pool.processes} video workers with {pool.threads_per_worker} threads each'
+        ))
+        try:
+            pool.join()
+        except KeyboardInterrupt:
+            pool.shutdown()
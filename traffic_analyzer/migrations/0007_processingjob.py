@@ -0,0 +1,38 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('traffic_analyzer', '0006_videoanalysis_status'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='videoanalysis',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('completed', 'Completed'), ('failed', 'Failed'), ('cancelled', 'Cancelled')], default='pending', max_length=20),
+        ),
+        migrations.CreateModel(
+            name='ProcessingJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed'), ('cancelled', 'Cancelled')], default='queued', max_length=20)),
+                ('priority', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('worker_id', models.CharField(blank=True, max_length=100, null=True)),
+                ('heartbeat_at', models.DateTimeField(blank=True, null=True)),
+                ('lease_expires_at', models.DateTimeField(blank=True, null=True)),
+                ('attempts', models.IntegerField(default=0)),
+                ('error_message', models.TextField(blank=True, null=True)),
+                ('analysis', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='jobs', to='traffic_analyzer.videoanalysis')),
+            ],
+            options={
+                'ordering': ['-priority', 'created_at'],
+                'indexes': [models.Index(fields=['status', '-priority', 'created_at'], name='processingjob_claim_idx'), models.Index(fields=['status', 'lease_expires_at'], name='processingjob_lease_idx')],
+            },
+        ),
+    ]
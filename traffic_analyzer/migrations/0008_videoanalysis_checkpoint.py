@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('traffic_analyzer', '0007_processingjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='videoanalysis',
+            name='checkpoint_frame',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='videoanalysis',
+            name='checkpoint_data',
+            field=models.TextField(blank=True, null=True),
+        ),
+    ]
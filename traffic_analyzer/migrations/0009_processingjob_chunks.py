@@ -0,0 +1,42 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('traffic_analyzer', '0008_videoanalysis_checkpoint'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='processingjob',
+            name='status',
+            field=models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('split', 'Split into chunks'), ('completed', 'Completed'), ('failed', 'Failed'), ('cancelled', 'Cancelled')], default='queued', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='processingjob',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='traffic_analyzer.processingjob'),
+        ),
+        migrations.AddField(
+            model_name='processingjob',
+            name='start_frame',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='processingjob',
+            name='end_frame',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='processingjob',
+            name='frames_processed',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='processingjob',
+            name='result_data',
+            field=models.TextField(blank=True, null=True),
+        ),
+    ]
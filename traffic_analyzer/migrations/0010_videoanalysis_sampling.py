@@ -0,0 +1,31 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('traffic_analyzer', '0009_processingjob_chunks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='videoanalysis',
+            name='frame_stride',
+            field=models.IntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='videoanalysis',
+            name='sample_fps',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='videoanalysis',
+            name='video_fps',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='vehiclecount',
+            name='video_time',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,35 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('traffic_analyzer', '0010_videoanalysis_sampling'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vehiclecount',
+            name='track_id',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='vehiclecount',
+            name='last_frame',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='vehiclecount',
+            name='hits',
+            field=models.IntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='vehiclecount',
+            name='trajectory',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='vehiclecount',
+            index=models.Index(fields=['analysis', 'track_id'], name='vehiclecount_track_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('traffic_analyzer', '0011_vehiclecount_tracks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='videoanalysis',
+            name='inference_backend',
+            field=models.CharField(blank=True, default='', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='videoanalysis',
+            name='model_size',
+            field=models.CharField(blank=True, default='', max_length=1),
+        ),
+        migrations.AddField(
+            model_name='videoanalysis',
+            name='imgsz',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+    ]
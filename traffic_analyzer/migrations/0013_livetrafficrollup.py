@@ -0,0 +1,34 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('traffic_analyzer', '0012_videoanalysis_inference'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LiveTrafficRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('camera', models.CharField(max_length=100)),
+                ('bucket_start', models.DateTimeField()),
+                ('frames', models.IntegerField(default=0)),
+                ('car_count', models.IntegerField(default=0)),
+                ('truck_count', models.IntegerField(default=0)),
+                ('bus_count', models.IntegerField(default=0)),
+                ('motorcycle_count', models.IntegerField(default=0)),
+                ('avg_occupancy', models.FloatField(default=0)),
+                ('max_occupancy', models.IntegerField(default=0)),
+                ('congestion_ratio', models.FloatField(default=0)),
+            ],
+            options={
+                'ordering': ['-bucket_start'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='livetrafficrollup',
+            constraint=models.UniqueConstraint(fields=('camera', 'bucket_start'), name='livetrafficrollup_bucket_uniq'),
+        ),
+    ]
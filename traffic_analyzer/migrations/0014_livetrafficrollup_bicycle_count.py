@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('traffic_analyzer', '0013_livetrafficrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='livetrafficrollup',
+            name='bicycle_count',
+            field=models.IntegerField(default=0),
+        ),
+    ]
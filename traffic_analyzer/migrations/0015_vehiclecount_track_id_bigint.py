@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('traffic_analyzer', '0014_livetrafficrollup_bicycle_count'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='vehiclecount',
+            name='track_id',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,76 @@
+import threading
+
+import numpy as np
+
+from .backends import check_exported, default_options, model_path
+
+_models = {}
+_lock = threading.Lock()
+
+
+class SharedModel:
+    """
+    A loaded model shared by every thread of the process.
+
+    Calls are serialized with a lock because the ultralytics predictor keeps
+    per-call state on the model object, and run at the image size the model
+    was loaded for (exported models have a fixed input size). Other
+    attributes are passed through to the wrapped model.
+    """
+
+    def __init__(self, model, backend, imgsz):
+        self.model = model
+        self.backend = backend
+        self.imgsz = imgsz
+        self.lock = threading.Lock()
+
+    def __call__(self, *args, **kwargs):
+        kwargs.setdefault('imgsz', self.imgsz)
+        with self.lock:
+            return self.model(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+
+def warm_up(model):
+    """Run one dummy inference so the first real frame doesn't pay for lazy initialization."""
+    model(np.zeros((model.imgsz, model.imgsz, 3), dtype=np.uint8), verbose=False)
+
+
+def _load(path, backend, imgsz):
+    # Imported here so that importing this module stays cheap
+    from ultralytics import YOLO
+
+    if backend != 'pytorch':
+        check_exported(path)
+    model = SharedModel(YOLO(path, task='detect'), backend, imgsz)
+    warm_up(model)
+    return model
+
+
+def get_model(backend=None, model_size=None, imgsz=None):
+    """
+    The process-wide instance of a model, loaded and warmed up on first use.
+
+    Anything not given comes from the INFERENCE_* settings.
+    """
+    backend = backend or default_options()['backend']
+    imgsz = imgsz or default_options()['imgsz']
+    path = model_path(backend, model_size, imgsz)
+    key = (path, imgsz)
+    model = _models.get(key)
+    if model is None:
+        with _lock:
+            model = _models.get(key)
+            if model is None:
+                model = _models[key] = _load(path, backend, imgsz)
+    return model
+
+
+def preload():
+    """
+    Load the default model ahead of first use, e.g. before forking worker
+    processes so the children share the weights copy-on-write.
+    """
+    get_model()
@@ -6,7 +6,8 @@ class VideoAnalysis(models.Model):
         ('pending', 'Pending'),
         ('processing', 'Processing'),
         ('completed', 'Completed'),
-        ('failed', 'Failed')
+        ('failed', 'Failed'),
+        ('cancelled', 'Cancelled')
     ]
     
     video = models.FileField(upload_to='videos/')
@@ -16,6 +17,15 @@ class VideoAnalysis(models.Model):
     error_message = models.TextField(null=True, blank=True)
     results_data = models.TextField(null=True, blank=True)  # Changed from JSONField to TextField
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    checkpoint_frame = models.IntegerField(default=0)  # Last frame whose detections are committed
+    checkpoint_data = models.TextField(null=True, blank=True)  # Running counts and tracker state as JSON
+    frame_stride = models.IntegerField(default=1)  # Run detection on every k-th frame
+    sample_fps = models.FloatField(null=True, blank=True)  # Or on this many frames per second of video
+    video_fps = models.FloatField(null=True, blank=True)
+    # Inference overrides, blank to use the INFERENCE_* settings
+    inference_backend = models.CharField(max_length=20, blank=True, default='')
+    model_size = models.CharField(max_length=1, blank=True, default='')
+    imgsz = models.IntegerField(null=True, blank=True)
     
     def get_results_data(self):
         if self.results_data:
@@ -31,6 +41,24 @@ class VideoAnalysis(models.Model):
         else:
             self.results_data = None
     
+    def get_checkpoint_data(self):
+        if self.checkpoint_data:
+            try:
+                return json.loads(self.checkpoint_data)
+            except json.JSONDecodeError:
+                return {}
+        return {}
+
+    def set_checkpoint_data(self, data):
+        if data is not None:
+            self.checkpoint_data = json.dumps(data)
+        else:
+            self.checkpoint_data = None
+    
+    def get_video_time(self, frame_number):
+        """Seconds into the video of a 1-based frame number."""
+        return (frame_number - 1) / (self.video_fps or 30.0)
+    
     def get_vehicle_counts(self):
         return self.vehiclecount_set.all()
     
@@ -67,12 +95,36 @@ class VehicleCount(models.Model):
     bbox_x2 = models.FloatField()
     bbox_y2 = models.FloatField()
     speed = models.FloatField(default=0.0)  # Speed in km/h
+    video_time = models.FloatField(null=True, blank=True)  # Seconds into the video
     timestamp = models.DateTimeField(auto_now_add=True)
     count = models.IntegerField(default=0)
+    # One row per tracked vehicle: frame_number is the first frame it was
+    # seen, the bbox is taken from its most confident detection
+    track_id = models.BigIntegerField(null=True, blank=True)
+    last_frame = models.IntegerField(null=True, blank=True)
+    hits = models.IntegerField(default=1)  # Frames the vehicle was detected on
+    trajectory = models.TextField(null=True, blank=True)  # JSON [[frame, x1, y1, x2, y2], ...]
     
     class Meta:
         ordering = ['timestamp']
+        indexes = [
+            models.Index(fields=['analysis', 'track_id'], name='vehiclecount_track_idx'),
+        ]
     
+    def get_trajectory(self):
+        if self.trajectory:
+            try:
+                return json.loads(self.trajectory)
+            except json.JSONDecodeError:
+                return []
+        return []
+
+    def set_trajectory(self, points):
+        if points is not None:
+            self.trajectory = json.dumps(points)
+        else:
+            self.trajectory = None
+
     def get_center(self):
         return ((self.bbox_x1 + self.bbox_x2) / 2, (self.bbox_y1 + self.bbox_y2) / 2)
 
@@ -82,6 +134,93 @@ class VehicleCount(models.Model):
     def __str__(self):
         return f"{self.vehicle_type} at {self.timestamp}"
 
+class ProcessingJob(models.Model):
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('split', 'Split into chunks'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+        ('cancelled', 'Cancelled')
+    ]
+    
+    analysis = models.ForeignKey(VideoAnalysis, on_delete=models.CASCADE, related_name='jobs')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    priority = models.IntegerField(default=0)  # Higher runs first
+    created_at = models.DateTimeField(auto_now_add=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    worker_id = models.CharField(max_length=100, null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.IntegerField(default=0)
+    error_message = models.TextField(null=True, blank=True)
+    # Chunk jobs process frames (start_frame, end_frame] of their parent's video
+    parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='chunks')
+    start_frame = models.IntegerField(null=True, blank=True)
+    end_frame = models.IntegerField(null=True, blank=True)
+    frames_processed = models.IntegerField(default=0)
+    result_data = models.TextField(null=True, blank=True)  # Chunk counts as JSON
+    
+    class Meta:
+        ordering = ['-priority', 'created_at']
+        indexes = [
+            models.Index(fields=['status', '-priority', 'created_at'], name='processingjob_claim_idx'),
+            models.Index(fields=['status', 'lease_expires_at'], name='processingjob_lease_idx'),
+        ]
+    
+    def is_chunk(self):
+        return self.parent_id is not None
+
+    def get_result_data(self):
+        if self.result_data:
+            try:
+                return json.loads(self.result_data)
+            except json.JSONDecodeError:
+                return {}
+        return {}
+
+    def set_result_data(self, data):
+        if data is not None:
+            self.result_data = json.dumps(data)
+        else:
+            self.result_data = None
+    
+    def get_wait_time(self):
+        if self.claimed_at:
+            return (self.claimed_at - self.created_at).total_seconds()
+        return None
+
+    def __str__(self):
+        return f"Job {self.id} for analysis {self.analysis_id} - {self.status}"
+
+class LiveTrafficRollup(models.Model):
+    """Live camera traffic aggregated per minute, instead of a row per detection."""
+    camera = models.CharField(max_length=100)
+    bucket_start = models.DateTimeField()
+    frames = models.IntegerField(default=0)  # Frames processed in the minute
+    # Vehicles first confirmed by the tracker in the minute
+    bicycle_count = models.IntegerField(default=0)
+    car_count = models.IntegerField(default=0)
+    truck_count = models.IntegerField(default=0)
+    bus_count = models.IntegerField(default=0)
+    motorcycle_count = models.IntegerField(default=0)
+    avg_occupancy = models.FloatField(default=0)  # Vehicles in view, averaged over the frames
+    max_occupancy = models.IntegerField(default=0)
+    congestion_ratio = models.FloatField(default=0)  # Share of the frame covered by vehicles, averaged
+
+    class Meta:
+        ordering = ['-bucket_start']
+        constraints = [
+            models.UniqueConstraint(fields=['camera', 'bucket_start'], name='livetrafficrollup_bucket_uniq'),
+        ]
+
+    def total_vehicles(self):
+        return self.bicycle_count + self.car_count + self.truck_count + self.bus_count + self.motorcycle_count
+
+    def __str__(self):
+        return f"{self.camera} at {self.bucket_start}: {self.total_vehicles()} vehicles"
+
 class DetectionZone(models.Model):
     analysis = models.ForeignKey(VideoAnalysis, on_delete=models.CASCADE)
     name = models.CharField(max_length=100)
@@ -0,0 +1,92 @@
+import cv2
+from django.conf import settings
+
+
+class MotionGate:
+    """
+    Cheap frame-differencing check run before the model.
+
+    Frames are shrunk to ``width`` pixels wide, converted to blurred grayscale
+    and compared with the last frame that was sent to the model. When less
+    than ``threshold`` of the pixels changed by more than ``pixel_threshold``
+    the frame is considered static and the caller reuses the previous
+    detections. Comparing against the last inferred frame (rather than the
+    previous frame) means slow movement still adds up and triggers inference.
+    """
+
+    def __init__(self, threshold=None, pixel_threshold=None, width=None, max_skip=None):
+        self.threshold = threshold if threshold is not None else getattr(settings, 'MOTION_THRESHOLD', 0.002)
+        self.pixel_threshold = pixel_threshold or getattr(settings, 'MOTION_PIXEL_THRESHOLD', 25)
+        self.width = width or getattr(settings, 'MOTION_DOWNSCALE_WIDTH', 160)
+        # Run the model at least this often even on a static scene
+        self.max_skip = max_skip or getattr(settings, 'MOTION_MAX_SKIP', 150)
+        self.reference = None
+        self.skipped_in_row = 0
+        self.frames_seen = 0
+        self.frames_skipped = 0
+
+    @classmethod
+    def from_settings(cls):
+        """A gate configured from settings, or None when MOTION_GATING is off."""
+        if not getattr(settings, 'MOTION_GATING', False):
+            return None
+        return cls()
+
+    def _prepare(self, frame):
+        height = max(1, int(frame.shape[0] * self.width / frame.shape[1]))
+        small = cv2.resize(frame, (self.width, height), interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+        return cv2.GaussianBlur(gray, (5, 5), 0)
+
+    def changed_fraction(self, frame):
+        small = self._prepare(frame)
+        if self.reference is None or self.reference.shape != small.shape:
+            return 1.0, small
+        diff = cv2.absdiff(small, self.reference)
+        changed = cv2.countNonZero(cv2.threshold(diff, self.pixel_threshold, 255, cv2.THRESH_BINARY)[1])
+        return changed / diff.size, small
+
+    def has_motion(self, frame):
+        """True if the frame should go to the model, False to reuse the previous detections."""
+        self.frames_seen += 1
+        fraction, small = self.changed_fraction(frame)
+        if fraction < self.threshold and self.skipped_in_row < self.max_skip:
+            self.skipped_in_row += 1
+            self.frames_skipped += 1
+            return False
+        self.reference = small
+        self.skipped_in_row = 0
+        return True
+
+    def restore(self, stats):
+        """Continue the counters of a checkpointed run."""
+        self.frames_seen = stats.get('frames_seen', 0)
+        self.frames_skipped = stats.get('frames_skipped', 0)
+
+    @staticmethod
+    def merge_stats(first, second):
+        """Combine the stats() of two runs, e.g. of the chunks of one video."""
+        if first is None:
+            return dict(second)
+        seen = first['frames_seen'] + second['frames_seen']
+        skipped = first['frames_skipped'] + second['frames_skipped']
+        return {
+            'frames_seen': seen,
+            'frames_skipped': skipped,
+            'skip_ratio': skipped / seen if seen else 0.0,
+        }
+
+    def reset(self):
+        self.reference = None
+        self.skipped_in_row = 0
+
+    @property
+    def skip_ratio(self):
+        return self.frames_skipped / self.frames_seen if self.frames_seen else 0.0
+
+    def stats(self):
+        return {
+            'frames_seen': self.frames_seen,
+            'frames_skipped': self.frames_skipped,
+            'skip_ratio': self.skip_ratio,
+        }
@@ -0,0 +1,103 @@
+import queue
+import threading
+
+from django.db import connections
+
+# Marks the end of the stream on a stage queue
+_END = object()
+
+
+class FramePipeline:
+    """
+    Runs video processing as three stages linked by bounded queues:
+
+        decoder thread -> inference (calling thread) -> persist thread
+
+    ``decode()`` returns the next work item or None when the video is done,
+    ``infer(item)`` turns it into a result and ``persist(result)`` stores and
+    reports it. Decoding and DB / channel I/O overlap with inference, and the
+    bounded queues make a fast decoder wait for inference instead of holding
+    the whole video in memory.
+    """
+
+    def __init__(self, decode, infer, persist, queue_size=4):
+        self.decode = decode
+        self.infer = infer
+        self.persist = persist
+        self.decoded = queue.Queue(maxsize=queue_size)
+        self.inferred = queue.Queue(maxsize=queue_size)
+        self.stop_event = threading.Event()
+        self.error = None
+
+    def _fail(self, error):
+        if self.error is None:
+            self.error = error
+        self.stop_event.set()
+
+    def _put(self, q, item):
+        # Block while the next stage is behind, but give up once any stage fails
+        while not self.stop_event.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q):
+        while not self.stop_event.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _END
+
+    def _decode_stage(self):
+        try:
+            while True:
+                item = self.decode()
+                if item is None:
+                    break
+                if not self._put(self.decoded, item):
+                    return
+            self._put(self.decoded, _END)
+        except Exception as e:
+            self._fail(e)
+
+    def _persist_stage(self):
+        try:
+            while True:
+                result = self._get(self.inferred)
+                if result is _END:
+                    break
+                self.persist(result)
+        except Exception as e:
+            self._fail(e)
+        finally:
+            # This thread has its own DB connection
+            connections.close_all()
+
+    def run(self):
+        decoder = threading.Thread(target=self._decode_stage, name='pipeline-decode', daemon=True)
+        persister = threading.Thread(target=self._persist_stage, name='pipeline-persist', daemon=True)
+        decoder.start()
+        persister.start()
+
+        try:
+            while True:
+                item = self._get(self.decoded)
+                if item is _END:
+                    break
+                if not self._put(self.inferred, self.infer(item)):
+                    break
+            self._put(self.inferred, _END)
+        except Exception as e:
+            self._fail(e)
+        finally:
+            persister.join()
+            # Unblock the decoder if persisting failed while it was waiting
+            self.stop_event.set()
+            decoder.join()
+
+        if self.error is not None:
+            raise self.error
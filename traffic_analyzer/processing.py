@@ -0,0 +1,582 @@
+import json
+import logging
+import time
+
+import cv2
+import numpy as np
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from .models import VideoAnalysis, VehicleCount, DetectionZone
+from .chunking import plan_chunks, seek_to_frame
+from .detection import VEHICLE_CLASSES, box_iou, detect_vehicles_batch, get_class_thresholds, to_detections
+from . import jobs
+from .model_registry import get_model
+from .motion import MotionGate
+from .pipeline import FramePipeline
+from .progress import ProgressReporter, record_status
+from .regions import RegionOfInterest
+from .sampling import FrameSampler
+from .tracking import IoUTracker
+from .writers import DetectionWriter
+
+
+logger = logging.getLogger(__name__)
+
+# Track ids of a chunk start at start_frame * TRACK_IDS_PER_FRAME, which
+# keeps them unique within an analysis (VehicleCount.track_id is 64-bit)
+TRACK_IDS_PER_FRAME = 1000
+
+
+class ProcessingCancelled(Exception):
+    pass
+
+
+def send_to_group(group, message):
+    record_status(group, message)
+    channel_layer = get_channel_layer()
+    async_to_sync(channel_layer.group_send)(group, message)
+
+
+def empty_counts():
+    return {'bicycle': 0, 'car': 0, 'truck': 0, 'bus': 0, 'motorcycle': 0}
+
+
+class VideoProcessor:
+    """
+    Runs detection over one uploaded video, or one chunk of it, at a time.
+
+    ``notify(group, message)`` delivers progress events; by default they go
+    straight to the channel layer, worker processes pass a function that
+    relays them to the parent process instead.
+    """
+
+    def __init__(self, model, notify=None):
+        self.model = model
+        self.notify = notify or send_to_group
+        self.classes = ['person', 'bicycle', 'car', 'motorcycle', 'airplane', 'bus', 'train', 'truck']
+        self.thresholds = get_class_thresholds()
+        self.batch_size = max(1, getattr(settings, 'VIDEO_INFERENCE_BATCH_SIZE', 1))
+        self.pipeline_queue_size = max(1, getattr(settings, 'VIDEO_PIPELINE_QUEUE_SIZE', 4))
+        self.checkpoint_interval = max(1, getattr(settings, 'VIDEO_CHECKPOINT_INTERVAL', 300))
+        self.chunking = getattr(settings, 'VIDEO_CHUNKING', False)
+
+    def process(self, analysis_id, cancel_event=None):
+        """Process one analysis and return its final status."""
+        try:
+            self._process_video(analysis_id, cancel_event)
+            return 'completed'
+        except ProcessingCancelled:
+            return 'cancelled'
+        except Exception as e:
+            self._handle_processing_error(analysis_id, str(e))
+            return 'failed'
+
+    def run_job(self, job, cancel_event=None):
+        """
+        Run a claimed ProcessingJob and return its final status.
+
+        With VIDEO_CHUNKING on, long videos are split into chunk jobs that any
+        worker can pick up, and 'split' is returned for the original job.
+        """
+        if job.is_chunk():
+            return self._run_chunk(job, cancel_event)
+        if self.chunking and self._split(job):
+            return 'split'
+        return self.process(job.analysis_id, cancel_event)
+
+    def _model_for(self, analysis):
+        """The analysis's own backend / model size / image size, or the worker's default model."""
+        if not (analysis.inference_backend or analysis.model_size or analysis.imgsz):
+            return self.model
+        return get_model(analysis.inference_backend or None, analysis.model_size or None, analysis.imgsz)
+
+    def _handle_processing_error(self, analysis_id, error_message):
+        try:
+            analysis = VideoAnalysis.objects.get(id=analysis_id)
+            analysis.status = 'failed'
+            analysis.error_message = f"Processing failed: {error_message}"
+            analysis.save()
+
+            # Notify frontend about the error
+            self.notify(
+                f'video_{analysis_id}',
+                {
+                    'type': 'processing_error',
+                    'message': error_message
+                }
+            )
+        except VideoAnalysis.DoesNotExist:
+            print(f"Error: Analysis {analysis_id} not found")
+        except Exception as e:
+            print(f"Error handling processing error: {str(e)}")
+
+    def _open_video(self, analysis):
+        cap = cv2.VideoCapture(analysis.video.path)
+        if not cap.isOpened():
+            raise Exception("Could not open video file")
+
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        if fps and analysis.video_fps != fps:
+            analysis.video_fps = fps
+            analysis.save(update_fields=['video_fps'])
+
+        # Create detection zones if not exist
+        if not DetectionZone.objects.filter(analysis=analysis).exists():
+            DetectionZone.objects.create(
+                analysis=analysis,
+                name='Full Frame',
+                coordinates=json.dumps([[0, 0], [1, 0], [1, 1], [0, 1]])
+            )
+        return cap
+
+    def _process_video(self, analysis_id, cancel_event=None):
+        analysis = VideoAnalysis.objects.get(id=analysis_id)
+
+        try:
+            if analysis.status != 'processing':
+                analysis.status = 'processing'
+                analysis.save()
+
+            cap = self._open_video(analysis)
+            total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            sampler = FrameSampler.for_analysis(analysis, analysis.video_fps)
+            motion_gate = MotionGate.from_settings()
+            tracker = IoUTracker.for_sampler(sampler)
+            vehicle_counts = empty_counts()
+
+            # Resume from the last checkpoint, if any
+            start_frame = self._restore_checkpoint(analysis, cap, vehicle_counts, tracker, motion_gate)
+
+            # WebSocket updates are coalesced and progress is saved now and then
+            reporter = ProgressReporter(
+                analysis_id, self.notify,
+                save=lambda progress: VideoAnalysis.objects.filter(id=analysis_id).update(
+                    processing_progress=progress
+                )
+            )
+
+            def on_frame(frame_count, detections, current_fps):
+                reporter.update(
+                    frame_count / total_frames, current_fps, vehicle_counts, detections,
+                    motion_skip_ratio=motion_gate.skip_ratio if motion_gate else 0.0
+                )
+
+            def on_checkpoint(frame_count):
+                self._save_checkpoint(analysis, frame_count, vehicle_counts, tracker, motion_gate)
+
+            self._run_frames(
+                analysis, cap, start_frame, None, sampler, tracker, vehicle_counts,
+                cancel_event, on_frame, on_checkpoint, motion_gate
+            )
+            reporter.flush()
+
+            self._complete(analysis, sampler, vehicle_counts, motion_gate.stats() if motion_gate else None)
+
+        except ProcessingCancelled:
+            self._notify_cancelled(analysis_id)
+            raise
+        except Exception as e:
+            analysis.status = 'failed'
+            analysis.error_message = str(e)
+            analysis.save()
+
+            self.notify(
+                f'video_{analysis_id}',
+                {
+                    'type': 'processing_error',
+                    'message': str(e)
+                }
+            )
+            raise
+
+    def _split(self, job):
+        """Split a long video into chunk jobs. Returns False if it is too short to split."""
+        analysis = VideoAnalysis.objects.get(id=job.analysis_id)
+        cap = self._open_video(analysis)
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        cap.release()
+
+        ranges = plan_chunks(analysis.video.path, total_frames, fps)
+        if len(ranges) <= 1:
+            return False
+
+        if analysis.status != 'processing':
+            analysis.status = 'processing'
+            analysis.save(update_fields=['status'])
+        queued = jobs.split_job(job, ranges)
+        logger.info("Analysis %s: split into %d chunks, %d to process", analysis.id, len(ranges), len(queued))
+        if not queued:
+            # Every chunk was already done by an earlier attempt
+            self._merge_chunks(job.id)
+        return True
+
+    def _run_chunk(self, job, cancel_event=None):
+        analysis = VideoAnalysis.objects.get(id=job.analysis_id)
+        analysis_id = analysis.id
+
+        try:
+            cap = self._open_video(analysis)
+            total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            chunk_frames = job.end_frame - job.start_frame
+            # The frame count is an estimate for some containers, so the
+            # last chunk runs to the real end of the video
+            end_frame = None if job.end_frame >= total_frames else job.end_frame
+            sampler = FrameSampler.for_analysis(analysis, analysis.video_fps)
+            motion_gate = MotionGate.from_settings()
+            tracker = IoUTracker.for_sampler(sampler, next_id=job.start_frame * TRACK_IDS_PER_FRAME + 1)
+            vehicle_counts = empty_counts()
+
+            # A chunk always restarts from its first frame; rows left by an
+            # earlier attempt at it are removed so the retry doesn't duplicate them
+            stale_rows = VehicleCount.objects.filter(analysis=analysis, frame_number__gt=job.start_frame)
+            if end_frame is not None:
+                stale_rows = stale_rows.filter(frame_number__lte=end_frame)
+            stale_rows.delete()
+            seek_to_frame(cap, job.start_frame)
+
+            other_chunks_done = jobs.chunk_frames_processed(job.parent_id)
+
+            # The analysis's progress is saved with each checkpoint
+            reporter = ProgressReporter(analysis_id, self.notify)
+
+            def on_frame(frame_count, detections, current_fps):
+                done = frame_count - job.start_frame
+                reporter.update(
+                    min(1.0, (other_chunks_done + done) / total_frames), current_fps, vehicle_counts, detections,
+                    chunk_progress=min(1.0, done / chunk_frames),
+                    motion_skip_ratio=motion_gate.skip_ratio if motion_gate else 0.0
+                )
+
+            def chunk_result(tail_tracks=()):
+                # tail_tracks are the tracks still open at the end of the
+                # chunk, which _stitch_chunks joins with the next chunk's
+                result_data = {'vehicle_counts': vehicle_counts, 'tail_tracks': list(tail_tracks)}
+                if motion_gate:
+                    result_data['motion'] = motion_gate.stats()
+                return result_data
+
+            def on_checkpoint(frame_count):
+                nonlocal other_chunks_done
+                done = frame_count - job.start_frame
+                jobs.update_chunk_progress(job.id, done, chunk_result())
+                # Refresh the other chunks' share of the overall progress
+                other_chunks_done = jobs.chunk_frames_processed(job.parent_id) - done
+                VideoAnalysis.objects.filter(id=analysis_id).update(
+                    processing_progress=min(1.0, (other_chunks_done + done) / total_frames)
+                )
+
+            frame_count, open_tracks = self._run_frames(
+                analysis, cap, job.start_frame, end_frame, sampler, tracker, vehicle_counts,
+                cancel_event, on_frame, on_checkpoint, motion_gate
+            )
+            reporter.flush()
+            jobs.update_chunk_progress(
+                job.id, frame_count - job.start_frame,
+                chunk_result(track.track_id for track in open_tracks)
+            )
+        except ProcessingCancelled:
+            self._notify_cancelled(analysis_id)
+            return 'cancelled'
+        except Exception as e:
+            jobs.fail_parent(job.parent_id)
+            self._handle_processing_error(analysis_id, str(e))
+            return 'failed'
+
+        # The last chunk to finish merges the results
+        jobs.finish_job(job.id, job.worker_id, 'completed')
+        self._merge_chunks(job.parent_id)
+        return 'completed'
+
+    def _merge_chunks(self, parent_id):
+        """Sum the chunk counts into the analysis once every chunk has completed."""
+        if not jobs.complete_parent_if_done(parent_id):
+            return
+        parent = jobs.ProcessingJob.objects.get(id=parent_id)
+        vehicle_counts = empty_counts()
+        motion = None
+        chunks = list(parent.chunks.order_by('start_frame'))
+        for chunk in chunks:
+            result_data = chunk.get_result_data()
+            for vehicle_type, count in result_data.get('vehicle_counts', {}).items():
+                vehicle_counts[vehicle_type] = vehicle_counts.get(vehicle_type, 0) + count
+            if 'motion' in result_data:
+                motion = MotionGate.merge_stats(motion, result_data['motion'])
+
+        analysis = VideoAnalysis.objects.get(id=parent.analysis_id)
+        sampler = FrameSampler.for_analysis(analysis, analysis.video_fps)
+        for vehicle_type in self._stitch_chunks(analysis, chunks, sampler):
+            vehicle_counts[vehicle_type] -= 1
+        self._complete(analysis, sampler, vehicle_counts, motion)
+
+    def _stitch_chunks(self, analysis, chunks, sampler):
+        """
+        Join tracks that a chunk boundary cut in two.
+
+        A vehicle in view at a boundary is an open track at the end of one
+        chunk and a new track at the start of the next. Pairs of the same type
+        whose boxes overlap across the boundary are merged into one row.
+        Returns the vehicle type of every merged pair, so each can be counted
+        once.
+        """
+        tracker = IoUTracker.for_sampler(sampler)
+        # New tracks of the next chunk can start this late and still be the
+        # continuation of an open one
+        window = (tracker.max_age + 1) * sampler.scale
+        merged = []
+        for before, after in zip(chunks, chunks[1:]):
+            tails = VehicleCount.objects.filter(
+                analysis=analysis, track_id__in=before.get_result_data().get('tail_tracks', [])
+            )
+            heads = list(VehicleCount.objects.filter(
+                analysis=analysis,
+                track_id__isnull=False,
+                frame_number__gt=after.start_frame,
+                frame_number__lte=after.start_frame + window
+            ))
+            pairs = []
+            for tail in tails:
+                last_box = np.asarray(tail.get_trajectory()[-1][1:], dtype=np.float32)
+                for head in heads:
+                    if head.vehicle_type != tail.vehicle_type:
+                        continue
+                    first_box = np.asarray([head.get_trajectory()[0][1:]], dtype=np.float32)
+                    iou = float(box_iou(last_box, first_box)[0])
+                    if iou >= tracker.iou_threshold:
+                        pairs.append((iou, tail, head))
+
+            # By track id: joining deletes the tail row, which clears its id
+            joined = set()
+            with transaction.atomic():
+                for _, tail, head in sorted(pairs, key=lambda pair: pair[0], reverse=True):
+                    if tail.track_id in joined or head.track_id in joined:
+                        continue
+                    joined.update((tail.track_id, head.track_id))
+                    self._join_track_rows(tail, head)
+                    merged.append(head.vehicle_type)
+        return merged
+
+    def _join_track_rows(self, tail, head):
+        # The head row is kept because it holds the later chunk's track id,
+        # which that chunk's own tail_tracks may refer to
+        head.frame_number = tail.frame_number
+        head.video_time = tail.video_time
+        head.hits += tail.hits
+        if tail.confidence > head.confidence:
+            head.confidence = tail.confidence
+            head.bbox_x1, head.bbox_y1, head.bbox_x2, head.bbox_y2 = (
+                tail.bbox_x1, tail.bbox_y1, tail.bbox_x2, tail.bbox_y2
+            )
+        head.set_trajectory(tail.get_trajectory() + head.get_trajectory())
+        head.save()
+        tail.delete()
+
+    def _run_frames(self, analysis, cap, start_frame, end_frame, sampler, tracker, vehicle_counts,
+                    cancel_event, on_frame, on_checkpoint, motion_gate=None):
+        """
+        Process frames start_frame + 1 .. end_frame (or to the end of the video
+        when end_frame is None) of an opened video. Frames the sampler skips
+        are grabbed but never decoded. With a ``motion_gate``, sampled frames
+        that barely differ from the last inferred one skip the model and
+        reuse its detections. When the analysis has detection zones, only
+        their bounding box is passed to the model.
+
+        Detections are associated into tracks by ``tracker``; each vehicle is
+        counted once, when its track is confirmed, and stored as one row
+        when its track ends.
+
+        ``on_frame(frame_count, detections, fps)`` is called for every
+        processed frame, with a ``track_id`` on each detection.
+        ``on_checkpoint(frame_count)`` is called every checkpoint interval,
+        once the rows up to that frame are committed, and once more
+        when processing stops.
+
+        Returns the last frame processed and the tracks that were still open
+        at the end; their rows have been written.
+        """
+        region = RegionOfInterest.for_analysis(
+            analysis, int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        )
+        if region is not None:
+            logger.info("Analysis %s: inference limited to the detection zones: %s", analysis.id, region.describe())
+        model = self._model_for(analysis)
+        start_time = time.time()
+        frame_count = start_frame
+        last_checkpoint = start_frame
+        frames_decoded = start_frame
+
+        def decode():
+            nonlocal frames_decoded
+            if cancel_event is not None and cancel_event.is_set():
+                raise ProcessingCancelled()
+            # (frame_number, inferred) in frame order; only inferred frames
+            # are passed to the model
+            entries = []
+            frames = []
+            while (len(frames) < self.batch_size and len(entries) < self.batch_size * 4
+                   and (end_frame is None or frames_decoded < end_frame)):
+                frame_number = frames_decoded + 1
+                if sampler.should_process(frame_number):
+                    ret, frame = cap.read()
+                else:
+                    # Advance without decoding the frame
+                    ret, frame = cap.grab(), None
+                if not ret:
+                    break
+                frames_decoded = frame_number
+                if frame is None:
+                    continue
+                if region is not None:
+                    # Motion outside the zones doesn't count either
+                    frame = region.crop(frame)
+                if motion_gate is not None and not motion_gate.has_motion(frame):
+                    entries.append((frame_number, False))
+                    continue
+                entries.append((frame_number, True))
+                frames.append(self._enhance(frame))
+            if not entries:
+                return None
+            return entries, frames
+
+        def infer(item):
+            # One inference call for the whole batch, split back into
+            # per-frame detections. The frames themselves are dropped here
+            # so only the detections travel on to the persist stage.
+            entries, frames = item
+            if not frames:
+                return entries, []
+            batch_detections = detect_vehicles_batch(model, frames, self.thresholds)
+            if region is not None:
+                batch_detections = [region.to_frame(detections) for detections in batch_detections]
+            return entries, [to_detections(detections) for detections in batch_detections]
+
+        # Detections of the last inferred frame, reused for static frames
+        last_detections = []
+
+        def persist(result):
+            nonlocal frame_count, last_checkpoint, last_detections
+            entries, batch_detections = result
+            inferred_detections = iter(batch_detections)
+            for frame_count, inferred in entries:
+                if inferred:
+                    last_detections = next(inferred_detections)
+                detections, confirmed, finished = tracker.update(frame_count, last_detections)
+                for track in confirmed:
+                    vehicle_counts[track.vehicle_type] = vehicle_counts.get(track.vehicle_type, 0) + 1
+
+                # Calculate current FPS
+                elapsed_time = time.time() - start_time
+                current_fps = (frame_count - start_frame) / elapsed_time if elapsed_time > 0 else 0
+                on_frame(frame_count, detections, current_fps)
+
+                # Buffer one row per finished track for bulk insertion
+                for track in finished:
+                    writer.add_track(track, analysis.get_video_time(track.first_frame))
+
+            if frame_count - last_checkpoint >= self.checkpoint_interval:
+                writer.flush()
+                on_checkpoint(frame_count)
+                last_checkpoint = frame_count
+
+        # Decode, inference and DB / WebSocket updates run as separate
+        # stages so decoding and I/O overlap with inference
+        writer = DetectionWriter(analysis.id)
+        open_tracks = []
+        try:
+            FramePipeline(decode, infer, persist, queue_size=self.pipeline_queue_size).run()
+            # Vehicles still in view at the end. When processing stops early
+            # the open tracks are kept in the checkpoint instead.
+            open_tracks = tracker.flush()
+            for track in open_tracks:
+                writer.add_track(track, analysis.get_video_time(track.first_frame))
+        finally:
+            cap.release()
+            # Flush buffered rows on completion and on failure, then
+            # checkpoint so a retry continues after the last stored frame
+            writer.close()
+            if frame_count > last_checkpoint:
+                on_checkpoint(frame_count)
+        return frame_count, open_tracks
+
+    def _complete(self, analysis, sampler, vehicle_counts, motion=None):
+        # Counts are unique tracked vehicles, so sampling doesn't scale them
+        results = {
+            'vehicle_counts': vehicle_counts,
+            'sampling': sampler.describe(),
+        }
+        if motion is not None:
+            results['motion'] = motion
+        analysis.set_results_data(results)
+
+        # Update analysis status
+        analysis.status = 'completed'
+        analysis.processed = True
+        analysis.processing_progress = 1.0
+        analysis.save()
+
+        # Send completion message
+        self.notify(
+            f'video_{analysis.id}',
+            {
+                'type': 'processing_complete',
+                'results_url': f'/analysis/{analysis.id}/results/'
+            }
+        )
+
+    def _notify_cancelled(self, analysis_id):
+        # The job was cancelled (or handed to another worker), leave the
+        # analysis status to whoever cancelled it
+        self.notify(
+            f'video_{analysis_id}',
+            {
+                'type': 'processing_error',
+                'message': 'Processing cancelled'
+            }
+        )
+
+    def _restore_checkpoint(self, analysis, cap, vehicle_counts, tracker, motion_gate=None):
+        """
+        Seek to the analysis's checkpoint and restore its running state.
+
+        Rows written after the checkpoint may exist if the previous attempt
+        died before its next one: rows of tracks seen after it, and rows of
+        tracks that were still open at it. They are deleted and processed
+        again, which makes a retry idempotent whether or not the last flush
+        completed.
+        """
+        checkpoint_frame = analysis.checkpoint_frame
+        checkpoint_data = analysis.get_checkpoint_data() if checkpoint_frame > 0 else {}
+        tracker_state = checkpoint_data.get('tracker', {})
+        open_track_ids = [track['track_id'] for track in tracker_state.get('tracks', [])]
+        VehicleCount.objects.filter(analysis=analysis).filter(
+            Q(frame_number__gt=checkpoint_frame) | Q(last_frame__gt=checkpoint_frame) | Q(track_id__in=open_track_ids)
+        ).delete()
+        if checkpoint_frame <= 0:
+            return 0
+
+        vehicle_counts.update(checkpoint_data.get('vehicle_counts', {}))
+        tracker.restore(tracker_state)
+        if motion_gate is not None and 'motion' in checkpoint_data:
+            motion_gate.restore(checkpoint_data['motion'])
+        seek_to_frame(cap, analysis.checkpoint_frame)
+        logger.info("Analysis %s: resuming from frame %d", analysis.id, analysis.checkpoint_frame)
+        return analysis.checkpoint_frame
+
+    def _save_checkpoint(self, analysis, frame_number, vehicle_counts, tracker, motion_gate=None):
+        checkpoint_data = {'vehicle_counts': vehicle_counts, 'tracker': tracker.to_dict()}
+        if motion_gate is not None:
+            checkpoint_data['motion'] = motion_gate.stats()
+        analysis.checkpoint_frame = frame_number
+        analysis.set_checkpoint_data(checkpoint_data)
+        analysis.save(update_fields=['checkpoint_frame', 'checkpoint_data'])
+
+    def _enhance(self, frame):
+        # Enhance frame for better detection
+        return cv2.convertScaleAbs(frame, alpha=1.3, beta=10)  # Increased contrast and brightness
+
+    def get_vehicle_type(self, class_id):
+        return VEHICLE_CLASSES.get(class_id)
@@ -0,0 +1,134 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+# Messages that describe an analysis's processing state. The last one sent
+# to each group is kept so viewers that join late get it without a query.
+STATUS_MESSAGES = ('processing_update', 'processing_complete', 'processing_error')
+MAX_SNAPSHOTS = 1000
+
+_snapshots = OrderedDict()
+_snapshots_lock = threading.Lock()
+
+
+def progress_group(analysis_id):
+    return f'video_{analysis_id}'
+
+
+def detections_group(analysis_id):
+    """Group for per-frame detections, joined only by clients that ask for them."""
+    return f'video_{analysis_id}_detections'
+
+
+def record_status(group, message):
+    """Remember message as the group's latest state, if it is a status message."""
+    if message.get('type') not in STATUS_MESSAGES:
+        return
+    with _snapshots_lock:
+        _snapshots.pop(group, None)
+        _snapshots[group] = dict(message)
+        while len(_snapshots) > MAX_SNAPSHOTS:
+            _snapshots.popitem(last=False)
+
+
+def last_status(analysis_id):
+    """
+    The last status message sent for an analysis by this process, or None.
+    Processing workers send theirs through the pool's relay thread, so the
+    web process sees every one of them.
+    """
+    with _snapshots_lock:
+        message = _snapshots.get(progress_group(analysis_id))
+        return dict(message) if message is not None else None
+
+
+class ProgressReporter:
+    """
+    Rate limits the progress a video processor reports.
+
+    ``update()`` can be called for every frame. A ``processing_update`` with
+    the latest progress and counts is sent at most PROGRESS_UPDATE_RATE
+    times a second and the frames in between are coalesced into it. The
+    tracked detections of the latest frame go out at the same rate, but to
+    ``detections_group``, which only has members while a client asked for
+    them. Only tracks that are new or changed since the last message are
+    sent, with the ids of the ones that ended, and nothing when no track
+    changed. Every DETECTIONS_KEYFRAME_INTERVAL seconds the full set is sent
+    with ``reset`` so clients that subscribed late catch up.
+    ``save(progress)`` is called every PROGRESS_SAVE_INTERVAL seconds to
+    persist progress to the database.
+    """
+
+    def __init__(self, analysis_id, notify, save=None, rate=None, save_interval=None, keyframe_interval=None):
+        self.analysis_id = analysis_id
+        self.notify = notify
+        self.save = save
+        self.interval = 1 / (rate or getattr(settings, 'PROGRESS_UPDATE_RATE', 2))
+        self.save_interval = save_interval or getattr(settings, 'PROGRESS_SAVE_INTERVAL', 5)
+        self.keyframe_interval = keyframe_interval or getattr(settings, 'DETECTIONS_KEYFRAME_INTERVAL', 5)
+        self.pending = None
+        self.last_sent = 0
+        self.last_saved = time.monotonic()
+        self.last_keyframe = None
+        self.updates_sent = 0
+        # Track id -> detection, as last sent to detections_group
+        self.sent_tracks = {}
+
+    def update(self, progress, fps, counts, detections=None, **extra):
+        self.pending = (progress, fps, dict(counts), detections, extra)
+        now = time.monotonic()
+        if now - self.last_sent >= self.interval:
+            self._send(now)
+        if self.save is not None and now - self.last_saved >= self.save_interval:
+            self.save(progress)
+            self.last_saved = now
+
+    def _send(self, now):
+        progress, fps, counts, detections, extra = self.pending
+        self.pending = None
+        self.last_sent = now
+        self.updates_sent += 1
+        self.notify(
+            progress_group(self.analysis_id),
+            dict({
+                'type': 'processing_update',
+                'progress': progress,
+                'fps': fps,
+                'counts': counts,
+            }, **extra)
+        )
+        if detections is not None:
+            self._send_detections(now, progress, detections)
+
+    def _send_detections(self, now, progress, detections):
+        tracks = {detection['track_id']: detection for detection in detections}
+        reset = self.last_keyframe is None or now - self.last_keyframe >= self.keyframe_interval
+        if reset:
+            if not tracks and not self.sent_tracks:
+                return
+            changed, removed = list(tracks.values()), []
+            self.last_keyframe = now
+        else:
+            changed = [detection for track_id, detection in tracks.items()
+                       if self.sent_tracks.get(track_id) != detection]
+            removed = [track_id for track_id in self.sent_tracks if track_id not in tracks]
+            if not changed and not removed:
+                return
+        self.sent_tracks = tracks
+        self.notify(
+            detections_group(self.analysis_id),
+            {
+                'type': 'processing_detections',
+                'progress': progress,
+                'detections': changed,
+                'removed': removed,
+                'reset': reset
+            }
+        )
+
+    def flush(self):
+        """Send the last coalesced update, if it hasn't gone out yet."""
+        if self.pending is not None:
+            self._send(time.monotonic())
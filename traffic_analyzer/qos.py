@@ -0,0 +1,132 @@
+import time
+
+from django.conf import settings
+
+from .backends import default_options
+
+
+def operating_points(imgsz_levels, max_stride, jpeg_qualities):
+    """
+    Operating points from best to cheapest, each one step cheaper than the
+    one before: JPEG quality first, then the inference size, then the
+    frame stride, then JPEG quality down to its minimum.
+    """
+    imgsz_levels = sorted(set(imgsz_levels), reverse=True)
+    qualities = sorted(set(jpeg_qualities), reverse=True)
+    point = {'imgsz': imgsz_levels[0], 'stride': 1, 'jpeg_quality': qualities[0]}
+    points = [dict(point)]
+
+    def step(**changes):
+        point.update(changes)
+        points.append(dict(point))
+
+    if len(qualities) > 2:
+        step(jpeg_quality=qualities[1])
+    for imgsz in imgsz_levels[1:]:
+        step(imgsz=imgsz)
+    for stride in range(2, max_stride + 1):
+        step(stride=stride)
+    for quality in qualities[2:] if len(qualities) > 2 else qualities[1:]:
+        step(jpeg_quality=quality)
+    return points
+
+
+class QualityController:
+    """
+    Keeps one stream inside its real-time budget.
+
+    Every frame reports its per-stage times, its latency from capture to
+    encoded JPEG and whether it was late, i.e. waited more than a frame
+    interval at the target fps before being processed. Every QOS_WINDOW
+    seconds the window is judged. If latency is over QOS_LATENCY_BUDGET_MS
+    or more than a quarter of the frames were late, the stream moves one
+    operating point down the ladder from ``operating_points``. After
+    QOS_RECOVER_WINDOWS windows in a row with latency under 60% of the
+    budget and no late frames, it moves one point back up. A source slower
+    than the target doesn't make frames late, so it isn't degraded for it.
+    """
+
+    def __init__(self, target_fps, max_imgsz, latency_budget=None, imgsz_levels=None, max_stride=None,
+                 jpeg_qualities=None, window=None, recover_windows=None):
+        self.target_fps = target_fps
+        self.latency_budget = (latency_budget or getattr(settings, 'QOS_LATENCY_BUDGET_MS', 200)) / 1000
+        imgsz_levels = imgsz_levels or getattr(settings, 'QOS_IMGSZ_LEVELS', (640, 480, 320))
+        # Never above the size the model was loaded for
+        imgsz_levels = [imgsz for imgsz in imgsz_levels if imgsz <= max_imgsz] or [max_imgsz]
+        self.points = operating_points(
+            imgsz_levels,
+            max_stride or getattr(settings, 'QOS_MAX_STRIDE', 3),
+            jpeg_qualities or getattr(settings, 'QOS_JPEG_QUALITIES', (80, 60, 40))
+        )
+        self.window = window or getattr(settings, 'QOS_WINDOW', 2.0)
+        self.recover_windows = recover_windows or getattr(settings, 'QOS_RECOVER_WINDOWS', 3)
+        self.level = 0
+        self.headroom = 0
+        self.stages = {}
+        self.fps = None
+        self._reset_window(time.monotonic())
+
+    @classmethod
+    def from_settings(cls, target_fps):
+        """A controller for a stream of the default model, or None if QOS_ENABLED is off."""
+        if not getattr(settings, 'QOS_ENABLED', True):
+            return None
+        options = default_options()
+        controller = cls(target_fps, options['imgsz'])
+        if options['backend'] != 'pytorch':
+            # Exported models have a fixed input size
+            controller.points = [point for point in controller.points if point['imgsz'] == options['imgsz']]
+        return controller
+
+    @property
+    def point(self):
+        return self.points[self.level]
+
+    def _reset_window(self, now):
+        self.window_started = now
+        self.window_frames = 0
+        self.window_late = 0
+        self.window_latency = 0.0
+        self.window_stages = {}
+
+    def record(self, latency, late=False, **stages):
+        """Report a published frame: its latency, whether it was late and the seconds each stage took."""
+        self.window_frames += 1
+        self.window_late += bool(late)
+        self.window_latency += latency
+        for stage, seconds in stages.items():
+            if seconds is not None:
+                self.window_stages[stage] = self.window_stages.get(stage, 0.0) + seconds
+
+        now = time.monotonic()
+        elapsed = now - self.window_started
+        if elapsed < self.window:
+            return
+        latency = self.window_latency / self.window_frames
+        late = self.window_late / self.window_frames
+        self.stages = {stage: seconds / self.window_frames for stage, seconds in self.window_stages.items()}
+        self.stages['latency'] = latency
+        self.fps = self.window_frames / elapsed
+        self._reset_window(now)
+
+        if latency > self.latency_budget or late > 0.25:
+            self.headroom = 0
+            self.level = min(self.level + 1, len(self.points) - 1)
+        elif latency < 0.6 * self.latency_budget and late == 0:
+            self.headroom += 1
+            if self.headroom >= self.recover_windows:
+                self.headroom = 0
+                self.level = max(self.level - 1, 0)
+        else:
+            self.headroom = 0
+
+    def describe(self):
+        return dict(
+            self.point,
+            level=self.level,
+            levels=len(self.points),
+            target_fps=self.target_fps,
+            fps=round(self.fps, 1) if self.fps is not None else None,
+            latency_budget_ms=round(self.latency_budget * 1000),
+            stage_ms={stage: round(seconds * 1000, 1) for stage, seconds in self.stages.items()},
+        )
@@ -0,0 +1,78 @@
+import numpy as np
+import cv2
+from django.conf import settings
+
+from .models import DetectionZone
+
+
+def _polygon_area(points):
+    x, y = points[:, 0], points[:, 1]
+    return 0.5 * abs(np.dot(x, np.roll(y, 1)) - np.dot(y, np.roll(x, 1)))
+
+
+class RegionOfInterest:
+    """
+    Limits inference to the part of the frame covered by detection zones.
+
+    Zone coordinates are normalized polygons ([[x, y], ...] with 0..1
+    values). Frames are cropped to the union bounding box of the zones,
+    padded by ROI_PADDING so vehicles on a zone's edge aren't cut off, and
+    the boxes found in the crop are moved back into frame coordinates.
+    Detections whose bottom-centre point lies outside every zone are dropped.
+    """
+
+    def __init__(self, polygons, frame_width, frame_height, padding=None):
+        padding = padding if padding is not None else getattr(settings, 'ROI_PADDING', 0.02)
+        scale = np.array([frame_width, frame_height], dtype=np.float32)
+        self.polygons = [(np.asarray(polygon, dtype=np.float32) * scale) for polygon in polygons]
+
+        points = np.concatenate(self.polygons)
+        pad = padding * scale
+        x1, y1 = np.floor(np.maximum(points.min(axis=0) - pad, 0)).astype(int)
+        x2, y2 = np.ceil(np.minimum(points.max(axis=0) + pad, scale)).astype(int)
+        self.bounds = (int(x1), int(y1), int(x2), int(y2))
+        self.coverage = (x2 - x1) * (y2 - y1) / float(frame_width * frame_height)
+
+    @classmethod
+    def for_analysis(cls, analysis, frame_width, frame_height):
+        """The analysis's region, or None when its zones cover the whole frame."""
+        if not getattr(settings, 'ROI_CROPPING', True) or not frame_width or not frame_height:
+            return None
+        polygons = []
+        for zone in DetectionZone.objects.filter(analysis=analysis):
+            coordinates = zone.get_coordinates()
+            if len(coordinates) < 3:
+                continue
+            polygon = np.clip(np.asarray(coordinates, dtype=np.float32), 0, 1)
+            if _polygon_area(polygon) >= 0.999:
+                # A full frame zone, nothing to crop
+                return None
+            polygons.append(polygon)
+        if not polygons:
+            return None
+        return cls(polygons, frame_width, frame_height)
+
+    def crop(self, frame):
+        x1, y1, x2, y2 = self.bounds
+        return frame[y1:y2, x1:x2]
+
+    def contains(self, x, y):
+        return any(cv2.pointPolygonTest(polygon, (float(x), float(y)), False) >= 0 for polygon in self.polygons)
+
+    def to_frame(self, detections):
+        """
+        Move a DETECTION_DTYPE array found in a crop into frame coordinates,
+        keeping the detections inside a zone.
+        """
+        detections = detections.copy()
+        detections['bbox'] += np.array([self.bounds[0], self.bounds[1]] * 2, dtype=np.float32)
+        bboxes = detections['bbox']
+        inside = [
+            self.contains(x, y)
+            for x, y in zip(((bboxes[:, 0] + bboxes[:, 2]) / 2).tolist(), bboxes[:, 3].tolist())
+        ]
+        return detections[np.array(inside, dtype=bool)]
+
+    def describe(self):
+        """Crop bounds in pixels, the share of the frame they cover and the number of zones, for logging."""
+        return {'bounds': list(self.bounds), 'coverage': round(float(self.coverage), 4), 'zones': len(self.polygons)}
@@ -0,0 +1,105 @@
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import LiveTrafficRollup
+
+ROLLUP_VEHICLE_TYPES = ('bicycle', 'car', 'truck', 'bus', 'motorcycle')
+
+
+def bucket_start(when=None):
+    return (when or timezone.now()).replace(second=0, microsecond=0)
+
+
+class _Bucket:
+    def __init__(self):
+        self.frames = 0
+        self.counts = Counter()
+        self.occupancy = 0
+        self.max_occupancy = 0
+        self.covered = 0.0
+
+    def to_row(self, camera, start):
+        frames = max(self.frames, 1)
+        return LiveTrafficRollup(
+            camera=camera,
+            bucket_start=start,
+            frames=self.frames,
+            bicycle_count=self.counts['bicycle'],
+            car_count=self.counts['car'],
+            truck_count=self.counts['truck'],
+            bus_count=self.counts['bus'],
+            motorcycle_count=self.counts['motorcycle'],
+            avg_occupancy=self.occupancy / frames,
+            max_occupancy=self.max_occupancy,
+            congestion_ratio=self.covered / frames,
+        )
+
+
+class LiveRollupAggregator:
+    """
+    Aggregates live detections per camera and minute in memory.
+
+    ``add()`` is called for every processed frame of a camera. Once a minute
+    has passed its bucket is written as one LiveTrafficRollup row;
+    ``flush_if_due()`` writes every closed bucket with a single bulk insert
+    at most every LIVE_ROLLUP_FLUSH_INTERVAL seconds. ``flush(everything=True)``
+    also writes the buckets still open. They stay in memory, and the full
+    minute overwrites the row when it closes.
+    """
+
+    def __init__(self, flush_interval=None):
+        self.flush_interval = flush_interval or getattr(settings, 'LIVE_ROLLUP_FLUSH_INTERVAL', 60)
+        self.buckets = {}
+        self.lock = threading.Lock()
+        self.last_flush = time.monotonic()
+        self.rows_written = 0
+
+    def add(self, camera, detections, confirmed, frame_size, when=None):
+        """
+        Count one processed frame: the detections in view, the tracks
+        confirmed on it, and the frame's (width, height).
+        """
+        frame_area = max(frame_size[0] * frame_size[1], 1)
+        covered = sum((x2 - x1) * (y2 - y1) for x1, y1, x2, y2 in (d['bbox'] for d in detections))
+        with self.lock:
+            bucket = self.buckets.setdefault((camera, bucket_start(when)), _Bucket())
+            bucket.frames += 1
+            bucket.occupancy += len(detections)
+            bucket.max_occupancy = max(bucket.max_occupancy, len(detections))
+            bucket.covered += min(1.0, covered / frame_area)
+            for track in confirmed:
+                if track.vehicle_type in ROLLUP_VEHICLE_TYPES:
+                    bucket.counts[track.vehicle_type] += 1
+
+    def flush_if_due(self):
+        if time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self, everything=False):
+        current = bucket_start()
+        with self.lock:
+            self.last_flush = time.monotonic()
+            keys = [key for key in self.buckets if everything or key[1] < current]
+            rows = [self.buckets[key].to_row(*key) for key in keys]
+            for key in keys:
+                if key[1] < current:
+                    del self.buckets[key]
+        if not rows:
+            return
+        with transaction.atomic():
+            # A bucket written early by flush(everything=True) is overwritten
+            LiveTrafficRollup.objects.bulk_create(
+                rows,
+                update_conflicts=True,
+                unique_fields=['camera', 'bucket_start'],
+                update_fields=[
+                    'frames', 'bicycle_count', 'car_count', 'truck_count', 'bus_count', 'motorcycle_count',
+                    'avg_occupancy', 'max_occupancy', 'congestion_ratio',
+                ]
+            )
+        self.rows_written += len(rows)
@@ -0,0 +1,47 @@
+import math
+
+
+class FrameSampler:
+    """
+    Decides which frames of a video are run through the model.
+
+    ``frame_stride`` processes every k-th frame; ``sample_fps`` processes a
+    fixed number of frames per second of video time and takes precedence.
+    The decision depends only on the (1-based) frame number, so resumed runs
+    and chunks sample exactly the same frames as a single pass would.
+    """
+
+    def __init__(self, video_fps, frame_stride=1, sample_fps=None):
+        self.video_fps = video_fps or 0
+        self.frame_stride = max(1, int(frame_stride or 1))
+        self.sample_rate = None
+        if sample_fps and self.video_fps and sample_fps < self.video_fps:
+            # Fraction of the video's frames to process
+            self.sample_rate = sample_fps / self.video_fps
+
+    @classmethod
+    def for_analysis(cls, analysis, video_fps):
+        return cls(video_fps, analysis.frame_stride, analysis.sample_fps)
+
+    def should_process(self, frame_number):
+        if self.sample_rate is not None:
+            # Process the first frame of every 1 / sample_fps slice of video time
+            return frame_number == 1 or (
+                math.floor((frame_number - 1) * self.sample_rate)
+                > math.floor((frame_number - 2) * self.sample_rate)
+            )
+        return (frame_number - 1) % self.frame_stride == 0
+
+    @property
+    def scale(self):
+        """Video frames represented by each processed frame."""
+        if self.sample_rate is not None:
+            return 1 / self.sample_rate
+        return self.frame_stride
+
+    def describe(self):
+        return {
+            'frame_stride': self.frame_stride,
+            'sample_fps': self.sample_rate * self.video_fps if self.sample_rate is not None else None,
+            'scale': self.scale,
+        }
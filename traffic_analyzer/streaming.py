@@ -0,0 +1,186 @@
+import asyncio
+import json
+import struct
+import time
+
+from django.conf import settings
+
+# Binary frame messages: a 4 byte big-endian header length, the JSON header,
+# then the JPEG bytes
+HEADER_LENGTH = struct.Struct('!I')
+
+
+def pack_frame(header, jpeg):
+    data = json.dumps(header, separators=(',', ':')).encode('utf-8')
+    return HEADER_LENGTH.pack(len(data)) + data + bytes(jpeg)
+
+
+class AdaptiveQuality:
+    """
+    JPEG quality and frame scale for one viewer.
+
+    Each frame is recorded once the viewer acknowledges it, with the time
+    from sending it to the ack. Sending only queues a message in the
+    server's transport, so the round trip through the viewer is what shows
+    a slow connection or client. When frames were dropped or a round trip
+    took longer than the time allowed, quality is stepped down, then the
+    resolution once quality is at its minimum. After STREAM_RECOVER_FRAMES
+    frames in a row with at least half that time to spare, resolution and
+    then quality are stepped back up.
+    """
+
+    def __init__(self, quality=None, min_quality=None, min_scale=None, recover_frames=None):
+        self.max_quality = quality or getattr(settings, 'STREAM_JPEG_QUALITY', 80)
+        self.min_quality = min_quality or getattr(settings, 'STREAM_MIN_JPEG_QUALITY', 40)
+        self.min_scale = min_scale or getattr(settings, 'STREAM_MIN_SCALE', 0.5)
+        self.recover_frames = recover_frames or getattr(settings, 'STREAM_RECOVER_FRAMES', 30)
+        self.quality = self.max_quality
+        self.scale = 1.0
+        self.headroom = 0
+        self.throughput = None
+        self.round_trip = None
+
+    def record(self, size, seconds, allowed, dropped):
+        """An acknowledged frame of size bytes, its round trip in seconds and the time it was allowed."""
+        if seconds > 0:
+            rate = size / seconds
+            self.throughput = rate if self.throughput is None else 0.8 * self.throughput + 0.2 * rate
+            self.round_trip = seconds if self.round_trip is None else 0.8 * self.round_trip + 0.2 * seconds
+
+        if dropped or seconds > allowed:
+            self.headroom = 0
+            self._degrade()
+        elif seconds < allowed / 2:
+            self.headroom += 1
+            if self.headroom >= self.recover_frames:
+                self.headroom = 0
+                self._recover()
+        else:
+            self.headroom = 0
+
+    def _degrade(self):
+        if self.quality > self.min_quality:
+            self.quality = max(self.min_quality, self.quality - 10)
+        elif self.scale > self.min_scale:
+            self.scale = max(self.min_scale, self.scale - 0.25)
+
+    def _recover(self):
+        if self.scale < 1.0:
+            self.scale = min(1.0, self.scale + 0.25)
+        elif self.quality < self.max_quality:
+            self.quality = min(self.max_quality, self.quality + 5)
+
+    def stats(self):
+        return {
+            'quality': self.quality,
+            'scale': self.scale,
+            'throughput': round(self.throughput) if self.throughput else None,
+            'round_trip_ms': round(self.round_trip * 1000) if self.round_trip else None,
+        }
+
+
+class LatestFrameSender:
+    """
+    Sends frames to one viewer from its own task, keeping only the latest.
+
+    Every frame header gets a ``seq`` number, which the viewer sends back
+    as ``{"action": "frame_ack", "seq": ...}`` once it has shown the frame;
+    the consumer passes it to ``ack()``. At most STREAM_MAX_UNACKED frames
+    are sent without an ack, so a slow viewer can't make the transport
+    buffer grow. ``offer()`` never waits: a frame offered while the viewer
+    has no credit left replaces the one waiting and counts as dropped. A
+    frame not acknowledged within STREAM_ACK_TIMEOUT seconds is given up
+    on, so a lost ack doesn't stall the stream.
+    """
+
+    def __init__(self, send, quality=None, max_unacked=None, ack_timeout=None):
+        self.send = send
+        self.quality = quality or AdaptiveQuality()
+        self.max_unacked = max(1, max_unacked or getattr(settings, 'STREAM_MAX_UNACKED', 2))
+        self.ack_timeout = ack_timeout or getattr(settings, 'STREAM_ACK_TIMEOUT', 2.0)
+        self.pending = None
+        self.ready = asyncio.Event()
+        # seq -> (sent at, size, interval, dropped before it), oldest first
+        self.in_flight = {}
+        self.sequence = 0
+        self.sent = 0
+        self.dropped = 0
+        self.lost = 0
+        self.dropped_since_send = False
+        self.stopped = False
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    def offer(self, header, jpeg, interval):
+        """Queue a frame (its JSON header and JPEG bytes) shown for interval seconds."""
+        if self.pending is not None:
+            self.dropped += 1
+            self.dropped_since_send = True
+        self.pending = (header, jpeg, interval)
+        self.ready.set()
+
+    def ack(self, seq):
+        """The viewer has shown frame seq, and every frame before it, since messages arrive in order."""
+        try:
+            seq = int(seq)
+        except (TypeError, ValueError):
+            return
+        now = time.monotonic()
+        for sent_seq in [sent_seq for sent_seq in self.in_flight if sent_seq <= seq]:
+            sent_at, size, interval, dropped = self.in_flight.pop(sent_seq)
+            # With max_unacked frames in flight, a frame may take that many
+            # intervals to come back before the viewer falls behind
+            self.quality.record(size, now - sent_at, interval * self.max_unacked, dropped)
+        self.ready.set()
+
+    def _expire(self, now):
+        for seq, (sent_at, size, interval, _) in list(self.in_flight.items()):
+            if now - sent_at < self.ack_timeout:
+                break
+            del self.in_flight[seq]
+            self.lost += 1
+            self.quality.record(size, now - sent_at, interval * self.max_unacked, True)
+
+    def _timeout(self, now):
+        # Until the oldest frame in flight is given up on
+        if not self.in_flight:
+            return None
+        sent_at = next(iter(self.in_flight.values()))[0]
+        return max(0, sent_at + self.ack_timeout - now)
+
+    async def _run(self):
+        while not self.stopped:
+            try:
+                await asyncio.wait_for(self.ready.wait(), self._timeout(time.monotonic()))
+            except asyncio.TimeoutError:
+                pass
+            if self.stopped:
+                # wait_for can swallow a cancel that races with the event
+                # (before Python 3.12), so stop() also sets a flag
+                return
+            self.ready.clear()
+            self._expire(time.monotonic())
+            if self.pending is None or len(self.in_flight) >= self.max_unacked:
+                continue
+
+            header, jpeg, interval = self.pending
+            self.pending = None
+            dropped, self.dropped_since_send = self.dropped_since_send, False
+            self.sequence += 1
+            message = pack_frame(dict(header, seq=self.sequence), jpeg)
+            self.in_flight[self.sequence] = (time.monotonic(), len(message), interval, dropped)
+            await self.send(message)
+            self.sent += 1
+
+    async def stop(self):
+        self.stopped = True
+        self.ready.set()
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
@@ -0,0 +1,192 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import threading
+import time
+from unittest import mock
+
+import cv2
+import numpy as np
+from django.test import SimpleTestCase, override_settings
+
+from traffic_analyzer.camera import CameraManager, CameraStream, FrameGrabber, gen
+
+from .test_detection import _Result
+
+
+def _write_video(path, frames=5, fps=25):
+    # A square moving across a small frame, so every frame differs
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), fps, (64, 48))
+    for i in range(frames):
+        frame = np.zeros((48, 64, 3), dtype=np.uint8)
+        frame[10:30, i * 8:i * 8 + 20] = 255
+        writer.write(frame)
+    writer.release()
+
+
+class _StubModel:
+    """Finds one car in every frame and records the size of each batch."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.batches = []
+
+    def __call__(self, frames, **params):
+        self.batches.append(len(frames))
+        time.sleep(self.delay)
+        return [_Result([[10, 10, 30, 30]], [2], [0.9]) for _ in frames]
+
+
+class _BlockingCapture:
+    """A capture whose read() blocks until released by the test."""
+
+    def __init__(self):
+        self.reading = threading.Event()
+        self.unblock = threading.Event()
+        self.released_by = None
+        self.open = True
+
+    def get(self, prop):
+        return 0
+
+    def read(self):
+        self.reading.set()
+        self.unblock.wait()
+        return True, np.zeros((4, 4, 3), dtype=np.uint8)
+
+    def isOpened(self):
+        return self.open
+
+    def release(self):
+        self.open = False
+        self.released_by = threading.current_thread()
+
+
+class FrameGrabberTests(SimpleTestCase):
+    def test_grabber_thread_releases_capture(self):
+        capture = _BlockingCapture()
+        capture.unblock.set()
+        grabber = FrameGrabber(capture)
+        self.assertIsNotNone(grabber.latest(timeout=1.0))
+        self.assertTrue(grabber.stop())
+        self.assertIs(capture.released_by, grabber.thread)
+
+    def test_blocked_read_is_not_released_under_it(self):
+        capture = _BlockingCapture()
+        grabber = FrameGrabber(capture)
+        self.assertTrue(capture.reading.wait(1.0))
+        self.assertFalse(grabber.stop(timeout=0.05))
+        self.assertTrue(capture.open)
+
+        capture.unblock.set()
+        grabber.thread.join(1.0)
+        self.assertFalse(capture.open)
+        self.assertIs(capture.released_by, grabber.thread)
+
+
+@override_settings(LIVE_ROLLUPS=False, QOS_ENABLED=False, MOTION_GATING=False)
+class CameraTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.video = os.path.join(directory, 'loop.avi')
+        _write_video(self.video)
+
+    def manager(self, model, **kwargs):
+        patcher = mock.patch('traffic_analyzer.camera.get_model', return_value=model)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        manager = CameraManager(**kwargs)
+        self.addCleanup(manager.shutdown)
+        return manager
+
+    def test_looped_file_starts_over(self):
+        stream = CameraStream('loop', self.video, loop=True)
+        subscription = stream.subscribe()
+        self.addCleanup(stream.close)
+        # The file has 5 frames; later ones mean it started over
+        self.assertIsNotNone(stream.grabber.latest(after=8, timeout=2.0))
+        subscription.close()
+        self.assertFalse(stream.is_active)
+
+    def test_publishes_annotated_frames(self):
+        manager = self.manager(_StubModel())
+        stream = manager.register('cam', self.video, target_fps=10, loop=True)
+        subscription = stream.subscribe()
+        frame = subscription.wait(timeout=2.0)
+        self.assertIsNotNone(frame)
+        jpeg, stats = frame
+        self.assertTrue(jpeg.startswith(b'\xff\xd8'))
+        self.assertEqual(stats['camera'], 'cam')
+        self.assertEqual(stats['counts']['car'], 1)
+        subscription.close()
+
+    def test_register_rejects_duplicates(self):
+        manager = self.manager(_StubModel())
+        manager.register('cam', self.video)
+        with self.assertRaises(Exception):
+            manager.register('cam', self.video)
+        self.assertEqual([stream.name for stream in manager.all()], ['cam'])
+
+    def test_unregister_wakes_waiting_viewers(self):
+        manager = self.manager(_StubModel())
+        stream = manager.register('cam', self.video, target_fps=10, loop=True)
+        feed = gen(stream)
+        self.assertTrue(next(feed).startswith(b'--frame'))
+        subscription = stream.subscribe()
+
+        def view():
+            # Takes frames until wait() returns None, well before its timeout
+            while subscription.wait(timeout=10.0) is not None:
+                pass
+
+        viewer = threading.Thread(target=view)
+        viewer.start()
+        manager.unregister('cam')
+        viewer.join(2.0)
+        self.assertFalse(viewer.is_alive())
+        self.assertTrue(subscription.closed)
+        # The MJPEG generator ends instead of waiting for frames forever
+        self.assertEqual(list(feed), [])
+        self.assertFalse(stream.is_active)
+        with self.assertRaises(KeyError):
+            manager.get('cam')
+
+    def test_unregister_ends_async_viewers(self):
+        manager = self.manager(_StubModel())
+        stream = manager.register('cam', self.video, target_fps=10, loop=True)
+
+        async def view():
+            subscription = stream.subscribe(asyncio.get_running_loop())
+            self.assertIsNotNone(await asyncio.wait_for(subscription.next(), 2.0))
+            await asyncio.get_running_loop().run_in_executor(None, manager.unregister, 'cam')
+            return await asyncio.wait_for(subscription.next(), 2.0)
+
+        self.assertIsNone(asyncio.run(view()))
+
+    def test_streams_share_a_batched_inference_call(self):
+        # Slower than the target rate, so both streams are due every round
+        model = _StubModel(delay=0.15)
+        manager = self.manager(model)
+        subscriptions = [
+            manager.register(name, self.video, target_fps=10, loop=True).subscribe() for name in ('a', 'b')
+        ]
+        deadline = time.monotonic() + 3.0
+        while 2 not in model.batches and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertIn(2, model.batches)
+        for subscription in subscriptions:
+            subscription.close()
+
+    def test_max_batch_caps_the_batch(self):
+        model = _StubModel(delay=0.05)
+        manager = self.manager(model, max_batch=1)
+        subscriptions = [
+            manager.register(name, self.video, target_fps=10, loop=True).subscribe() for name in ('a', 'b')
+        ]
+        for subscription in subscriptions:
+            self.assertIsNotNone(subscription.wait(timeout=2.0))
+        self.assertEqual(set(model.batches), {1})
+        for subscription in subscriptions:
+            subscription.close()
@@ -0,0 +1,81 @@
+import cv2
+from django.test import TestCase
+
+from traffic_analyzer.models import VehicleCount, VideoAnalysis
+from traffic_analyzer.processing import VideoProcessor, empty_counts
+from traffic_analyzer.tracking import IoUTracker
+
+from .test_chunk_jobs import _track_row
+from .test_tracking import _car
+
+
+class _Capture:
+    """Just enough of a cv2.VideoCapture to seek in."""
+
+    def __init__(self):
+        self.position = 0
+
+    def set(self, prop, value):
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            self.position = int(value)
+        return True
+
+    def get(self, prop):
+        return self.position if prop == cv2.CAP_PROP_POS_FRAMES else 0
+
+
+class CheckpointTests(TestCase):
+    def setUp(self):
+        self.analysis = VideoAnalysis.objects.create(video='videos/test.mp4', video_fps=30)
+        self.processor = VideoProcessor(None, notify=lambda group, message: None)
+
+    def tracker(self):
+        return IoUTracker(max_age=5, min_hits=1)
+
+    def checkpoint_at_frame_50(self):
+        tracker = self.tracker()
+        for frame_number in range(45, 51):
+            tracker.update(frame_number, [_car(100 + frame_number)])
+        counts = dict(empty_counts(), car=3)
+        self.processor._save_checkpoint(self.analysis, 50, counts, tracker)
+        open_id = tracker.tracks[0].track_id
+        # Rows committed before the checkpoint, one still open at it and
+        # ones a failed attempt wrote after it
+        _track_row(self.analysis, 80, 'car', [[10, 0, 0, 10, 10], [20, 0, 0, 10, 10]])
+        _track_row(self.analysis, open_id, 'car', [[45, 0, 0, 10, 10]])
+        _track_row(self.analysis, 90, 'truck', [[40, 0, 0, 10, 10], [60, 0, 0, 10, 10]])
+        _track_row(self.analysis, 91, 'bus', [[55, 0, 0, 10, 10]])
+        return tracker
+
+    def restore(self):
+        analysis = VideoAnalysis.objects.get(id=self.analysis.id)
+        cap, counts, tracker = _Capture(), empty_counts(), self.tracker()
+        frame = self.processor._restore_checkpoint(analysis, cap, counts, tracker)
+        return frame, cap.position, counts, tracker.to_dict()
+
+    def test_restores_counts_tracker_and_position(self):
+        saved = self.checkpoint_at_frame_50()
+        frame, position, counts, tracker_state = self.restore()
+        self.assertEqual((frame, position), (50, 50))
+        self.assertEqual(counts['car'], 3)
+        self.assertEqual(tracker_state, saved.to_dict())
+
+    def test_deletes_rows_the_resume_writes_again(self):
+        self.checkpoint_at_frame_50()
+        self.restore()
+        self.assertEqual(list(VehicleCount.objects.values_list('track_id', flat=True)), [80])
+
+    def test_restoring_twice_is_idempotent(self):
+        self.checkpoint_at_frame_50()
+        first = self.restore()
+        rows = list(VehicleCount.objects.values_list('id', flat=True))
+        self.assertEqual(self.restore(), first)
+        self.assertEqual(list(VehicleCount.objects.values_list('id', flat=True)), rows)
+
+    def test_without_checkpoint_starts_over(self):
+        _track_row(self.analysis, 1, 'car', [[10, 0, 0, 10, 10]])
+        frame, position, counts, tracker_state = self.restore()
+        self.assertEqual((frame, position), (0, 0))
+        self.assertEqual(counts, empty_counts())
+        self.assertEqual(tracker_state['tracks'], [])
+        self.assertFalse(VehicleCount.objects.exists())
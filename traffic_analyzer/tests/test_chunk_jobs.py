@@ -0,0 +1,125 @@
+from django.test import TestCase
+
+from traffic_analyzer import jobs
+from traffic_analyzer.models import ProcessingJob, VehicleCount, VideoAnalysis
+from traffic_analyzer.processing import TRACK_IDS_PER_FRAME, VideoProcessor, empty_counts
+
+
+def _split(analysis, ranges):
+    jobs.enqueue_analysis(analysis)
+    parent = jobs.claim_next_job('worker-1')
+    return parent, jobs.split_job(parent, ranges)
+
+
+def _finish(chunk, counts, tail_tracks=()):
+    ProcessingJob.objects.filter(id=chunk.id).update(status='running', worker_id='worker-1')
+    jobs.update_chunk_progress(chunk.id, chunk.end_frame - chunk.start_frame,
+                               {'vehicle_counts': dict(empty_counts(), **counts), 'tail_tracks': list(tail_tracks)})
+    jobs.finish_job(chunk.id, 'worker-1', 'completed')
+
+
+def _track_row(analysis, track_id, vehicle_type, trajectory, confidence=0.8):
+    first, last = trajectory[0], trajectory[-1]
+    row = VehicleCount(
+        analysis=analysis, track_id=track_id, vehicle_type=vehicle_type, confidence=confidence,
+        frame_number=first[0], last_frame=last[0], hits=len(trajectory),
+        bbox_x1=first[1], bbox_y1=first[2], bbox_x2=first[3], bbox_y2=first[4]
+    )
+    row.set_trajectory(trajectory)
+    row.save()
+    return row
+
+
+class SplitJobTests(TestCase):
+    def setUp(self):
+        self.analysis = VideoAnalysis.objects.create(video='videos/test.mp4', video_fps=30)
+
+    def test_split_queues_one_chunk_per_range(self):
+        parent, queued = _split(self.analysis, [(0, 100), (100, 200)])
+        parent.refresh_from_db()
+        self.assertEqual(parent.status, 'split')
+        self.assertEqual([(chunk.start_frame, chunk.end_frame) for chunk in queued], [(0, 100), (100, 200)])
+        self.assertTrue(all(chunk.parent_id == parent.id and chunk.status == 'queued' for chunk in queued))
+
+    def test_split_needs_the_claiming_worker(self):
+        jobs.enqueue_analysis(self.analysis)
+        parent = jobs.claim_next_job('worker-1')
+        parent.worker_id = 'worker-2'
+        self.assertEqual(jobs.split_job(parent, [(0, 100), (100, 200)]), [])
+        self.assertFalse(ProcessingJob.objects.filter(parent__isnull=False).exists())
+
+    def test_split_carries_over_completed_chunks(self):
+        parent, queued = _split(self.analysis, [(0, 100), (100, 200)])
+        _finish(queued[0], {'car': 4})
+        jobs.fail_parent(parent.id)
+
+        retry, queued = _split(self.analysis, [(0, 100), (100, 200)])
+        self.assertEqual([(chunk.start_frame, chunk.end_frame) for chunk in queued], [(100, 200)])
+        carried = retry.chunks.get(start_frame=0)
+        self.assertEqual((carried.status, carried.frames_processed), ('completed', 100))
+        self.assertEqual(carried.get_result_data()['vehicle_counts']['car'], 4)
+
+    def test_chunk_progress_adds_up(self):
+        parent, queued = _split(self.analysis, [(0, 100), (100, 200)])
+        jobs.update_chunk_progress(queued[0].id, 40)
+        jobs.update_chunk_progress(queued[1].id, 25, {'vehicle_counts': {'car': 1}})
+        self.assertEqual(jobs.chunk_frames_processed(parent.id), 65)
+        queued[1].refresh_from_db()
+        self.assertEqual(queued[1].get_result_data(), {'vehicle_counts': {'car': 1}})
+
+    def test_parent_completes_once_after_last_chunk(self):
+        parent, queued = _split(self.analysis, [(0, 100), (100, 200)])
+        _finish(queued[0], {})
+        self.assertFalse(jobs.complete_parent_if_done(parent.id))
+        _finish(queued[1], {})
+        self.assertTrue(jobs.complete_parent_if_done(parent.id))
+        # Only one of several finishing chunks gets to merge
+        self.assertFalse(jobs.complete_parent_if_done(parent.id))
+        parent.refresh_from_db()
+        self.assertEqual(parent.status, 'completed')
+
+    def test_failed_chunk_fails_parent_and_cancels_the_rest(self):
+        parent, queued = _split(self.analysis, [(0, 100), (100, 200)])
+        ProcessingJob.objects.filter(id=queued[0].id).update(status='running', worker_id='worker-1')
+        jobs.fail_parent(parent.id)
+        parent.refresh_from_db()
+        self.assertEqual(parent.status, 'failed')
+        self.assertEqual(set(parent.chunks.values_list('status', flat=True)), {'cancelled'})
+
+    def test_track_ids_of_late_chunks_fit(self):
+        track_id = 3_000_000 * TRACK_IDS_PER_FRAME + 1
+        row = _track_row(self.analysis, track_id, 'car', [[3_000_001, 0, 0, 10, 10]])
+        self.assertEqual(VehicleCount.objects.get(id=row.id).track_id, track_id)
+
+
+class MergeChunksTests(TestCase):
+    def setUp(self):
+        self.analysis = VideoAnalysis.objects.create(video='videos/test.mp4', video_fps=30)
+        self.events = []
+        self.processor = VideoProcessor(None, notify=lambda group, message: self.events.append(message))
+
+    def test_vehicle_cut_by_boundary_is_counted_once(self):
+        parent, (first, second) = _split(self.analysis, [(0, 100), (100, 200)])
+        head_id = 100 * TRACK_IDS_PER_FRAME + 1
+        _track_row(self.analysis, 1, 'car', [[90, 10, 10, 50, 50], [100, 12, 10, 52, 50]])
+        _track_row(self.analysis, 2, 'truck', [[20, 100, 100, 200, 200]])
+        _track_row(self.analysis, head_id, 'car', [[101, 13, 10, 53, 50], [110, 20, 10, 60, 50]])
+        _finish(first, {'car': 1, 'truck': 1}, tail_tracks=[1])
+        _finish(second, {'car': 1})
+
+        self.processor._merge_chunks(parent.id)
+
+        self.analysis.refresh_from_db()
+        self.assertEqual(self.analysis.status, 'completed')
+        counts = self.analysis.get_results_data()['vehicle_counts']
+        self.assertEqual((counts['car'], counts['truck']), (1, 1))
+        self.assertEqual(VehicleCount.objects.filter(vehicle_type='car').count(), 1)
+        self.assertEqual(self.events[-1]['type'], 'processing_complete')
+
+    def test_waits_for_every_chunk(self):
+        parent, (first, second) = _split(self.analysis, [(0, 100), (100, 200)])
+        _finish(first, {'car': 1})
+        self.processor._merge_chunks(parent.id)
+        self.analysis.refresh_from_db()
+        self.assertEqual(self.analysis.status, 'processing')
+        self.assertEqual(self.events, [])
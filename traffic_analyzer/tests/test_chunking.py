@@ -0,0 +1,42 @@
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from traffic_analyzer.chunking import plan_chunks
+
+
+@override_settings(VIDEO_CHUNKING_MIN_FRAMES=1000, VIDEO_CHUNK_COUNT=None, VIDEO_WORKER_PROCESSES=4)
+class PlanChunksTests(SimpleTestCase):
+    def plan(self, total_frames, keyframes=None, chunk_count=None):
+        with mock.patch('traffic_analyzer.chunking.keyframe_indices', return_value=keyframes):
+            return plan_chunks('video.mp4', total_frames, 30, chunk_count)
+
+    def assertCovers(self, ranges, total_frames):
+        self.assertEqual(ranges[0][0], 0)
+        self.assertEqual(ranges[-1][1], total_frames)
+        for (_, end), (start, _) in zip(ranges, ranges[1:]):
+            self.assertEqual(end, start)
+
+    def test_short_video_is_one_chunk(self):
+        self.assertEqual(self.plan(999), [(0, 999)])
+
+    def test_even_split_without_keyframes(self):
+        ranges = self.plan(10000)
+        self.assertEqual(ranges, [(0, 2500), (2500, 5000), (5000, 7500), (7500, 10000)])
+
+    def test_chunks_are_at_least_half_the_minimum(self):
+        # 1200 frames only make two chunks of at least 500 frames
+        ranges = self.plan(1200)
+        self.assertEqual(len(ranges), 2)
+        self.assertCovers(ranges, 1200)
+
+    def test_boundaries_move_to_keyframes(self):
+        keyframes = list(range(0, 10000, 240))
+        ranges = self.plan(10000, keyframes)
+        self.assertCovers(ranges, 10000)
+        for start, _ in ranges[1:]:
+            self.assertIn(start, keyframes)
+
+    def test_boundaries_snapping_together_are_merged(self):
+        ranges = self.plan(10000, [0, 5000], chunk_count=4)
+        self.assertEqual(ranges, [(0, 5000), (5000, 10000)])
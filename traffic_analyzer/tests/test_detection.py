@@ -0,0 +1,136 @@
+import numpy as np
+from django.test import SimpleTestCase
+
+from traffic_analyzer.detection import (
+    DEFAULT_CLASS_THRESHOLDS, VEHICLE_CLASSES, filter_detections, inference_params, to_detections
+)
+
+
+class _Tensor:
+    # Just enough of a torch tensor for results_to_array
+    def __init__(self, array):
+        self.array = np.asarray(array, dtype=np.float32)
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.array
+
+
+class _Boxes:
+    def __init__(self, xyxy, cls, conf):
+        self.xyxy = _Tensor(np.reshape(xyxy, (-1, 4)))
+        self.cls = _Tensor(cls)
+        self.conf = _Tensor(conf)
+
+    def __len__(self):
+        return len(self.conf.array)
+
+
+class _Result:
+    def __init__(self, xyxy, cls, conf):
+        self.boxes = _Boxes(xyxy, cls, conf)
+
+
+def _iou(a, b):
+    w = max(0.0, min(a[2], b[2]) - max(a[0], b[0]))
+    h = max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = w * h
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def _reference(xyxy, cls, conf, thresholds):
+    """A dedicated confidence filter and greedy NMS per class, written without numpy tricks."""
+    kept = set()
+    for class_id, vehicle_type in VEHICLE_CLASSES.items():
+        if vehicle_type not in thresholds:
+            continue
+        candidates = sorted(
+            (i for i in range(len(conf)) if cls[i] == class_id and conf[i] > thresholds[vehicle_type]['conf']),
+            key=lambda i: -conf[i]
+        )
+        chosen = []
+        for i in candidates:
+            if all(_iou(xyxy[i], xyxy[j]) <= thresholds[vehicle_type]['iou'] for j in chosen):
+                chosen.append(i)
+        kept.update(
+            (class_id, round(float(conf[i]), 4), tuple(round(float(v), 2) for v in xyxy[i])) for i in chosen
+        )
+    return kept
+
+
+def _as_set(detections):
+    return {
+        (int(d['class_id']), round(float(d['confidence']), 4), tuple(round(float(v), 2) for v in d['bbox']))
+        for d in detections
+    }
+
+
+def _synthetic_boxes(rng, clusters=40):
+    # Clusters of jittered, overlapping boxes, as a detector produces them
+    # before NMS, over the vehicle classes plus person (0), which isn't counted
+    xyxy, cls, conf = [], [], []
+    for _ in range(clusters):
+        x, y = rng.uniform(0, 1200), rng.uniform(0, 600)
+        w, h = rng.uniform(20, 200), rng.uniform(20, 150)
+        class_id = rng.choice([0, 1, 2, 3, 5, 7])
+        for _ in range(rng.integers(1, 6)):
+            dx, dy = rng.normal(0, w * 0.1), rng.normal(0, h * 0.1)
+            xyxy.append([x + dx, y + dy, x + dx + w, y + dy + h])
+            cls.append(class_id)
+            conf.append(rng.uniform(0.05, 0.99))
+    return np.float32(xyxy), np.float32(cls), np.float32(conf)
+
+
+class InferenceParamsTests(SimpleTestCase):
+    def test_default_thresholds(self):
+        params = inference_params(DEFAULT_CLASS_THRESHOLDS)
+        self.assertEqual(sorted(params['classes']), sorted(VEHICLE_CLASSES))
+        # The lowest per-class confidence, so bicycles survive the pass
+        self.assertEqual(params['conf'], 0.2)
+        # The classes disagree on IoU, so NMS is left to filter_detections
+        self.assertEqual(params['iou'], 1.0)
+
+    def test_shared_iou_runs_in_the_model(self):
+        thresholds = {vtype: {'conf': 0.4, 'iou': 0.5} for vtype in ('car', 'truck')}
+        params = inference_params(thresholds)
+        self.assertEqual(sorted(params['classes']), [2, 7])
+        self.assertEqual(params['conf'], 0.4)
+        self.assertEqual(params['iou'], 0.5)
+
+
+class FilterDetectionsTests(SimpleTestCase):
+    def test_matches_per_class_reference(self):
+        rng = np.random.default_rng(7)
+        for _ in range(20):
+            xyxy, cls, conf = _synthetic_boxes(rng)
+            detections = filter_detections([_Result(xyxy, cls, conf)], DEFAULT_CLASS_THRESHOLDS)
+            self.assertEqual(_as_set(detections), _reference(xyxy, cls, conf, DEFAULT_CLASS_THRESHOLDS))
+
+    def test_per_class_confidence(self):
+        box = [10, 10, 110, 60]
+        result = _Result([box, box], [1, 2], [0.3, 0.3])
+        detections = filter_detections([result], DEFAULT_CLASS_THRESHOLDS)
+        # 0.3 passes the bicycle threshold (0.2) but not the car one (0.5)
+        self.assertEqual(detections['class_id'].tolist(), [1])
+
+    def test_nms_is_per_class(self):
+        # A car and a truck on the same box don't suppress each other
+        box = [10, 10, 110, 60]
+        result = _Result([box, box, [12, 12, 112, 62]], [2, 7, 2], [0.9, 0.8, 0.7])
+        detections = filter_detections([result], DEFAULT_CLASS_THRESHOLDS)
+        self.assertEqual(sorted(detections['class_id'].tolist()), [2, 7])
+
+    def test_empty_result(self):
+        detections = filter_detections([_Result(np.empty((0, 4)), [], [])], DEFAULT_CLASS_THRESHOLDS)
+        self.assertEqual(len(detections), 0)
+        self.assertEqual(to_detections(detections), [])
+
+    def test_to_detections(self):
+        result = _Result([[10.7, 20.2, 110.9, 60.5]], [5], [0.75])
+        [detection] = to_detections(filter_detections([result], DEFAULT_CLASS_THRESHOLDS))
+        self.assertEqual(detection['type'], 'bus')
+        self.assertEqual(detection['bbox'], [10, 20, 110, 60])
+        self.assertAlmostEqual(detection['confidence'], 0.75, places=5)
@@ -0,0 +1,82 @@
+import asyncio
+import threading
+
+from django.test import SimpleTestCase
+
+from traffic_analyzer.executor import ExecutorBusy, FairExecutor
+
+
+class FairExecutorTests(SimpleTestCase):
+    def test_runs_off_the_event_loop(self):
+        executor = FairExecutor(workers=2, max_pending=2)
+
+        async def main():
+            return await executor.run('a', threading.get_ident)
+
+        self.assertNotEqual(asyncio.run(main()), threading.get_ident())
+
+    def test_tasks_of_a_key_run_one_at_a_time_in_order(self):
+        executor = FairExecutor(workers=4, max_pending=10)
+        running = []
+        order = []
+        overlaps = []
+
+        def work(i):
+            running.append(i)
+            if len(running) > 1:
+                overlaps.append(list(running))
+            threading.Event().wait(0.005)
+            order.append(i)
+            running.remove(i)
+
+        async def main():
+            await asyncio.gather(*(executor.run('a', work, i) for i in range(8)))
+
+        asyncio.run(main())
+        self.assertEqual(order, list(range(8)))
+        self.assertEqual(overlaps, [])
+
+    def test_keys_are_served_round_robin(self):
+        executor = FairExecutor(workers=1, max_pending=10)
+        gate = threading.Event()
+        order = []
+
+        async def main():
+            # The single worker is held, so both keys queue up behind it
+            blocker = asyncio.ensure_future(executor.run('blocker', gate.wait))
+            await asyncio.sleep(0.05)
+            tasks = [asyncio.ensure_future(executor.run('a', order.append, f'a{i}')) for i in range(3)]
+            tasks += [asyncio.ensure_future(executor.run('b', order.append, f'b{i}')) for i in range(3)]
+            await asyncio.sleep(0.05)
+            gate.set()
+            await asyncio.gather(blocker, *tasks)
+
+        asyncio.run(main())
+        self.assertEqual(order, ['a0', 'b0', 'a1', 'b1', 'a2', 'b2'])
+
+    def test_busy_key_raises(self):
+        executor = FairExecutor(workers=1, max_pending=1)
+        gate = threading.Event()
+
+        async def main():
+            blocker = asyncio.ensure_future(executor.run('a', gate.wait))
+            await asyncio.sleep(0.05)
+            queued = asyncio.ensure_future(executor.run('a', lambda: None))
+            await asyncio.sleep(0)
+            try:
+                with self.assertRaises(ExecutorBusy):
+                    await executor.run('a', lambda: None)
+            finally:
+                gate.set()
+                await asyncio.gather(blocker, queued)
+
+        asyncio.run(main())
+
+    def test_errors_reach_the_caller(self):
+        executor = FairExecutor(workers=1, max_pending=1)
+
+        async def main():
+            await executor.run('a', int, 'not a number')
+
+        with self.assertRaises(ValueError):
+            asyncio.run(main())
@@ -0,0 +1,102 @@
+from datetime import timedelta
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from traffic_analyzer import jobs
+from traffic_analyzer.models import ProcessingJob, VideoAnalysis
+
+
+def _analysis():
+    return VideoAnalysis.objects.create(video='videos/test.mp4')
+
+
+def _expire(job):
+    ProcessingJob.objects.filter(id=job.id).update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+
+
+@override_settings(VIDEO_JOB_LEASE_SECONDS=60, VIDEO_JOB_MAX_ATTEMPTS=2, VIDEO_JOB_DEFAULT_PRIORITY=0)
+class JobQueueTests(TestCase):
+    def test_enqueue_reuses_active_job(self):
+        analysis = _analysis()
+        job = jobs.enqueue_analysis(analysis)
+        self.assertEqual(jobs.enqueue_analysis(analysis, priority=5), job)
+        self.assertEqual(ProcessingJob.objects.count(), 1)
+        analysis.refresh_from_db()
+        self.assertEqual(analysis.status, 'processing')
+
+    def test_claims_highest_priority_first(self):
+        low = jobs.enqueue_analysis(_analysis())
+        high = jobs.enqueue_analysis(_analysis(), priority=10)
+        older = jobs.enqueue_analysis(_analysis(), priority=10)
+
+        claimed = jobs.claim_next_job('worker-1')
+        self.assertEqual(claimed, high)
+        self.assertEqual((claimed.status, claimed.worker_id, claimed.attempts), ('running', 'worker-1', 1))
+        self.assertGreater(claimed.lease_expires_at, timezone.now())
+        self.assertEqual(jobs.claim_next_job('worker-2'), older)
+        self.assertEqual(jobs.claim_next_job('worker-1'), low)
+        self.assertIsNone(jobs.claim_next_job('worker-1'))
+
+    def test_heartbeat_extends_lease_of_owner_only(self):
+        jobs.enqueue_analysis(_analysis())
+        job = jobs.claim_next_job('worker-1')
+        _expire(job)
+        self.assertFalse(jobs.heartbeat(job.id, 'worker-2'))
+        self.assertTrue(jobs.heartbeat(job.id, 'worker-1'))
+        job.refresh_from_db()
+        self.assertGreater(job.lease_expires_at, timezone.now())
+
+    def test_expired_lease_is_requeued(self):
+        jobs.enqueue_analysis(_analysis())
+        job = jobs.claim_next_job('worker-1')
+        self.assertEqual(jobs.recover_expired_leases(), 0)
+        _expire(job)
+
+        self.assertEqual(jobs.recover_expired_leases(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.worker_id, job.lease_expires_at), ('queued', None, None))
+        # The old worker lost the job; a new one claims it again
+        self.assertFalse(jobs.heartbeat(job.id, 'worker-1'))
+        self.assertFalse(jobs.finish_job(job.id, 'worker-1', 'completed'))
+        self.assertEqual(jobs.claim_next_job('worker-2').attempts, 2)
+
+    def test_expired_lease_fails_after_max_attempts(self):
+        analysis = _analysis()
+        jobs.enqueue_analysis(analysis)
+        for _ in range(2):
+            job = jobs.claim_next_job('worker-1')
+            _expire(job)
+            jobs.recover_expired_leases()
+
+        job.refresh_from_db()
+        analysis.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(analysis.status, 'failed')
+        self.assertIsNone(jobs.claim_next_job('worker-1'))
+
+    def test_cancel_stops_queued_and_running_jobs(self):
+        queued_analysis, running_analysis = _analysis(), _analysis()
+        jobs.enqueue_analysis(running_analysis, priority=1)
+        queued = jobs.enqueue_analysis(queued_analysis)
+        running = jobs.claim_next_job('worker-1')
+
+        self.assertEqual(jobs.cancel_analysis(queued_analysis), 1)
+        self.assertEqual(jobs.cancel_analysis(running_analysis), 1)
+        queued.refresh_from_db()
+        running_analysis.refresh_from_db()
+        self.assertEqual(queued.status, 'cancelled')
+        self.assertEqual(running_analysis.status, 'cancelled')
+        # The running worker notices at its next heartbeat
+        self.assertFalse(jobs.heartbeat(running.id, 'worker-1'))
+        self.assertIsNone(jobs.claim_next_job('worker-2'))
+        self.assertEqual(jobs.cancel_analysis(queued_analysis), 0)
+
+    @override_settings(VIDEO_QUEUE_MAX_DEPTH=2, VIDEO_QUEUE_MAX_WAIT=None)
+    def test_sheds_load_above_max_depth(self):
+        jobs.enqueue_analysis(_analysis())
+        self.assertFalse(jobs.should_shed_load())
+        jobs.enqueue_analysis(_analysis())
+        stats = jobs.queue_stats()
+        self.assertEqual((stats['queued'], stats['running']), (2, 0))
+        self.assertTrue(jobs.should_shed_load(stats))
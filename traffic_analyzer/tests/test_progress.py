@@ -0,0 +1,69 @@
+from django.test import SimpleTestCase
+
+from traffic_analyzer.progress import ProgressReporter, detections_group
+
+
+def _track(track_id, x):
+    return {'track_id': track_id, 'type': 'car', 'confidence': 0.9, 'bbox': [x, 0, x + 50, 50]}
+
+
+class ProgressReporterTests(SimpleTestCase):
+    def setUp(self):
+        self.messages = []
+        self.reporter = ProgressReporter(
+            1, lambda group, message: self.messages.append((group, message)),
+            rate=1000, keyframe_interval=3600
+        )
+
+    def detections(self):
+        return [message for group, message in self.messages if group == detections_group(1)]
+
+    def publish(self, detections):
+        # Past the update interval, so every call sends
+        self.reporter.last_sent -= 1
+        self.reporter.update(0.5, 10.0, {'car': len(detections)}, detections)
+
+    def test_coalesces_updates_between_sends(self):
+        self.reporter.update(0.1, 10.0, {'car': 1})
+        self.reporter.update(0.2, 10.0, {'car': 2})
+        self.assertEqual(self.reporter.updates_sent, 1)
+        self.reporter.flush()
+        self.assertEqual(self.messages[-1][1]['progress'], 0.2)
+        self.assertEqual(self.reporter.updates_sent, 2)
+
+    def test_first_message_is_the_full_set(self):
+        self.publish([_track(1, 0), _track(2, 100)])
+        (message,) = self.detections()
+        self.assertTrue(message['reset'])
+        self.assertEqual([detection['track_id'] for detection in message['detections']], [1, 2])
+
+    def test_sends_only_changed_and_removed_tracks(self):
+        self.publish([_track(1, 0), _track(2, 100), _track(3, 200)])
+        self.publish([_track(1, 0), _track(2, 105), _track(4, 300)])
+        message = self.detections()[-1]
+        self.assertFalse(message['reset'])
+        self.assertEqual([detection['track_id'] for detection in message['detections']], [2, 4])
+        self.assertEqual(message['removed'], [3])
+
+    def test_skips_unchanged_detections(self):
+        self.publish([_track(1, 0)])
+        self.publish([_track(1, 0)])
+        self.publish([])
+        self.publish([])
+        self.assertEqual([message['removed'] for message in self.detections()], [[], [1]])
+        # Progress still goes out every time
+        self.assertEqual(self.reporter.updates_sent, 4)
+
+    def test_sends_full_set_after_keyframe_interval(self):
+        self.publish([_track(1, 0), _track(2, 100)])
+        self.reporter.last_keyframe -= 3600
+        self.publish([_track(1, 0), _track(2, 100)])
+        message = self.detections()[-1]
+        self.assertTrue(message['reset'])
+        self.assertEqual(len(message['detections']), 2)
+
+    def test_no_detections_no_message(self):
+        self.publish([])
+        self.reporter.update(0.6, 10.0, {})
+        self.reporter.flush()
+        self.assertEqual(self.detections(), [])
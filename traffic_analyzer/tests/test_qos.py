@@ -0,0 +1,65 @@
+from django.test import SimpleTestCase
+
+from traffic_analyzer.qos import QualityController, operating_points
+
+
+class OperatingPointsTests(SimpleTestCase):
+    def test_ladder(self):
+        points = operating_points((640, 320), 2, (80, 60, 40))
+        self.assertEqual(points, [
+            {'imgsz': 640, 'stride': 1, 'jpeg_quality': 80},
+            {'imgsz': 640, 'stride': 1, 'jpeg_quality': 60},
+            {'imgsz': 320, 'stride': 1, 'jpeg_quality': 60},
+            {'imgsz': 320, 'stride': 2, 'jpeg_quality': 60},
+            {'imgsz': 320, 'stride': 2, 'jpeg_quality': 40},
+        ])
+
+    def test_single_level(self):
+        self.assertEqual(operating_points((640,), 1, (80,)), [{'imgsz': 640, 'stride': 1, 'jpeg_quality': 80}])
+
+
+class QualityControllerTests(SimpleTestCase):
+    def controller(self):
+        # A tiny window so every recorded frame closes one
+        return QualityController(
+            15, 640, latency_budget=100, imgsz_levels=(640, 320), max_stride=2,
+            jpeg_qualities=(80, 60, 40), window=1e-9, recover_windows=2
+        )
+
+    def test_sizes_above_the_model_are_dropped(self):
+        controller = QualityController(15, 480, imgsz_levels=(640, 480, 320))
+        self.assertEqual({point['imgsz'] for point in controller.points}, {480, 320})
+
+    def test_degrades_over_budget_and_recovers(self):
+        controller = self.controller()
+        controller.record(0.2)
+        controller.record(0.2)
+        self.assertEqual(controller.level, 2)
+        self.assertEqual(controller.point['imgsz'], 320)
+
+        # Under 60% of the budget for recover_windows windows per step up
+        for _ in range(4):
+            controller.record(0.01)
+        self.assertEqual(controller.level, 0)
+
+    def test_late_frames_degrade(self):
+        controller = self.controller()
+        controller.record(0.01, late=True)
+        self.assertEqual(controller.level, 1)
+
+    def test_never_past_the_ends(self):
+        controller = self.controller()
+        for _ in range(20):
+            controller.record(1.0)
+        self.assertEqual(controller.level, len(controller.points) - 1)
+        for _ in range(100):
+            controller.record(0.0)
+        self.assertEqual(controller.level, 0)
+
+    def test_describe(self):
+        controller = self.controller()
+        controller.record(0.05, decode=0.01, inference=None)
+        description = controller.describe()
+        self.assertEqual(description['latency_budget_ms'], 100)
+        self.assertEqual(description['stage_ms']['decode'], 10.0)
+        self.assertNotIn('inference', description['stage_ms'])
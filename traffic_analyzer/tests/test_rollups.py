@@ -0,0 +1,71 @@
+from datetime import timedelta
+from types import SimpleNamespace
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from traffic_analyzer.models import LiveTrafficRollup
+from traffic_analyzer.rollups import LiveRollupAggregator, bucket_start
+
+
+def _detection(x, width=50):
+    return {'type': 'car', 'confidence': 0.9, 'bbox': [x, 0, x + width, 50]}
+
+
+def _confirmed(*vehicle_types):
+    return [SimpleNamespace(vehicle_type=vehicle_type) for vehicle_type in vehicle_types]
+
+
+class LiveRollupAggregatorTests(TestCase):
+    def setUp(self):
+        self.aggregator = LiveRollupAggregator(flush_interval=60)
+        self.earlier = timezone.now() - timedelta(minutes=2)
+
+    def test_flush_writes_closed_minutes(self):
+        self.aggregator.add('north', [_detection(0), _detection(100)], _confirmed('car', 'truck'), (200, 100),
+                            when=self.earlier)
+        self.aggregator.add('north', [], _confirmed(), (200, 100), when=self.earlier)
+        self.aggregator.add('south', [_detection(0)], _confirmed('bus', 'person'), (200, 100), when=self.earlier)
+        self.aggregator.add('north', [_detection(0)], _confirmed('car'), (200, 100))
+
+        with CaptureQueriesContext(connection) as queries:
+            self.aggregator.flush()
+        # Every closed bucket in one bulk insert
+        self.assertEqual(len([query for query in queries.captured_queries if 'INSERT' in query['sql']]), 1)
+
+        north = LiveTrafficRollup.objects.get(camera='north')
+        self.assertEqual(north.bucket_start, bucket_start(self.earlier))
+        self.assertEqual((north.frames, north.car_count, north.truck_count), (2, 1, 1))
+        self.assertEqual((north.avg_occupancy, north.max_occupancy), (1.0, 2))
+        self.assertAlmostEqual(north.congestion_ratio, 0.125)
+        south = LiveTrafficRollup.objects.get(camera='south')
+        self.assertEqual((south.bus_count, south.car_count), (1, 0))
+        # The open minute stays in memory
+        self.assertEqual(list(self.aggregator.buckets), [('north', bucket_start())])
+        self.assertEqual(self.aggregator.rows_written, 2)
+
+    def test_open_minute_is_overwritten_when_it_closes(self):
+        now = timezone.now()
+        self.aggregator.add('north', [_detection(0)], _confirmed('car'), (200, 100), when=now)
+        self.aggregator.flush(everything=True)
+        self.assertEqual(LiveTrafficRollup.objects.get().frames, 1)
+
+        self.aggregator.add('north', [_detection(0)], _confirmed('car'), (200, 100), when=now)
+        self.aggregator.flush(everything=True)
+        row = LiveTrafficRollup.objects.get()
+        self.assertEqual((row.frames, row.car_count), (2, 2))
+
+    def test_flush_if_due_waits_for_interval(self):
+        self.aggregator.add('north', [], _confirmed('car'), (200, 100), when=self.earlier)
+        self.aggregator.flush_if_due()
+        self.assertFalse(LiveTrafficRollup.objects.exists())
+        self.aggregator.last_flush -= 60
+        self.aggregator.flush_if_due()
+        self.assertEqual(LiveTrafficRollup.objects.count(), 1)
+
+    def test_flush_without_frames_writes_nothing(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.aggregator.flush(everything=True)
+        self.assertEqual(queries.captured_queries, [])
@@ -0,0 +1,46 @@
+from django.test import SimpleTestCase
+
+from traffic_analyzer.sampling import FrameSampler
+
+
+class FrameSamplerTests(SimpleTestCase):
+    def processed(self, sampler, frames=60):
+        return [frame for frame in range(1, frames + 1) if sampler.should_process(frame)]
+
+    def test_every_frame_by_default(self):
+        sampler = FrameSampler(30)
+        self.assertEqual(self.processed(sampler), list(range(1, 61)))
+        self.assertEqual(sampler.scale, 1)
+
+    def test_frame_stride(self):
+        sampler = FrameSampler(30, frame_stride=4)
+        self.assertEqual(self.processed(sampler, 13), [1, 5, 9, 13])
+        self.assertEqual(sampler.scale, 4)
+
+    def test_invalid_stride_processes_every_frame(self):
+        for stride in (0, None, -3):
+            self.assertEqual(FrameSampler(30, frame_stride=stride).frame_stride, 1)
+
+    def test_sample_fps(self):
+        sampler = FrameSampler(30, sample_fps=5)
+        processed = self.processed(sampler, 300)
+        self.assertEqual(len(processed), 50)
+        self.assertEqual(processed[:3], [1, 7, 13])
+        self.assertAlmostEqual(sampler.scale, 6)
+
+    def test_sample_fps_takes_precedence(self):
+        sampler = FrameSampler(30, frame_stride=2, sample_fps=10)
+        self.assertEqual(len(self.processed(sampler, 30)), 10)
+
+    def test_sample_fps_at_or_above_video_fps(self):
+        sampler = FrameSampler(25, sample_fps=30)
+        self.assertIsNone(sampler.sample_rate)
+        self.assertEqual(len(self.processed(sampler, 50)), 50)
+
+    def test_decision_depends_only_on_frame_number(self):
+        # Chunks and resumed runs ask about frames out of a single pass's
+        # order and must get the same answers
+        sampler = FrameSampler(29.97, sample_fps=7)
+        forward = self.processed(sampler, 500)
+        backward = sorted(frame for frame in range(500, 0, -1) if sampler.should_process(frame))
+        self.assertEqual(forward, backward)
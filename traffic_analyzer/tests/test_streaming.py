@@ -0,0 +1,124 @@
+import asyncio
+import json
+
+from django.test import SimpleTestCase
+
+from traffic_analyzer.streaming import HEADER_LENGTH, AdaptiveQuality, LatestFrameSender, pack_frame
+
+
+def _unpack(message):
+    (length,) = HEADER_LENGTH.unpack_from(message)
+    header = json.loads(message[HEADER_LENGTH.size:HEADER_LENGTH.size + length])
+    return header, message[HEADER_LENGTH.size + length:]
+
+
+class PackFrameTests(SimpleTestCase):
+    def test_round_trip(self):
+        header, jpeg = _unpack(pack_frame({'frame_number': 3}, b'\xff\xd8jpeg'))
+        self.assertEqual(header, {'frame_number': 3})
+        self.assertEqual(jpeg, b'\xff\xd8jpeg')
+
+
+class AdaptiveQualityTests(SimpleTestCase):
+    def quality(self):
+        return AdaptiveQuality(quality=80, min_quality=40, min_scale=0.5, recover_frames=3)
+
+    def test_degrades_quality_then_scale(self):
+        quality = self.quality()
+        for _ in range(4):
+            quality.record(1000, 0.2, 0.1, dropped=False)
+        self.assertEqual((quality.quality, quality.scale), (40, 1.0))
+        quality.record(1000, 0.01, 0.1, dropped=True)
+        self.assertEqual((quality.quality, quality.scale), (40, 0.75))
+
+    def test_recovers_scale_then_quality(self):
+        quality = self.quality()
+        quality.quality, quality.scale = 40, 0.75
+        for _ in range(6):
+            quality.record(1000, 0.01, 0.1, dropped=False)
+        self.assertEqual((quality.quality, quality.scale), (45, 1.0))
+
+
+class LatestFrameSenderTests(SimpleTestCase):
+    def run_sender(self, scenario, **kwargs):
+        sent = []
+
+        async def send(message):
+            sent.append(_unpack(message)[0])
+
+        async def main():
+            sender = LatestFrameSender(send, quality=AdaptiveQuality(recover_frames=100), **kwargs)
+            sender.start()
+            try:
+                await scenario(sender)
+            finally:
+                await sender.stop()
+            return sender
+
+        return asyncio.run(main()), sent
+
+    def test_waits_for_acks(self):
+        async def scenario(sender):
+            for i in range(5):
+                sender.offer({'frame_number': i}, b'', 1 / 30)
+                await asyncio.sleep(0.01)
+
+        sender, sent = self.run_sender(scenario, max_unacked=2, ack_timeout=10)
+        # Two frames went out unacked; the rest replaced each other waiting
+        self.assertEqual([header['frame_number'] for header in sent], [0, 1])
+        self.assertEqual([header['seq'] for header in sent], [1, 2])
+        self.assertEqual(sender.dropped, 2)
+        self.assertIsNotNone(sender.pending)
+
+    def test_ack_sends_the_latest_frame(self):
+        async def scenario(sender):
+            for i in range(4):
+                sender.offer({'frame_number': i}, b'', 1 / 30)
+                await asyncio.sleep(0.01)
+            sender.ack(1)
+            await asyncio.sleep(0.01)
+
+        sender, sent = self.run_sender(scenario, max_unacked=1, ack_timeout=10)
+        self.assertEqual([header['frame_number'] for header in sent], [0, 3])
+        self.assertEqual(sender.in_flight.keys(), {2})
+
+    def test_ack_covers_earlier_frames(self):
+        async def scenario(sender):
+            for i in range(2):
+                sender.offer({'frame_number': i}, b'', 1 / 30)
+                await asyncio.sleep(0.01)
+            sender.ack(2)
+
+        sender, _ = self.run_sender(scenario, max_unacked=2, ack_timeout=10)
+        self.assertEqual(sender.in_flight, {})
+
+    def test_slow_acks_lower_quality(self):
+        async def scenario(sender):
+            sender.offer({}, b'', 0.01)
+            await asyncio.sleep(0.05)
+            sender.ack(1)
+
+        sender, _ = self.run_sender(scenario, max_unacked=1, ack_timeout=10)
+        self.assertLess(sender.quality.quality, sender.quality.max_quality)
+
+    def test_lost_ack_frees_the_slot(self):
+        async def scenario(sender):
+            sender.offer({'frame_number': 0}, b'', 1 / 30)
+            await asyncio.sleep(0.01)
+            sender.offer({'frame_number': 1}, b'', 1 / 30)
+            # Frame 0 is given up on at 0.2 s, frame 1 not before 0.4 s
+            await asyncio.sleep(0.3)
+
+        sender, sent = self.run_sender(scenario, max_unacked=1, ack_timeout=0.2)
+        self.assertEqual([header['frame_number'] for header in sent], [0, 1])
+        self.assertEqual(sender.lost, 1)
+
+    def test_bad_ack_is_ignored(self):
+        async def scenario(sender):
+            sender.offer({}, b'', 1 / 30)
+            await asyncio.sleep(0.01)
+            sender.ack('not a number')
+            sender.ack(None)
+
+        sender, _ = self.run_sender(scenario, max_unacked=1, ack_timeout=10)
+        self.assertEqual(sender.in_flight.keys(), {1})
@@ -0,0 +1,183 @@
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from traffic_analyzer.models import ProcessingJob, VehicleCount, VideoAnalysis
+from traffic_analyzer.processing import TRACK_IDS_PER_FRAME, VideoProcessor
+from traffic_analyzer.sampling import FrameSampler
+from traffic_analyzer.tracking import IoUTracker
+
+from .test_chunk_jobs import _track_row
+
+
+def _car(x, confidence=0.9, vehicle_type='car'):
+    return {'type': vehicle_type, 'confidence': confidence, 'bbox': [x, 100, x + 80, 150]}
+
+
+class IoUTrackerTests(SimpleTestCase):
+    def tracker(self, **kwargs):
+        options = {'max_age': 2, 'min_hits': 3}
+        options.update(kwargs)
+        return IoUTracker(**options)
+
+    def test_follows_a_moving_vehicle(self):
+        tracker = self.tracker()
+        track_ids = set()
+        confirmed_on = []
+        for frame in range(1, 11):
+            tracked, confirmed, finished = tracker.update(frame, [_car(10 + 5 * frame)])
+            track_ids.update(d['track_id'] for d in tracked)
+            confirmed_on += [frame for _ in confirmed]
+            self.assertEqual(finished, [])
+        self.assertEqual(len(track_ids), 1)
+        # Counted once, on its min_hits-th frame
+        self.assertEqual(confirmed_on, [3])
+
+    def test_two_vehicles_keep_their_tracks(self):
+        tracker = self.tracker()
+        for frame in range(1, 6):
+            tracked, _, _ = tracker.update(frame, [_car(10 + 5 * frame), _car(400 - 5 * frame)])
+            ids = {d['bbox'][0] < 200: d['track_id'] for d in tracked}
+            if frame == 1:
+                first = ids
+            self.assertEqual(ids, first)
+
+    def test_types_are_not_mixed(self):
+        tracker = self.tracker()
+        tracker.update(1, [_car(10)])
+        tracked, _, _ = tracker.update(2, [_car(10, vehicle_type='truck')])
+        self.assertEqual(tracked[0]['track_id'], 2)
+
+    def test_low_confidence_detection_continues_a_track(self):
+        tracker = self.tracker()
+        tracker.update(1, [_car(10)])
+        tracked, _, _ = tracker.update(2, [_car(12, confidence=0.2)])
+        self.assertEqual(tracked[0]['track_id'], 1)
+
+    def test_track_ends_after_max_age(self):
+        tracker = self.tracker()
+        for frame in range(1, 4):
+            tracker.update(frame, [_car(10)])
+        # Missed on frames 4 and 5 is within max_age, 6 is one too many
+        for frame in (4, 5):
+            self.assertEqual(tracker.update(frame, [])[2], [])
+        _, _, finished = tracker.update(6, [])
+        self.assertEqual([track.hits for track in finished], [3])
+        self.assertEqual(tracker.tracks, [])
+
+    def test_unconfirmed_track_is_dropped(self):
+        tracker = self.tracker()
+        tracker.update(1, [_car(10)])
+        finished = []
+        for frame in range(2, 6):
+            finished += tracker.update(frame, [])[2]
+        self.assertEqual(finished, [])
+        self.assertEqual(tracker.flush(), [])
+
+    def test_prediction_across_a_frame_gap(self):
+        # After frames 1 and 3 the box moves 60 px per 10 frame gap, too far
+        # to overlap enough unless the track's velocity predicts it
+        tracker = self.tracker()
+        ids = set()
+        for frame in [1, 3] + list(range(13, 64, 10)):
+            tracked, _, _ = tracker.update(frame, [_car(10 + 6 * frame)])
+            ids.update(d['track_id'] for d in tracked)
+        self.assertEqual(len(ids), 1)
+
+    def test_restore_continues_tracks(self):
+        tracker = self.tracker()
+        for frame in range(1, 4):
+            tracker.update(frame, [_car(10 + 5 * frame)])
+        restored = self.tracker()
+        restored.restore(tracker.to_dict())
+        tracked, _, _ = restored.update(4, [_car(30)])
+        self.assertEqual(tracked[0]['track_id'], 1)
+        self.assertEqual(restored.next_id, 2)
+
+
+@override_settings(TRACKER_MAX_AGE=30, TRACKER_MIN_HITS=3)
+class TrackerStrideTests(SimpleTestCase):
+    def test_every_frame(self):
+        tracker = IoUTracker.for_sampler(FrameSampler(30, frame_stride=1))
+        self.assertEqual((tracker.max_age, tracker.min_hits), (30, 3))
+
+    def test_stride_scales_thresholds(self):
+        tracker = IoUTracker.for_sampler(FrameSampler(30, frame_stride=5))
+        self.assertEqual(tracker.max_age, 6)
+        # Still two sightings, so one-frame false positives aren't counted
+        self.assertEqual(tracker.min_hits, 2)
+
+    def test_sample_fps_scales_thresholds(self):
+        # 3 of 30 fps is one processed frame per 10 video frames
+        tracker = IoUTracker.for_sampler(FrameSampler(30, sample_fps=3))
+        self.assertEqual((tracker.max_age, tracker.min_hits), (3, 2))
+
+    def test_same_wall_clock_end_at_any_stride(self):
+        # A vehicle seen on the first processed frames and then gone ends
+        # about TRACKER_MAX_AGE video frames later, whatever the stride
+        for stride in (1, 2, 5, 10):
+            sampler = FrameSampler(30, frame_stride=stride)
+            tracker = IoUTracker.for_sampler(sampler)
+            frames = [f for f in range(1, 400) if sampler.should_process(f)]
+            ended_at = None
+            for i, frame in enumerate(frames):
+                detections = [_car(10)] if i < 3 else []
+                if tracker.update(frame, detections)[2]:
+                    ended_at = frame
+                    break
+            last_seen = frames[2]
+            self.assertIsNotNone(ended_at)
+            self.assertLessEqual(abs((ended_at - last_seen) - 30), stride)
+
+    def test_next_id(self):
+        tracker = IoUTracker.for_sampler(FrameSampler(30, frame_stride=2), next_id=5001)
+        self.assertEqual(tracker.update(1, [_car(10)])[0][0]['track_id'], 5001)
+
+
+@override_settings(TRACKER_MAX_AGE=30, TRACKER_IOU_THRESHOLD=0.3)
+class StitchChunksTests(TestCase):
+    def setUp(self):
+        self.analysis = VideoAnalysis.objects.create(video='videos/test.mp4', video_fps=30)
+        self.processor = VideoProcessor(None, notify=lambda group, message: None)
+        self.head_id = 100 * TRACK_IDS_PER_FRAME + 1
+
+    def stitch(self, tail_tracks):
+        chunks = [ProcessingJob(start_frame=0, end_frame=100), ProcessingJob(start_frame=100, end_frame=200)]
+        chunks[0].set_result_data({'tail_tracks': tail_tracks})
+        return self.processor._stitch_chunks(self.analysis, chunks, FrameSampler(30))
+
+    def test_joins_track_cut_by_boundary(self):
+        _track_row(self.analysis, 1, 'car', [[90, 10, 10, 50, 50], [100, 12, 10, 52, 50]], confidence=0.9)
+        _track_row(self.analysis, self.head_id, 'car', [[101, 13, 10, 53, 50], [110, 20, 10, 60, 50]])
+
+        self.assertEqual(self.stitch([1]), ['car'])
+        row = VehicleCount.objects.get()
+        # The head row keeps the later chunk's track id and takes over the tail
+        self.assertEqual((row.track_id, row.frame_number, row.last_frame, row.hits), (self.head_id, 90, 110, 4))
+        self.assertEqual((row.confidence, row.bbox_x1), (0.9, 10))
+        self.assertEqual([point[0] for point in row.get_trajectory()], [90, 100, 101, 110])
+
+    def test_keeps_different_types_apart(self):
+        _track_row(self.analysis, 1, 'car', [[100, 12, 10, 52, 50]])
+        _track_row(self.analysis, self.head_id, 'truck', [[101, 13, 10, 53, 50]])
+        self.assertEqual(self.stitch([1]), [])
+        self.assertEqual(VehicleCount.objects.count(), 2)
+
+    def test_ignores_tracks_starting_after_the_window(self):
+        _track_row(self.analysis, 1, 'car', [[100, 12, 10, 52, 50]])
+        _track_row(self.analysis, self.head_id, 'car', [[150, 13, 10, 53, 50]])
+        self.assertEqual(self.stitch([1]), [])
+
+    def test_ignores_closed_tracks(self):
+        _track_row(self.analysis, 1, 'car', [[100, 12, 10, 52, 50]])
+        _track_row(self.analysis, self.head_id, 'car', [[101, 13, 10, 53, 50]])
+        self.assertEqual(self.stitch([]), [])
+
+    def test_joins_each_tail_with_its_best_match(self):
+        _track_row(self.analysis, 1, 'car', [[100, 10, 10, 50, 50]])
+        _track_row(self.analysis, self.head_id, 'car', [[101, 25, 10, 65, 50]])
+        _track_row(self.analysis, self.head_id + 1, 'car', [[101, 11, 10, 51, 50]])
+
+        self.assertEqual(self.stitch([1]), ['car'])
+        self.assertEqual(
+            sorted(VehicleCount.objects.values_list('track_id', 'frame_number')),
+            [(self.head_id, 101), (self.head_id + 1, 100)]
+        )
@@ -0,0 +1,68 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from traffic_analyzer.models import VehicleCount, VideoAnalysis
+from traffic_analyzer.tracking import Track
+from traffic_analyzer.writers import DetectionWriter
+
+
+def _track(track_id, frame_number=1):
+    track = Track(track_id, 'car', [10, 20, 50, 60], 0.8, frame_number)
+    track.update([12, 20, 52, 60], 0.9, frame_number + 1, trajectory_interval=1, trajectory_points=10)
+    return track
+
+
+def _inserts(queries):
+    return [query for query in queries if query['sql'].startswith('INSERT')]
+
+
+class DetectionWriterTests(TestCase):
+    def setUp(self):
+        self.analysis = VideoAnalysis.objects.create(video='videos/test.mp4')
+
+    def writer(self, batch_size=3, flush_interval=60000):
+        return DetectionWriter(self.analysis.id, batch_size=batch_size, flush_interval=flush_interval)
+
+    def test_buffers_until_batch_size(self):
+        writer = self.writer()
+        with CaptureQueriesContext(connection) as queries:
+            writer.add_track(_track(1))
+            writer.add_track(_track(2))
+        self.assertEqual(_inserts(queries.captured_queries), [])
+        self.assertEqual(VehicleCount.objects.count(), 0)
+
+        with CaptureQueriesContext(connection) as queries:
+            writer.add_track(_track(3))
+        # One bulk insert for the whole batch
+        self.assertEqual(len(_inserts(queries.captured_queries)), 1)
+        self.assertEqual(VehicleCount.objects.count(), 3)
+        self.assertEqual(writer.rows_written, 3)
+        self.assertEqual(writer.buffer, [])
+
+    def test_flushes_when_interval_passed(self):
+        writer = self.writer(batch_size=100, flush_interval=1)
+        writer.last_flush -= 1
+        writer.add_track(_track(1))
+        self.assertEqual(VehicleCount.objects.count(), 1)
+
+    def test_close_writes_the_rest(self):
+        writer = self.writer()
+        for track_id in range(1, 5):
+            writer.add_track(_track(track_id))
+        self.assertEqual(VehicleCount.objects.count(), 3)
+        writer.close()
+        self.assertEqual(VehicleCount.objects.count(), 4)
+        self.assertEqual(writer.rows_written, 4)
+        with CaptureQueriesContext(connection) as queries:
+            writer.close()
+        self.assertEqual(queries.captured_queries, [])
+
+    def test_row_summarizes_track(self):
+        writer = self.writer()
+        writer.add_track(_track(7, frame_number=5), video_time=2.5)
+        writer.close()
+        row = VehicleCount.objects.get()
+        self.assertEqual((row.track_id, row.frame_number, row.last_frame, row.hits), (7, 5, 6, 2))
+        self.assertEqual((row.confidence, row.bbox_x1, row.video_time), (0.9, 12, 2.5))
+        self.assertEqual(row.get_trajectory(), [[5, 10, 20, 50, 60], [6, 12, 20, 52, 60]])
@@ -0,0 +1,192 @@
+import math
+
+import numpy as np
+from django.conf import settings
+
+from .detection import box_iou
+
+
+class Track:
+    """One vehicle followed across frames."""
+
+    def __init__(self, track_id, vehicle_type, bbox, confidence, frame_number):
+        self.track_id = track_id
+        self.vehicle_type = vehicle_type
+        self.bbox = list(bbox)
+        self.velocity = [0.0, 0.0, 0.0, 0.0]
+        self.confidence = confidence
+        self.best_bbox = list(bbox)
+        self.first_frame = frame_number
+        self.last_frame = frame_number
+        self.hits = 1
+        self.missed = 0
+        # Sampled [frame, x1, y1, x2, y2] observations, always including the
+        # first and the latest one
+        self.trajectory = [[frame_number] + list(bbox)]
+
+    def predict(self, frame_number):
+        """Box expected at frame_number, moving at the last observed velocity."""
+        gap = frame_number - self.last_frame
+        return [coord + v * gap for coord, v in zip(self.bbox, self.velocity)]
+
+    def update(self, bbox, confidence, frame_number, trajectory_interval, trajectory_points):
+        gap = max(1, frame_number - self.last_frame)
+        self.velocity = [(new - old) / gap for new, old in zip(bbox, self.bbox)]
+        self.bbox = list(bbox)
+        if confidence > self.confidence:
+            self.confidence = confidence
+            self.best_bbox = list(bbox)
+        self.last_frame = frame_number
+        self.hits += 1
+        self.missed = 0
+
+        point = [frame_number] + list(bbox)
+        if len(self.trajectory) > 1 and frame_number - self.trajectory[-2][0] < trajectory_interval:
+            # Keep moving the latest point until the interval has passed
+            self.trajectory[-1] = point
+        else:
+            self.trajectory.append(point)
+        if len(self.trajectory) > trajectory_points:
+            self.trajectory = self.trajectory[:-1:2] + [self.trajectory[-1]]
+
+    def to_dict(self):
+        return {
+            'track_id': self.track_id,
+            'vehicle_type': self.vehicle_type,
+            'bbox': self.bbox,
+            'velocity': self.velocity,
+            'confidence': self.confidence,
+            'best_bbox': self.best_bbox,
+            'first_frame': self.first_frame,
+            'last_frame': self.last_frame,
+            'hits': self.hits,
+            'missed': self.missed,
+            'trajectory': self.trajectory,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        track = cls(data['track_id'], data['vehicle_type'], data['bbox'], data['confidence'], data['first_frame'])
+        for key in ('velocity', 'best_bbox', 'last_frame', 'hits', 'missed', 'trajectory'):
+            setattr(track, key, data[key])
+        return track
+
+
+class IoUTracker:
+    """
+    Associates per-frame detections into tracks, ByteTrack style.
+
+    Detections are matched greedily by IoU against each track's predicted
+    box, high confidence detections first so weak boxes only pick up the
+    tracks the strong ones left over. A track is confirmed, and counted,
+    once it was matched ``min_hits`` times and ends after ``max_age``
+    processed frames without a match. Unconfirmed tracks are dropped, which
+    also filters out one-frame false positives.
+
+    ``max_age`` and ``min_hits`` count processed frames. TRACKER_MAX_AGE and
+    TRACKER_MIN_HITS are given in video frames, so ``for_sampler()`` scales
+    them down by the frames each processed frame stands for.
+    """
+
+    def __init__(self, next_id=1, iou_threshold=None, max_age=None, min_hits=None, high_confidence=None):
+        self.next_id = next_id
+        self.iou_threshold = iou_threshold or getattr(settings, 'TRACKER_IOU_THRESHOLD', 0.3)
+        self.max_age = max_age or getattr(settings, 'TRACKER_MAX_AGE', 30)
+        self.min_hits = min_hits or getattr(settings, 'TRACKER_MIN_HITS', 3)
+        self.high_confidence = high_confidence or getattr(settings, 'TRACKER_HIGH_CONFIDENCE', 0.5)
+        self.trajectory_interval = getattr(settings, 'TRACKER_TRAJECTORY_INTERVAL', 15)
+        self.trajectory_points = getattr(settings, 'TRACKER_TRAJECTORY_POINTS', 64)
+        self.tracks = []
+
+    @classmethod
+    def for_sampler(cls, sampler, next_id=1):
+        """A tracker for a video sampled by a FrameSampler, with the same wall-clock thresholds at any stride."""
+        max_age = getattr(settings, 'TRACKER_MAX_AGE', 30)
+        min_hits = getattr(settings, 'TRACKER_MIN_HITS', 3)
+        scale = sampler.scale
+        return cls(
+            next_id=next_id,
+            max_age=max(1, round(max_age / scale)),
+            # Still two sightings when sampling sparsely, so one-frame false
+            # positives stay filtered out
+            min_hits=max(min(min_hits, 2), math.ceil(min_hits / scale)),
+        )
+
+    def _match(self, tracks, detections, frame_number):
+        """Greedy IoU matching of same-type tracks and detections, best pairs first."""
+        pairs = []
+        if tracks and detections:
+            predicted = np.array([track.predict(frame_number) for track in tracks], dtype=np.float32)
+            for d, detection in enumerate(detections):
+                ious = box_iou(np.asarray(detection['bbox'], dtype=np.float32), predicted)
+                for t, iou in enumerate(ious):
+                    if iou >= self.iou_threshold and tracks[t].vehicle_type == detection['type']:
+                        pairs.append((iou, t, d))
+
+        matches = []
+        used_tracks, used_detections = set(), set()
+        for _, t, d in sorted(pairs, reverse=True):
+            if t in used_tracks or d in used_detections:
+                continue
+            used_tracks.add(t)
+            used_detections.add(d)
+            matches.append((tracks[t], detections[d]))
+        unmatched_tracks = [track for t, track in enumerate(tracks) if t not in used_tracks]
+        unmatched_detections = [detection for d, detection in enumerate(detections) if d not in used_detections]
+        return matches, unmatched_tracks, unmatched_detections
+
+    def update(self, frame_number, detections):
+        """
+        Feed one processed frame's detections.
+
+        Returns ``(detections, confirmed, finished)``: the detections with a
+        ``track_id`` added, tracks confirmed on this frame and confirmed
+        tracks that ended.
+        """
+        high = [d for d in detections if d['confidence'] >= self.high_confidence]
+        low = [d for d in detections if d['confidence'] < self.high_confidence]
+
+        matches, remaining, unmatched_high = self._match(self.tracks, high, frame_number)
+        low_matches, remaining, unmatched_low = self._match(remaining, low, frame_number)
+
+        confirmed = []
+        tracked = []
+        for track, detection in matches + low_matches:
+            track.update(
+                detection['bbox'], detection['confidence'], frame_number,
+                self.trajectory_interval, self.trajectory_points
+            )
+            if track.hits == self.min_hits:
+                confirmed.append(track)
+            tracked.append(dict(detection, track_id=track.track_id))
+
+        for detection in unmatched_high + unmatched_low:
+            track = Track(self.next_id, detection['type'], detection['bbox'], detection['confidence'], frame_number)
+            self.next_id += 1
+            self.tracks.append(track)
+            if self.min_hits <= 1:
+                confirmed.append(track)
+            tracked.append(dict(detection, track_id=track.track_id))
+
+        finished = []
+        for track in remaining:
+            track.missed += 1
+            if track.missed > self.max_age:
+                self.tracks.remove(track)
+                if track.hits >= self.min_hits:
+                    finished.append(track)
+        return tracked, confirmed, finished
+
+    def flush(self):
+        """End every open track, returning the confirmed ones."""
+        finished = [track for track in self.tracks if track.hits >= self.min_hits]
+        self.tracks = []
+        return finished
+
+    def to_dict(self):
+        return {'next_id': self.next_id, 'tracks': [track.to_dict() for track in self.tracks]}
+
+    def restore(self, data):
+        """Continue from the state saved by to_dict()."""
+        self.next_id = data.get('next_id', self.next_id)
+        self.tracks = [Track.from_dict(track) for track in data.get('tracks', [])]
@@ -6,8 +6,16 @@ urlpatterns = [
     path('upload/', views.video_upload, name='video_upload'),
     path('live/', views.live_detection, name='live_detection'),
     path('live/feed/', views.live_feed, name='live_feed'),
+    path('live/feed/<str:camera>/', views.live_feed, name='live_camera_feed'),
+    path('live/stats/', views.live_stats, name='live_stats'),
+    path('live/cameras/', views.live_cameras, name='live_cameras'),
+    path('live/cameras/<str:camera>/', views.live_camera, name='live_camera'),
+    path('live/cameras/<str:camera>/history/', views.live_camera_history, name='live_camera_history'),
     path('analysis/<int:analysis_id>/results/', views.analysis_results, name='analysis_results'),
     path('analysis/<int:analysis_id>/processing/', views.processing, name='processing'),
     path('analysis/<int:analysis_id>/status/', views.analysis_status, name='analysis_status'),
+    path('analysis/<int:analysis_id>/cancel/', views.cancel_analysis, name='cancel_analysis'),
+    path('analysis/<int:analysis_id>/retry/', views.retry_analysis, name='retry_analysis'),
+    path('queue/status/', views.queue_status, name='queue_status'),
 
 ]
\ No newline at end of file
@@ -1,304 +1,219 @@
-import cv2
-import numpy as np
 from django.shortcuts import render, redirect, get_object_or_404
 from django.views.decorators import gzip
 from django.http import StreamingHttpResponse, JsonResponse
 from django.views.decorators.http import require_http_methods
-from .models import VideoAnalysis, VehicleCount, DetectionZone
-from ultralytics import YOLO
-from pathlib import Path
-import threading
-import queue
+from django.views.decorators.csrf import ensure_csrf_cookie
+from functools import wraps
+from urllib.parse import urlparse
+from .models import VideoAnalysis, VehicleCount, LiveTrafficRollup
+from . import jobs
+from .backends import BACKENDS, MODEL_SIZES, default_options, model_path
+from .jobs import queue_stats, should_shed_load
+import os
 import time
-import plotly.express as px
-import plotly.graph_objects as go
-import pandas as pd
 from django.conf import settings
-import os
+from django.core.exceptions import ImproperlyConfigured
 import json
-from tqdm import tqdm
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
-import base64
-
-# Initialize YOLO model
-model = YOLO('yolov8n.pt')
-
-class VideoProcessor:
-    def __init__(self):
-        self.model = model
-        self.classes = ['person', 'bicycle', 'car', 'motorcycle', 'airplane', 'bus', 'train', 'truck']
-        self.processing_queue = queue.Queue()
-        self.thread = threading.Thread(target=self._process_queue, daemon=True)
-        self.active_analyses = {}
-        self.thread.start()
 
-    def _process_queue(self):
-        while True:
-            if not self.processing_queue.empty():
-                analysis_id = self.processing_queue.get()
-                try:
-                    self._process_video(analysis_id)
-                except Exception as e:
-                    self._handle_processing_error(analysis_id, str(e))
-                finally:
-                    if analysis_id in self.active_analyses:
-                        del self.active_analyses[analysis_id]
-                self.processing_queue.task_done()
-            time.sleep(1)
+# OpenCV, torch and ultralytics are only imported once a view needs them
+# (see camera.py and model_registry.py), so loading the URLconf stays fast
+# for management commands and admin-only processes.
 
-    def _handle_processing_error(self, analysis_id, error_message):
-        try:
-            analysis = VideoAnalysis.objects.get(id=analysis_id)
-            analysis.status = 'failed'
-            analysis.error_message = f"Processing failed: {error_message}"
-            analysis.save()
-            
-            # Notify frontend about the error
-            channel_layer = get_channel_layer()
-            async_to_sync(channel_layer.group_send)(
-                f'video_{analysis_id}',
-                {
-                    'type': 'processing_error',
-                    'message': error_message
-                }
-            )
-        except VideoAnalysis.DoesNotExist:
-            print(f"Error: Analysis {analysis_id} not found")
-        except Exception as e:
-            print(f"Error handling processing error: {str(e)}")
-
-    def _process_video(self, analysis_id):
-        analysis = VideoAnalysis.objects.get(id=analysis_id)
-        channel_layer = get_channel_layer()
-        
-        try:
-            if analysis.status != 'processing':
-                analysis.status = 'processing'
-                analysis.save()
-                
-            video_path = analysis.video.path
-            cap = cv2.VideoCapture(video_path)
-            
-            if not cap.isOpened():
-                raise Exception("Could not open video file")
-                
-            total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-            fps = cap.get(cv2.CAP_PROP_FPS)
-            frame_count = 0
-            start_time = time.time()
-            vehicle_counts = {'bicycle': 0, 'car': 0, 'truck': 0, 'bus': 0, 'motorcycle': 0}
-            
-            # Create detection zones if not exist
-            if not DetectionZone.objects.filter(analysis=analysis).exists():
-                DetectionZone.objects.create(
-                    analysis=analysis,
-                    name='Full Frame',
-                    coordinates=json.dumps([[0, 0], [1, 0], [1, 1], [0, 1]])
-                )
-            
-            while cap.isOpened():
-                ret, frame = cap.read()
-                if not ret:
-                    break
-                    
-                frame_count += 1
-                
-                # Process every frame for bicycles
-                # Enhance frame for better detection
-                frame = cv2.convertScaleAbs(frame, alpha=1.3, beta=10)  # Increased contrast and brightness
-                
-                # First pass: detect only bicycles with very low threshold
-                bicycle_results = self.model(frame, 
-                                          classes=[1],  # bicycle only
-                                          conf=0.2,    # Very low confidence threshold for bicycles
-                                          iou=0.3)     # Lower IOU threshold
-                
-                # Second pass: detect other vehicles with normal threshold
-                other_results = self.model(frame, 
-                                         classes=[2, 3, 5, 7],  # car, motorcycle, bus, truck
-                                         conf=0.5,    # Normal confidence for other vehicles
-                                         iou=0.45)
-                
-                # Combine results
-                detections = []
-                
-                # Process bicycle detections first
-                for r in bicycle_results:
-                    boxes = r.boxes
-                    for box in boxes:
-                        x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                        conf = float(box.conf[0].cpu().numpy())
-                        cls = int(box.cls[0].cpu().numpy())
-                        
-                        # Calculate relative size of detection
-                        box_size = (x2 - x1) * (y2 - y1) / (frame.shape[0] * frame.shape[1])
-                        
-                        # Debug logging for bicycle detections
-                        print(f"Frame {frame_count}: Bicycle detected - Confidence: {conf:.2f}, Size: {box_size:.6f}")
-                        
-                        if conf > 0.2:  # Very low threshold for bicycles
-                            vehicle_type = 'bicycle'
-                            vehicle_counts[vehicle_type] = vehicle_counts.get(vehicle_type, 0) + 1
-                            detections.append({
-                                'type': vehicle_type,
-                                'confidence': conf,
-                                'bbox': [int(x1), int(y1), int(x2), int(y2)]
-                            })
-                
-                # Process other vehicle detections
-                for r in other_results:
-                    boxes = r.boxes
-                    for box in boxes:
-                        x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                        conf = float(box.conf[0].cpu().numpy())
-                        cls = int(box.cls[0].cpu().numpy())
-                        
-                        if conf > 0.5:  # Normal threshold for other vehicles
-                            vehicle_type = self.get_vehicle_type(cls)
-                            if vehicle_type:
-                                vehicle_counts[vehicle_type] = vehicle_counts.get(vehicle_type, 0) + 1
-                                detections.append({
-                                    'type': vehicle_type,
-                                    'confidence': conf,
-                                    'bbox': [int(x1), int(y1), int(x2), int(y2)]
-                                })
-                
-                # Calculate current FPS
-                elapsed_time = time.time() - start_time
-                current_fps = frame_count / elapsed_time if elapsed_time > 0 else 0
-                
-                # Calculate progress
-                progress = frame_count / total_frames
-                
-                # Send update through WebSocket
-                async_to_sync(channel_layer.group_send)(
-                    f'video_{analysis_id}',
-                    {
-                        'type': 'processing_update',
-                        'progress': progress,
-                        'fps': current_fps,
-                        'counts': vehicle_counts,
-                        'detections': detections
-                    }
-                )
-                
-                # Update progress in database
-                analysis.processing_progress = progress
-                analysis.save(update_fields=['processing_progress'])
-                
-                # Save detection to database
-                for detection in detections:
-                    VehicleCount.objects.create(
-                        analysis=analysis,
-                        frame_number=frame_count,
-                        vehicle_type=detection['type'],
-                        confidence=detection['confidence'],
-                        bbox_x1=detection['bbox'][0],
-                        bbox_y1=detection['bbox'][1],
-                        bbox_x2=detection['bbox'][2],
-                        bbox_y2=detection['bbox'][3],
-                        timestamp=frame_count / fps
-                    )
-            
-            cap.release()
-            
-            # Update analysis status
-            analysis.status = 'completed'
-            analysis.processed = True
-            analysis.save()
-            
-            # Send completion message
-            async_to_sync(channel_layer.group_send)(
-                f'video_{analysis_id}',
-                {
-                    'type': 'processing_complete',
-                    'results_url': f'/analysis/{analysis_id}/results/'
-                }
-            )
-            
-        except Exception as e:
-            analysis.status = 'failed'
-            analysis.error_message = str(e)
-            analysis.save()
-            
-            async_to_sync(channel_layer.group_send)(
-                f'video_{analysis_id}',
-                {
-                    'type': 'processing_error',
-                    'message': str(e)
-                }
-            )
-            raise
-    
-    def get_vehicle_type(self, class_id):
-        class_map = {
-            1: 'bicycle',
-            2: 'car',
-            3: 'motorcycle',
-            5: 'bus',
-            7: 'truck'
-        }
-        return class_map.get(class_id)
-    
-    def queue_video(self, analysis_id):
-        self.processing_queue.put(analysis_id)
+# Videos are processed by `manage.py run_video_workers`; the views only add
+# jobs to the queue. VIDEO_WORKERS_IN_PROCESS runs the pool inside the web
+# process instead, which suits a single-process development server.
+_video_processor = None
 
-video_processor = VideoProcessor()
 
-class VideoCamera:
-    def __init__(self):
-        self.video = cv2.VideoCapture(0)
-        self.model = model
-        self.classes = ['person', 'bicycle', 'car', 'motorcycle', 'airplane', 'bus', 'train', 'truck']
-        
-    def __del__(self):
-        if self.video and self.video.isOpened():
-            self.video.release()
-        cv2.destroyAllWindows()
+def _in_process_pool():
+    global _video_processor
+    if not getattr(settings, 'VIDEO_WORKERS_IN_PROCESS', False):
+        return None
+    if _video_processor is None:
+        from .workers import VideoProcessingPool
+        _video_processor = VideoProcessingPool()
+    return _video_processor
 
-    def get_frame(self):
-        success, frame = self.video.read()
-        if not success:
-            return None
-        
-        results = self.model(frame)
-        
-        # Draw detection boxes
-        for r in results:
-            boxes = r.boxes
-            for box in boxes:
-                cls = int(box.cls[0])
-                conf = float(box.conf[0])
-                if conf > 0.3 and self.classes[cls] in ['car', 'truck', 'bus', 'motorcycle', 'bicycle']:
-                    x1, y1, x2, y2 = map(int, box.xyxy[0])
-                    cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                    cv2.putText(frame, f'{self.classes[cls]} {conf:.2f}',
-                              (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
-        
-        ret, jpeg = cv2.imencode('.jpg', frame)
-        return jpeg.tobytes()
 
-def gen(camera):
-    while True:
-        frame = camera.get_frame()
-        if frame is not None:
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n\r\n')
+def _queue_video(analysis, priority=None):
+    pool = _in_process_pool()
+    if pool is not None:
+        return pool.queue_video(analysis, priority)
+    return jobs.enqueue_analysis(analysis, priority)
 
 @gzip.gzip_page
-def live_feed(request):
+def live_feed(request, camera='default'):
     try:
-        return StreamingHttpResponse(gen(VideoCamera()),
+        from .camera import gen, get_manager
+        # Every viewer of a camera shares its capture, inference and JPEG
+        return StreamingHttpResponse(gen(get_manager().get(camera)),
                                    content_type='multipart/x-mixed-replace; boundary=frame')
     except Exception as e:
         print(e)
         return None
 
+def live_stats(request):
+    # Latency, fps and counts of each live camera, e.g. for monitoring
+    from .camera import get_manager
+    return JsonResponse({'streams': get_manager().stats()})
+
+def _staff_required(view):
+    """Like login_required plus is_staff, but answers API clients with JSON instead of a redirect."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({'error': 'Authentication required'}, status=401)
+        if not request.user.is_staff:
+            return JsonResponse({'error': 'Staff access required'}, status=403)
+        return view(request, *args, **kwargs)
+    return wrapper
+
+def _camera_source(source):
+    """
+    A camera source from the API: a device index from LIVE_CAMERA_DEVICES or
+    a URL with a scheme from LIVE_CAMERA_SOURCE_SCHEMES. Anything else, e.g.
+    a file path, raises ValueError; files can only be set in LIVE_CAMERAS.
+    """
+    # Device indexes come in as numbers or digit strings
+    if isinstance(source, str) and source.isdigit():
+        source = int(source)
+    if isinstance(source, int) and not isinstance(source, bool):
+        if source not in getattr(settings, 'LIVE_CAMERA_DEVICES', (0,)):
+            raise ValueError(f'device {source} is not in LIVE_CAMERA_DEVICES')
+        return source
+    if not isinstance(source, str):
+        raise ValueError('source must be a device index or a URL')
+    url = urlparse(source)
+    schemes = getattr(settings, 'LIVE_CAMERA_SOURCE_SCHEMES', ('rtsp', 'rtsps', 'http', 'https'))
+    if url.scheme.lower() not in schemes or not url.hostname:
+        raise ValueError(f"source must be a URL with one of the schemes {', '.join(schemes)}")
+    hosts = getattr(settings, 'LIVE_CAMERA_ALLOWED_HOSTS', None)
+    if hosts is not None and url.hostname.lower() not in hosts:
+        raise ValueError(f"host '{url.hostname}' is not in LIVE_CAMERA_ALLOWED_HOSTS")
+    return source
+
+@require_http_methods(["GET", "POST"])
+@ensure_csrf_cookie
+@_staff_required
+def live_cameras(request):
+    """
+    List the live cameras, or register one from a JSON body. Staff only; a
+    POST needs the csrftoken cookie, set by the GET, in an X-CSRFToken header.
+    """
+    from .camera import get_manager
+
+    manager = get_manager()
+    if request.method == 'GET':
+        return JsonResponse({'cameras': [stream.describe() for stream in manager.all()]})
+
+    try:
+        data = json.loads(request.body)
+        source = _camera_source(data['source'])
+        target_fps = float(data['target_fps']) if data.get('target_fps') else None
+        stream = manager.register(data.get('name'), source, target_fps)
+    except (ValueError, KeyError, TypeError) as e:
+        return JsonResponse({'error': f'Invalid camera: {e}'}, status=400)
+    except ImproperlyConfigured as e:
+        return JsonResponse({'error': str(e)}, status=409)
+    return JsonResponse(stream.describe(), status=201)
+
+@require_http_methods(["DELETE"])
+@_staff_required
+def live_camera(request, camera):
+    from .camera import get_manager
+
+    try:
+        get_manager().unregister(camera)
+    except KeyError:
+        return JsonResponse({'error': 'Unknown camera'}, status=404)
+    return JsonResponse({'status': 'removed'})
+
+@require_http_methods(["GET"])
+def live_camera_history(request, camera):
+    """Per-minute traffic of a live camera over the last ?minutes= (60 by default)."""
+    from datetime import timedelta
+    from django.utils import timezone
+
+    try:
+        minutes = min(int(request.GET.get('minutes', 60)), 7 * 24 * 60)
+    except ValueError:
+        return JsonResponse({'error': 'minutes must be a number'}, status=400)
+    rollups = LiveTrafficRollup.objects.filter(
+        camera=camera, bucket_start__gte=timezone.now() - timedelta(minutes=minutes)
+    ).order_by('bucket_start')
+    return JsonResponse({
+        'camera': camera,
+        'buckets': [{
+            'start': rollup.bucket_start.isoformat(),
+            'frames': rollup.frames,
+            'counts': {
+                'bicycle': rollup.bicycle_count,
+                'car': rollup.car_count,
+                'truck': rollup.truck_count,
+                'bus': rollup.bus_count,
+                'motorcycle': rollup.motorcycle_count,
+            },
+            'total_vehicles': rollup.total_vehicles(),
+            'avg_occupancy': rollup.avg_occupancy,
+            'max_occupancy': rollup.max_occupancy,
+            'congestion_ratio': rollup.congestion_ratio,
+        } for rollup in rollups]
+    })
+
 def home(request):
     recent_analyses = VideoAnalysis.objects.order_by('-timestamp')[:5]
     return render(request, 'traffic_analyzer/home.html', {'recent_analyses': recent_analyses})
 
+def _sampling_options(data):
+    """Frame stride and sample fps from the upload form, falling back to the settings defaults."""
+    try:
+        frame_stride = max(1, int(data.get('frame_stride') or getattr(settings, 'VIDEO_DEFAULT_FRAME_STRIDE', 1)))
+    except ValueError:
+        frame_stride = 1
+    try:
+        sample_fps = float(data.get('sample_fps') or getattr(settings, 'VIDEO_DEFAULT_SAMPLE_FPS', None) or 0) or None
+    except ValueError:
+        sample_fps = None
+    if sample_fps is not None and sample_fps <= 0:
+        sample_fps = None
+    return frame_stride, sample_fps
+
+def _inference_options(data):
+    """Backend, model size and image size from the upload form; blank means the settings defaults."""
+    backend = data.get('inference_backend', '')
+    model_size = data.get('model_size', '')
+    try:
+        imgsz = int(data.get('imgsz') or 0) or None
+    except ValueError:
+        imgsz = None
+    if imgsz is not None:
+        # The network downsamples by 32
+        imgsz = max(32, imgsz // 32 * 32)
+    return (
+        backend if backend in BACKENDS else '',
+        model_size if model_size in MODEL_SIZES else '',
+        imgsz
+    )
+
+def _missing_export_error(backend, model_size, imgsz):
+    """
+    The form error for an ONNX / OpenVINO choice whose export doesn't exist
+    under INFERENCE_EXPORT_DIR, or None. Checked at upload time so the user
+    isn't left with a job that fails in the worker.
+    """
+    options = default_options()
+    backend = backend or options['backend']
+    if backend == 'pytorch':
+        return None
+    path = model_path(backend, model_size or None, imgsz)
+    if os.path.exists(path):
+        return None
+    command = (f"python manage.py export_model --backend {backend} "
+               f"--size {model_size or options['model_size']} --imgsz {imgsz or options['imgsz']}")
+    if options['int8']:
+        command += ' --int8'
+    return f"No exported {backend} model for these settings. Create it with '{command}' or choose PyTorch."
+
 def video_upload(request):
     if request.method == 'POST' and request.FILES.get('video'):
         video_file = request.FILES['video']
@@ -309,10 +224,31 @@ def video_upload(request):
                 'error': 'Video file size must be less than 1.5GB'
             })
         
+        # Shed load when the processing backlog is too deep
+        if should_shed_load():
+            return render(request, 'traffic_analyzer/video_upload.html', {
+                'error': 'The processing queue is full. Please try again in a few minutes.'
+            }, status=503)
+        
+        frame_stride, sample_fps = _sampling_options(request.POST)
+        inference_backend, model_size, imgsz = _inference_options(request.POST)
+        error = _missing_export_error(inference_backend, model_size, imgsz)
+        if error:
+            return render(request, 'traffic_analyzer/video_upload.html', {'error': error}, status=400)
         analysis = VideoAnalysis.objects.create(
             video=video_file,
-            status='pending'
+            status='pending',
+            frame_stride=frame_stride,
+            sample_fps=sample_fps,
+            inference_backend=inference_backend,
+            model_size=model_size,
+            imgsz=imgsz
         )
+        try:
+            priority = int(request.POST.get('priority', ''))
+        except ValueError:
+            priority = None
+        _queue_video(analysis, priority)
         return redirect('processing', analysis_id=analysis.id)
     return render(request, 'traffic_analyzer/video_upload.html')
 
@@ -327,17 +263,15 @@ def processing(request, analysis_id):
             'error': 'No video file found for this analysis.'
         }, status=400)
     
-    # Queue the video for processing if not already processing
-    if analysis.status == 'pending':
-        analysis.status = 'processing'
-        analysis.save()
-        video_processor.queue_video(analysis_id)
-    elif analysis.status == 'failed':
+    # Queue the video for processing if not already processing. A cancelled
+    # analysis stays cancelled until it is retried through retry_analysis
+    if analysis.status in ('pending', 'failed'):
         # If previous attempt failed, retry
-        analysis.status = 'processing'
-        analysis.error_message = None
-        analysis.save()
-        video_processor.queue_video(analysis_id)
+        _queue_video(analysis)
+        analysis.refresh_from_db()
+    elif _in_process_pool() is not None:
+        # Make sure workers are running to pick up jobs left from a restart
+        _in_process_pool().start()
     
     context = {
         'analysis_id': analysis_id,
@@ -346,6 +280,7 @@ def processing(request, analysis_id):
         'upload_time': analysis.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
         'status': analysis.status,
         'error_message': analysis.error_message if analysis.status == 'failed' else None,
+        'queue': queue_stats(),
     }
     
     return render(request, 'traffic_analyzer/processing.html', context)
@@ -407,7 +342,7 @@ def analysis_results(request, analysis_id):
     detection_data = []
     for detection in detections:
         detection_data.append({
-            'timestamp': detection.frame_number / 30.0,  # Assuming 30 fps
+            'timestamp': detection.video_time if detection.video_time is not None else analysis.get_video_time(detection.frame_number),
             'vehicle_type': detection.vehicle_type,
             'confidence': detection.confidence,
             'bbox_x1': detection.bbox_x1,
@@ -418,10 +353,8 @@ def analysis_results(request, analysis_id):
     
     # Calculate vehicle type distribution
     vehicle_types = ['bicycle', 'car', 'truck', 'bus', 'motorcycle']
-    vehicle_counts = [
-        detections.filter(vehicle_type=vtype).count()
-        for vtype in vehicle_types
-    ]
+    # Each row is one tracked vehicle
+    vehicle_counts = [detections.filter(vehicle_type=vtype).count() for vtype in vehicle_types]
     
     # Calculate peak hours (only if we have detections)
     total_duration = max(d['timestamp'] for d in detection_data) if detection_data else 0
@@ -550,4 +483,29 @@ def analysis_status(request, analysis_id):
     except VideoAnalysis.DoesNotExist:
         return JsonResponse({'error': 'Analysis not found'}, status=404)
     except Exception as e:
-        return JsonResponse({'error': str(e)}, status=500)
\ No newline at end of file
+        return JsonResponse({'error': str(e)}, status=500)
+
+@require_http_methods(["POST"])
+def cancel_analysis(request, analysis_id):
+    """Cancel queued or running processing of an analysis."""
+    analysis = get_object_or_404(VideoAnalysis, id=analysis_id)
+    cancelled = jobs.cancel_analysis(analysis)
+    if not cancelled:
+        return JsonResponse({'error': 'Analysis is not queued or processing'}, status=409)
+    return JsonResponse({'status': 'cancelled', 'jobs_cancelled': cancelled})
+
+@require_http_methods(["POST"])
+def retry_analysis(request, analysis_id):
+    """Queue a cancelled or failed analysis for processing again."""
+    analysis = get_object_or_404(VideoAnalysis, id=analysis_id)
+    if analysis.status not in ('cancelled', 'failed'):
+        return JsonResponse({'error': 'Only cancelled or failed analyses can be retried'}, status=409)
+    job = _queue_video(analysis)
+    return JsonResponse({'status': 'queued', 'job_id': job.id})
+
+@require_http_methods(["GET"])
+def queue_status(request):
+    """Processing backlog depth and wait times."""
+    stats = queue_stats()
+    stats['shedding_load'] = should_shed_load(stats)
+    return JsonResponse(stats)
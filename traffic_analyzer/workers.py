@@ -0,0 +1,159 @@
+import logging
+import multiprocessing
+import os
+import queue
+import socket
+import threading
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+def _configure_worker_threads(num_threads):
+    """Pin intra-op threads so N workers don't oversubscribe the cores."""
+    import cv2
+    import torch
+    torch.set_num_threads(num_threads)
+    cv2.setNumThreads(num_threads)
+
+
+def _run_job(processor, job, worker_id):
+    from .jobs import JobHeartbeat, finish_job
+
+    with JobHeartbeat(job, worker_id) as lease:
+        status = processor.run_job(job, cancel_event=lease.cancelled)
+    finish_job(job.id, worker_id, status)
+    return status
+
+
+def _worker_main(wakeups, event_queue, num_threads):
+    """Entry point of a worker process: load the model once, then process jobs."""
+    # Spawned workers start with a fresh interpreter, so Django has to be set
+    # up before anything touching models is imported
+    import django
+    django.setup()
+
+    from .jobs import claim_next_job, recover_expired_leases
+    from .model_registry import get_model
+    from .processing import VideoProcessor
+
+    _configure_worker_threads(num_threads)
+    # Already loaded when the pool preloaded it before forking
+    model = get_model()
+    processor = VideoProcessor(model, notify=lambda group, message: event_queue.put((group, message)))
+    worker_id = f'{socket.gethostname()}:{os.getpid()}'
+    # Jobs queued by this pool are announced on the wakeup queue; jobs queued
+    # by the web processes are only in the database, so the queue is polled
+    poll_interval = getattr(settings, 'VIDEO_WORKER_POLL_SECONDS', 2)
+
+    while True:
+        try:
+            if wakeups.get(timeout=poll_interval) is None:
+                break
+        except queue.Empty:
+            pass
+
+        try:
+            recover_expired_leases()
+            job = claim_next_job(worker_id)
+            while job is not None:
+                if _run_job(processor, job, worker_id) == 'split':
+                    # Wake the other workers so the chunks run in parallel
+                    for _ in range(job.chunks.filter(status='queued').count()):
+                        wakeups.put(True)
+                job = claim_next_job(worker_id)
+        except Exception:
+            logger.exception("Error in video worker %s", worker_id)
+        finally:
+            connections.close_all()
+
+
+class VideoProcessingPool:
+    """
+    Pool of worker processes, each with its own instance of the model. With
+    the fork start method the model is loaded before forking so the workers
+    share its weights copy-on-write.
+
+    Jobs live in the ProcessingJob table; idle workers poll it, and jobs queued
+    through this pool also send a wakeup so they are claimed immediately. Workers are started on first use so
+    that management commands and migrations don't spawn them, and look for
+    jobs left over from a previous run as soon as they start. Progress events from the workers are
+    relayed to the channel layer by a thread in this process, so the
+    in-memory channel layer keeps working when the pool runs inside the web
+    process.
+    """
+
+    def __init__(self, processes=None, threads_per_worker=None):
+        cpu_count = os.cpu_count() or 1
+        self.processes = max(1, processes or getattr(settings, 'VIDEO_WORKER_PROCESSES', None) or 1)
+        self.threads_per_worker = max(1, (
+            threads_per_worker
+            or getattr(settings, 'VIDEO_WORKER_THREADS', None)
+            or cpu_count // self.processes
+        ))
+        default_method = 'fork' if os.name == 'posix' else 'spawn'
+        self.context = multiprocessing.get_context(getattr(settings, 'VIDEO_WORKER_START_METHOD', default_method))
+        self.wakeups = None
+        self.event_queue = None
+        self.workers = []
+        self.relay_thread = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        with self.lock:
+            if self.workers:
+                return
+            if self.context.get_start_method() == 'fork':
+                if getattr(settings, 'MODEL_PRELOAD', True):
+                    # Load the weights once here; forked children share
+                    # them copy-on-write instead of each loading a copy
+                    from .model_registry import preload
+                    preload()
+                # Forked children must not share this process's DB connections
+                connections.close_all()
+            self.wakeups = self.context.Queue()
+            self.event_queue = self.context.Queue()
+            for i in range(self.processes):
+                worker = self.context.Process(
+                    target=_worker_main,
+                    args=(self.wakeups, self.event_queue, self.threads_per_worker),
+                    name=f'video-worker-{i}',
+                    daemon=True
+                )
+                worker.start()
+                self.workers.append(worker)
+                # Check for jobs queued before this process started
+                self.wakeups.put(True)
+            self.relay_thread = threading.Thread(target=self._relay_events, name='video-worker-events', daemon=True)
+            self.relay_thread.start()
+
+    def _relay_events(self):
+        from .processing import send_to_group
+        while True:
+            group, message = self.event_queue.get()
+            try:
+                send_to_group(group, message)
+            except Exception:
+                logger.exception("Error relaying processing event to %s", group)
+
+    def queue_video(self, analysis, priority=None):
+        from .jobs import enqueue_analysis
+
+        job = enqueue_analysis(analysis, priority)
+        self.start()
+        self.wakeups.put(True)
+        return job
+
+    def join(self):
+        for worker in self.workers:
+            worker.join()
+
+    def shutdown(self):
+        with self.lock:
+            for _ in self.workers:
+                self.wakeups.put(None)
+            for worker in self.workers:
+                worker.join()
+            self.workers = []
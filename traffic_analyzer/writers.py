@@ -0,0 +1,66 @@
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import VehicleCount
+
+
+class DetectionWriter:
+    """
+    Buffers VehicleCount rows and writes them with bulk_create.
+
+    The buffer is flushed inside a single transaction once it holds
+    ``batch_size`` rows or ``flush_interval`` milliseconds have passed since
+    the last flush, and always on ``close()``, which callers run in a
+    ``finally`` so rows of frames already processed survive an error.
+    """
+
+    def __init__(self, analysis_id, batch_size=None, flush_interval=None):
+        self.analysis_id = analysis_id
+        self.batch_size = batch_size or getattr(settings, 'DETECTION_WRITER_BATCH_SIZE', 500)
+        self.flush_interval = (flush_interval or getattr(settings, 'DETECTION_WRITER_FLUSH_INTERVAL', 1000)) / 1000
+        self.buffer = []
+        self.rows_written = 0
+        self.last_flush = time.monotonic()
+        self.lock = threading.Lock()
+
+    def add_track(self, track, video_time=None):
+        """Queue one row summarizing a finished tracking.Track."""
+        x1, y1, x2, y2 = track.best_bbox
+        row = VehicleCount(
+            analysis_id=self.analysis_id,
+            frame_number=track.first_frame,
+            last_frame=track.last_frame,
+            track_id=track.track_id,
+            hits=track.hits,
+            vehicle_type=track.vehicle_type,
+            confidence=track.confidence,
+            bbox_x1=x1,
+            bbox_y1=y1,
+            bbox_x2=x2,
+            bbox_y2=y2,
+            video_time=video_time
+        )
+        row.set_trajectory(track.trajectory)
+        with self.lock:
+            self.buffer.append(row)
+        self.flush_if_due()
+
+    def flush_if_due(self):
+        if len(self.buffer) >= self.batch_size or time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            rows, self.buffer = self.buffer, []
+            self.last_flush = time.monotonic()
+            if not rows:
+                return
+            with transaction.atomic():
+                VehicleCount.objects.bulk_create(rows, batch_size=self.batch_size)
+            self.rows_written += len(rows)
+
+    def close(self):
+        self.flush()
@@ -1,6 +1,8 @@
 from django.urls import path
-from traffic_analyzer.consumers import VideoProcessingConsumer
+from traffic_analyzer.consumers import LiveDetectionConsumer, VideoProcessingConsumer
 
 websocket_urlpatterns = [
     path('ws/processing/<str:analysis_id>/', VideoProcessingConsumer.as_asgi()),
+    path('ws/live_detection/', LiveDetectionConsumer.as_asgi()),
+    path('ws/live_detection/<str:camera>/', LiveDetectionConsumer.as_asgi()),
 ]
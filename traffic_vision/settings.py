@@ -90,9 +90,22 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Seconds a connection waits for another one's write lock. This
+            # is the only busy timeout; don't also set PRAGMA busy_timeout,
+            # which would silently replace it.
+            'timeout': 20,
+        },
     }
 }
 
+# Applied to every new SQLite connection (see traffic_analyzer/db.py). WAL
+# mode keeps results queries working while a video is being written.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -139,6 +152,24 @@ STATICFILES_DIRS = [
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Processing status lines (chunking, resuming, ROI cropping) are logged by
+# the traffic_analyzer loggers at INFO
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'traffic_analyzer': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+    },
+}
+
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
@@ -146,4 +177,178 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 # File Upload Settings
 DATA_UPLOAD_MAX_MEMORY_SIZE = 1572864000  # 1.5GB in bytes
 FILE_UPLOAD_MAX_MEMORY_SIZE = 1572864000  # 1.5GB in bytes
-MAX_UPLOAD_SIZE = 1572864000  # 1.5GB in bytes
\ No newline at end of file
+MAX_UPLOAD_SIZE = 1572864000  # 1.5GB in bytes
+
+# Vehicle detection
+# Uploaded videos run a single inference pass at the lowest confidence below,
+# then filter each class with its own confidence and NMS IoU threshold.
+DETECTION_CLASS_THRESHOLDS = {
+    'bicycle': {'conf': 0.2, 'iou': 0.3},
+    'car': {'conf': 0.5, 'iou': 0.45},
+    'motorcycle': {'conf': 0.5, 'iou': 0.45},
+    'bus': {'conf': 0.5, 'iou': 0.45},
+    'truck': {'conf': 0.5, 'iou': 0.45},
+}
+
+# Number of decoded frames passed to the model in one inference call when
+# processing uploaded videos. 8-16 gives the best throughput on CPU workers.
+VIDEO_INFERENCE_BATCH_SIZE = 8
+
+# Maximum number of batches waiting between pipeline stages (decode ->
+# inference -> persist). Only detections are queued after inference, so at
+# most about (VIDEO_PIPELINE_QUEUE_SIZE + 2) * VIDEO_INFERENCE_BATCH_SIZE
+# decoded frames are held in memory however long the video is.
+VIDEO_PIPELINE_QUEUE_SIZE = 4
+
+# Detection rows are buffered and bulk inserted every
+# DETECTION_WRITER_BATCH_SIZE rows or DETECTION_WRITER_FLUSH_INTERVAL ms
+DETECTION_WRITER_BATCH_SIZE = 500
+DETECTION_WRITER_FLUSH_INTERVAL = 1000
+
+# Inference runtime: 'pytorch', or a model exported with
+# `manage.py export_model` to 'onnx' or 'openvino'. The model size picks the
+# YOLOv8 weights (n, s, m, l, x); INFERENCE_INT8 selects the quantized export.
+INFERENCE_BACKEND = 'pytorch'
+INFERENCE_MODEL_SIZE = 'n'
+INFERENCE_IMGSZ = 640
+INFERENCE_INT8 = False
+INFERENCE_EXPORT_DIR = BASE_DIR / 'exported_models'
+
+# Uploaded videos are processed by a pool of worker processes, each with its
+# own copy of the model. VIDEO_WORKER_THREADS pins torch / OpenCV intra-op
+# threads per worker; None splits the CPU cores evenly between the workers.
+# Forked workers share the preloaded model copy-on-write; use 'spawn' when
+# the model runs on CUDA, which can't be used from forked children.
+VIDEO_WORKER_PROCESSES = 2
+VIDEO_WORKER_THREADS = None
+VIDEO_WORKER_START_METHOD = 'fork' if os.name == 'posix' else 'spawn'
+# Workers run in `manage.py run_video_workers` and poll the job queue every
+# VIDEO_WORKER_POLL_SECONDS. VIDEO_WORKERS_IN_PROCESS starts the pool inside
+# the web process instead (single-process development servers only); with
+# separate workers, progress events need a cross-process CHANNEL_LAYERS
+# backend such as Redis.
+VIDEO_WORKER_POLL_SECONDS = 2
+VIDEO_WORKERS_IN_PROCESS = False
+
+# Processing jobs are stored in the database. Workers hold a lease on the job
+# they are processing and renew it every third of VIDEO_JOB_LEASE_SECONDS; a
+# job whose lease expires is requeued, up to VIDEO_JOB_MAX_ATTEMPTS times.
+VIDEO_JOB_LEASE_SECONDS = 60
+VIDEO_JOB_MAX_ATTEMPTS = 3
+VIDEO_JOB_DEFAULT_PRIORITY = 0
+
+# Uploads are rejected with 503 while the backlog is deeper than this many
+# queued jobs or the oldest queued job has waited this many seconds
+VIDEO_QUEUE_MAX_DEPTH = 50
+VIDEO_QUEUE_MAX_WAIT = 3600
+
+# Processing state is checkpointed every VIDEO_CHECKPOINT_INTERVAL frames
+# so a retried or recovered job continues from there instead of frame 0
+VIDEO_CHECKPOINT_INTERVAL = 300
+
+# Split videos longer than VIDEO_CHUNKING_MIN_FRAMES into keyframe-aligned
+# frame ranges that are processed in parallel by the worker pool.
+# VIDEO_CHUNK_COUNT defaults to the number of worker processes.
+VIDEO_CHUNKING = True
+VIDEO_CHUNKING_MIN_FRAMES = 9000
+VIDEO_CHUNK_COUNT = None
+
+# Default frame sampling for uploads that don't choose one. Skipped frames
+# are grabbed without being decoded. Counts are unique tracks, so they are
+# not scaled; the tracker thresholds are scaled to the sampling instead.
+VIDEO_DEFAULT_FRAME_STRIDE = 1
+VIDEO_DEFAULT_SAMPLE_FPS = None
+
+# Skip inference on frames that barely differ from the last inferred frame
+# and reuse its detections. MOTION_THRESHOLD is the fraction of pixels that
+# must change; the model still runs at least every MOTION_MAX_SKIP frames.
+MOTION_GATING = True
+MOTION_THRESHOLD = 0.002
+MOTION_PIXEL_THRESHOLD = 25
+MOTION_DOWNSCALE_WIDTH = 160
+MOTION_MAX_SKIP = 150
+
+# Run inference only on the bounding box of an analysis's detection zones
+ROI_CROPPING = True
+ROI_PADDING = 0.02
+
+# Vehicle tracking. A vehicle is counted once its track was matched
+# TRACKER_MIN_HITS times and is stored as one row when the track ends,
+# TRACKER_MAX_AGE frames after it was last matched. Both are in video frames;
+# with frame sampling they are divided by the stride.
+TRACKER_IOU_THRESHOLD = 0.3
+TRACKER_MAX_AGE = 30
+TRACKER_MIN_HITS = 3
+TRACKER_HIGH_CONFIDENCE = 0.5
+TRACKER_TRAJECTORY_INTERVAL = 15
+TRACKER_TRAJECTORY_POINTS = 64
+
+# Processing progress is pushed to WebSocket clients at most
+# PROGRESS_UPDATE_RATE times a second and saved every PROGRESS_SAVE_INTERVAL seconds.
+# Detections are sent as changes, with the full set every
+# DETECTIONS_KEYFRAME_INTERVAL seconds.
+PROGRESS_UPDATE_RATE = 2
+PROGRESS_SAVE_INTERVAL = 5
+DETECTIONS_KEYFRAME_INTERVAL = 5
+
+# Frame reading, inference and encoding for WebSocket previews run on a
+# shared pool of threads, round-robin over the connections, one task per
+# connection at a time and at most CONSUMER_MAX_PENDING queued per connection
+CONSUMER_EXECUTOR_THREADS = 2
+CONSUMER_MAX_PENDING = 2
+
+# Preview frames are sent as binary JPEG messages, keeping only the latest
+# frame per viewer. Viewers ack each frame; at most STREAM_MAX_UNACKED are
+# sent without an ack, and one not acked within STREAM_ACK_TIMEOUT seconds
+# is given up on. JPEG quality, then scale, is lowered while a viewer falls
+# behind and raised again after STREAM_RECOVER_FRAMES frames with headroom.
+STREAM_JPEG_QUALITY = 80
+STREAM_MIN_JPEG_QUALITY = 40
+STREAM_MIN_SCALE = 0.5
+STREAM_RECOVER_FRAMES = 30
+STREAM_MAX_UNACKED = 2
+STREAM_ACK_TIMEOUT = 2.0
+
+# Live cameras, by name. A camera is captured while it has viewers, shared by
+# its MJPEG feed and WebSocket clients, which get statistics LIVE_STATS_RATE
+# times a second. The source is a device index, a file or a stream URL; a
+# file with 'loop' replays forever. One inference loop serves every camera,
+# batching up to LIVE_MAX_BATCH frames, each camera at most at its target fps.
+LIVE_CAMERAS = {
+    'default': {'source': 0},
+}
+LIVE_TARGET_FPS = 15
+LIVE_MAX_BATCH = 16
+LIVE_ENCODER_THREADS = 2
+LIVE_STATS_RATE = 2
+
+# Cameras registered at runtime through /live/cameras/ (staff only) may only
+# use these device indexes or URLs with these schemes, never a file path. Set
+# LIVE_CAMERA_ALLOWED_HOSTS to a list of host names to restrict the URLs too.
+LIVE_CAMERA_DEVICES = (0,)
+LIVE_CAMERA_SOURCE_SCHEMES = ('rtsp', 'rtsps', 'http', 'https')
+LIVE_CAMERA_ALLOWED_HOSTS = None
+
+# Live detections are aggregated per camera and minute (vehicles by type,
+# occupancy, congestion) and the finished minutes are bulk written to
+# LiveTrafficRollup every LIVE_ROLLUP_FLUSH_INTERVAL seconds
+LIVE_ROLLUPS = True
+LIVE_ROLLUP_FLUSH_INTERVAL = 60
+
+# Live streams and previews keep to a real-time budget: their target fps with
+# at most QOS_LATENCY_BUDGET_MS from capture to encoded frame. Over budget, a
+# stream steps down to a cheaper operating point (JPEG quality, inference
+# size, frame stride); after QOS_RECOVER_WINDOWS windows of QOS_WINDOW
+# seconds with headroom it steps back up.
+QOS_ENABLED = True
+QOS_LATENCY_BUDGET_MS = 200
+QOS_IMGSZ_LEVELS = (640, 480, 320)
+QOS_MAX_STRIDE = 3
+QOS_JPEG_QUALITIES = (80, 60, 40)
+QOS_WINDOW = 2.0
+QOS_RECOVER_WINDOWS = 3
+
+# Models are loaded once per process on first use and warmed up with a
+# dummy inference. With the fork start method they are preloaded before
+# the workers are forked.
+MODEL_PRELOAD = True